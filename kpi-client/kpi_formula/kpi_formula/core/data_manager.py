@@ -1,7 +1,12 @@
+import gzip
+import io
+import json
 import pandas as pd
 import numpy as np
 from typing import List, Dict, Union, Any, Optional
 from pathlib import Path
+from urllib.parse import urlencode, urlparse
+from urllib.request import Request, urlopen
 import sqlalchemy
 
 class DataManager:
@@ -73,6 +78,59 @@ class DataManager:
             
         self.load_from_query(query, name)
 
+    def load_from_url(self,
+                      url: str,
+                      name: str,
+                      format: str = 'arrow',
+                      params: Optional[Dict] = None,
+                      timeout: float = 60.0) -> None:
+        """
+        Load data from a KPI server endpoint such as /api/kpis
+
+        Args:
+            url: Endpoint URL, e.g. "http://localhost:8000/api/kpis?table=kpis"
+            name: Dataset name
+            format: Response format to request ('arrow', 'parquet', 'csv', 'json')
+            params: Extra query parameters, e.g. {'columns': 'Latency', 'filter': 'Latency>30'}
+        """
+        if format not in ('arrow', 'parquet', 'csv', 'json'):
+            raise ValueError(f"Unsupported load format: {format}")
+
+        query = dict(params or {})
+        query['format'] = format
+        separator = '&' if urlparse(url).query else '?'
+        request = Request(
+            url + separator + urlencode(query, doseq=True),
+            headers={'Accept-Encoding': 'gzip'},
+        )
+
+        try:
+            with urlopen(request, timeout=timeout) as response:
+                body = response.read()
+                if response.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+
+            if format == 'arrow':
+                import pyarrow as pa
+                df = pa.ipc.open_stream(body).read_pandas()
+            elif format == 'parquet':
+                df = pd.read_parquet(io.BytesIO(body))
+            elif format == 'csv':
+                df = pd.read_csv(io.BytesIO(body))
+            else:
+                content = json.loads(body)
+                if isinstance(content, dict) and 'columns' in content:
+                    df = pd.DataFrame(dict(zip(content['headers'], content['columns'])))
+                else:
+                    df = pd.DataFrame(content['rows'] if isinstance(content, dict) else content)
+
+            self.dataframes[name] = df
+            print(f"Successfully loaded dataset '{name}' from {url}")
+            print(f"Columns: {df.columns.tolist()}")
+            print(f"Rows: {len(df)}")
+        except Exception as e:
+            raise ImportError(f"Failed to load data from URL: {str(e)}")
+
     def save_to_database(self,
                         data_name: str,
                         table_name: str,
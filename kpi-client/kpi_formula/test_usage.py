@@ -2,6 +2,7 @@ from kpi_formula.advanced.data_processor import DataProcessor
 from kpi_formula.advanced.data_validator import DataValidator
 from kpi_formula.advanced.kpi_calculator import KPICalculator
 from kpi_formula.advanced.time_series import TimeSeriesAnalyzer
+from kpi_formula.core.data_manager import DataManager
 
 def test_all_features():
     print("\n=== Testing All Features ===\n")
@@ -59,5 +60,44 @@ def test_all_features():
     except ValueError as e:
         print("- Seasonality Analysis:", str(e))
 
+def test_load_from_url():
+    import io
+    import threading
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.parse import parse_qs, urlparse
+
+    import pyarrow as pa
+
+    table = pa.table({"Application_Type": ["Gaming", "Streaming"], "Latency": [30, 25]})
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(parse_qs(urlparse(self.path).query))
+            body = sink.getvalue()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/vnd.apache.arrow.stream")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        manager = DataManager()
+        url = f"http://127.0.0.1:{server.server_port}/api/kpis?table=kpis"
+        manager.load_from_url(url, "kpis", params={"columns": "Application_Type,Latency"})
+    finally:
+        server.shutdown()
+
+    assert requests == [{"table": ["kpis"], "columns": ["Application_Type,Latency"], "format": ["arrow"]}]
+    assert manager.dataframes["kpis"].to_dict("list") == table.to_pydict()
+
 if __name__ == "__main__":
     test_all_features()
\ No newline at end of file
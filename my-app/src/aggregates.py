@@ -0,0 +1,167 @@
+import re
+import sqlite3
+
+from fastapi import HTTPException
+
+from column_types import TIMESTAMP, declared_to_type
+from query_builder import quote_identifier
+
+MAX_GROUP_BY = 8
+MAX_AGGREGATES = 32
+
+# Aggregate name -> SQL template for the column
+SQL_AGGREGATES = {
+    "sum": "SUM({col})",
+    "mean": "AVG({col})",
+    "avg": "AVG({col})",
+    "min": "MIN({col})",
+    "max": "MAX({col})",
+    "count": "COUNT({col})",
+    "count_distinct": "COUNT(DISTINCT {col})",
+}
+PERCENTILE_PATTERN = re.compile(r"p(\d{1,2}(?:\.\d+)?|100)")
+
+# Time bucket -> strftime format truncating an ISO-8601 TIMESTAMP to it
+BUCKETS = {
+    "minute": "%Y-%m-%d %H:%M:00",
+    "hour": "%Y-%m-%d %H:00:00",
+    "day": "%Y-%m-%d",
+    "month": "%Y-%m",
+}
+
+
+class Percentile:
+    """
+    Python fallback for SQLite's ``percentile(Y, P)`` aggregate.
+
+    Matches the behaviour of the SQLite extension: NULLs are ignored, P is
+    between 0 and 100, and the result interpolates linearly between the two
+    nearest ranks. Values that are not numbers are skipped.
+    """
+
+    def __init__(self):
+        self.values = []
+        self.p = None
+
+    def step(self, value, p):
+        self.p = p
+        if value is None:
+            return
+        try:
+            self.values.append(float(value))
+        except (TypeError, ValueError):
+            pass
+
+    def finalize(self):
+        if not self.values:
+            return None
+        self.values.sort()
+        rank = (len(self.values) - 1) * self.p / 100.0
+        lower = int(rank)
+        upper = min(lower + 1, len(self.values) - 1)
+        return self.values[lower] + (self.values[upper] - self.values[lower]) * (rank - lower)
+
+
+def register_functions(conn):
+    """Register Python fallbacks for aggregates this SQLite build lacks."""
+    try:
+        conn.execute("SELECT percentile(1, 50)").fetchone()
+    except sqlite3.OperationalError:
+        conn.create_aggregate("percentile", 2, Percentile)
+
+
+def parse_group_by(group_by, available):
+    if not group_by:
+        return []
+    columns = [name.strip() for name in group_by.split(",") if name.strip()]
+    if len(columns) > MAX_GROUP_BY:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_GROUP_BY} group_by columns are allowed")
+    unknown = [name for name in columns if name not in available]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown group_by columns: {', '.join(unknown)}")
+    return columns
+
+
+def bucket_group(column, interval):
+    """``(alias, sql)`` grouping a TIMESTAMP column by ``interval``."""
+    return f"{column}_{interval}", f"strftime('{BUCKETS[interval]}', {quote_identifier(column)})"
+
+
+def parse_bucket(bucket, available):
+    """
+    Parse ``column:interval`` (e.g. ``Timestamp:hour``) into ``(alias, sql)``.
+
+    The column must be a TIMESTAMP column; the group is named
+    ``<column>_<interval>`` in results.
+    """
+    if not bucket:
+        return None
+    column, _, interval = bucket.partition(":")
+    column, interval = column.strip(), interval.strip().lower()
+    if column not in available:
+        raise HTTPException(status_code=400, detail=f"Unknown bucket column '{column}'")
+    if declared_to_type(available[column]) != TIMESTAMP:
+        raise HTTPException(status_code=400, detail=f"Bucket column '{column}' is not a TIMESTAMP column")
+    if interval not in BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Unknown bucket interval '{interval}'")
+    return bucket_group(column, interval)
+
+
+def split_aggregate(spec):
+    """Split ``name:column`` into a lower-case name and a column ("" for a bare count)."""
+    name, _, column = spec.partition(":")
+    return name.strip().lower(), column.strip()
+
+
+def parse_aggregate(spec, available):
+    """
+    Parse ``name:column`` into ``(alias, sql)``.
+
+    ``name`` is one of sum, mean/avg, min, max, count, count_distinct, median
+    or a percentile written ``p95``, ``p99.9`` etc. A bare ``count`` counts rows.
+    """
+    name, column = split_aggregate(spec)
+    if name == "count" and not column:
+        return "count", "COUNT(*)"
+    if column not in available:
+        raise HTTPException(status_code=400, detail=f"Unknown aggregate column in '{spec}'")
+
+    col = quote_identifier(column)
+    alias = f"{name}_{column}"
+    if name in SQL_AGGREGATES:
+        return alias, SQL_AGGREGATES[name].format(col=col)
+    if name == "median":
+        return alias, f"percentile({col}, 50)"
+    match = PERCENTILE_PATTERN.fullmatch(name)
+    if match:
+        return alias, f"percentile({col}, {float(match.group(1))})"
+    raise HTTPException(status_code=400, detail=f"Unknown aggregate '{name}'")
+
+
+def build_aggregate_query(table, group_by, aggregates, clauses=(), params=(), bucket=None):
+    """
+    Build a GROUP BY query returning one row per group.
+
+    Args:
+        group_by: Validated group columns (may be empty for a single total row)
+        aggregates: ``(alias, sql)`` pairs from parse_aggregate()
+        bucket: Optional ``(alias, sql)`` time bucket from parse_bucket(),
+            grouped after the columns
+    """
+    if not aggregates:
+        raise HTTPException(status_code=400, detail="At least one aggregate is required")
+    if len(aggregates) > MAX_AGGREGATES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_AGGREGATES} aggregates are allowed")
+
+    groups = [quote_identifier(name) for name in group_by]
+    select = list(groups)
+    if bucket is not None:
+        select.append(f"{bucket[1]} AS {quote_identifier(bucket[0])}")
+        groups.append(quote_identifier(bucket[0]))
+    select += [f"{sql} AS {quote_identifier(alias)}" for alias, sql in aggregates]
+    sql = f"SELECT {', '.join(select)} FROM {quote_identifier(table)}"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    if groups:
+        sql += f" GROUP BY {', '.join(groups)} ORDER BY {', '.join(groups)}"
+    return sql, list(params)
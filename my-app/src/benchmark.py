@@ -0,0 +1,293 @@
+"""
+In-process load test for the KPI backend.
+
+Seeds a SQLite database, then drives the ASGI app directly through
+httpx.ASGITransport (no sockets, no server process) with a concurrent mix
+of read_kpis, import_kpis and list_tables requests, and reports p50/p95/p99
+latency and requests/sec per workload.
+
+    python benchmark.py --rows 100000 --concurrency 16 --requests 2000 --save baseline.json
+    python benchmark.py --rows 100000 --concurrency 16 --requests 2000 --compare baseline.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import httpx
+
+import main
+
+APPLICATION_TYPES = ["Streaming", "Gaming", "Browsing", "Video_Call", "IoT_Temperature", "Web_Browsing"]
+DEFAULT_MIX = "read_kpis=8,list_tables=1,import_kpis=1"
+SEED_CHUNK = 10000
+
+
+def seed_database(db_path, rows, seed=0):
+    """Create a ``kpis`` table with ``rows`` synthetic rows, replacing any existing one."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("DROP TABLE IF EXISTS kpis")
+        conn.execute("""
+        CREATE TABLE kpis (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            Timestamp TIMESTAMP,
+            User_ID INTEGER,
+            Application_Type TEXT,
+            Signal_Strength INTEGER,
+            Latency INTEGER,
+            Required_Bandwidth REAL,
+            Allocated_Bandwidth REAL,
+            Resource_Allocation INTEGER
+        )
+        """)
+        insert = (
+            "INSERT INTO kpis (Timestamp, User_ID, Application_Type, Signal_Strength, Latency, "
+            "Required_Bandwidth, Allocated_Bandwidth, Resource_Allocation) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+        )
+        for start in range(0, rows, SEED_CHUNK):
+            conn.executemany(insert, [synthetic_row(rng, i) for i in range(start, min(start + SEED_CHUNK, rows))])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def synthetic_row(rng, i):
+    required = round(rng.uniform(0.1, 20), 2)
+    return (
+        f"2024-09-{1 + (i // 86400) % 28:02d} {(i // 3600) % 24:02d}:{(i // 60) % 60:02d}:{i % 60:02d}",
+        1000 + i % 5000,
+        rng.choice(APPLICATION_TYPES),
+        rng.randint(-110, -40),
+        rng.randint(1, 200),
+        required,
+        round(required * rng.uniform(0.5, 1.0), 2),
+        rng.randint(50, 100),
+    )
+
+
+def synthetic_records(rng, count):
+    columns = ["Timestamp", "User_ID", "Application_Type", "Signal_Strength", "Latency",
+               "Required_Bandwidth", "Allocated_Bandwidth", "Resource_Allocation"]
+    return [dict(zip(columns, synthetic_row(rng, rng.randrange(10 ** 6)))) for _ in range(count)]
+
+
+def parse_mix(mix):
+    """Parse ``name=weight,...`` into ``{name: weight}``."""
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in WORKLOADS:
+            raise ValueError(f"Unknown workload '{name}' (expected one of {', '.join(WORKLOADS)})")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, round(p / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies, errors, elapsed):
+    ordered = sorted(latencies)
+    to_ms = lambda seconds: None if seconds is None else round(seconds * 1000, 3)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / elapsed, 1) if elapsed > 0 else None,
+        "mean_ms": to_ms(sum(ordered) / len(ordered)) if ordered else None,
+        "p50_ms": to_ms(percentile(ordered, 50)),
+        "p95_ms": to_ms(percentile(ordered, 95)),
+        "p99_ms": to_ms(percentile(ordered, 99)),
+        "max_ms": to_ms(ordered[-1]) if ordered else None,
+    }
+
+
+async def read_kpis(client, rng, options):
+    params = {"table": "kpis", "limit": options["page_size"]}
+    if rng.random() < 0.5:
+        params["filter"] = f"Application_Type={rng.choice(APPLICATION_TYPES)}"
+    return await client.get("/api/kpis", params=params)
+
+
+async def list_tables(client, rng, options):
+    return await client.get("/api/tables")
+
+
+async def import_kpis(client, rng, options):
+    return await client.post("/api/import_kpis", json={
+        "data": synthetic_records(rng, options["import_rows"]),
+        "table_name": "bench_import",
+    })
+
+
+WORKLOADS = {
+    "read_kpis": read_kpis,
+    "list_tables": list_tables,
+    "import_kpis": import_kpis,
+}
+
+
+async def run_benchmark(db_path, requests=1000, concurrency=8, mix=DEFAULT_MIX,
+                        page_size=1000, import_rows=500, seed=0):
+    """
+    Run ``requests`` requests from ``concurrency`` concurrent clients against the app.
+
+    The app's lifespan (connection pool, executor, job queue) is started
+    against ``db_path`` for the duration of the run.
+
+    Returns:
+        Report dict with the configuration, overall and per-workload results
+    """
+    weights = parse_mix(mix)
+    names, cumulative = list(weights), []
+    total_weight = 0.0
+    for name in names:
+        total_weight += weights[name]
+        cumulative.append(total_weight)
+    options = {"page_size": page_size, "import_rows": import_rows}
+
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    remaining = requests
+
+    async def client_loop(client, rng):
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            pick = rng.random() * total_weight
+            name = next(name for name, bound in zip(names, cumulative) if pick < bound)
+            start = time.perf_counter()
+            try:
+                response = await WORKLOADS[name](client, rng, options)
+                failed = response.status_code >= 400
+            except Exception:
+                failed = True
+            elapsed = time.perf_counter() - start
+            if failed:
+                errors[name] += 1
+            else:
+                latencies[name].append(elapsed)
+
+    main.DB_PATH = db_path
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            start = time.perf_counter()
+            await asyncio.gather(*[client_loop(client, random.Random(seed + i)) for i in range(concurrency)])
+            elapsed = time.perf_counter() - start
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "config": {
+            "requests": requests, "concurrency": concurrency, "mix": weights,
+            "page_size": page_size, "import_rows": import_rows, "seed": seed,
+            "pool_size": main.DB_POOL_SIZE, "read_workers": main.DB_READ_WORKERS,
+        },
+        "environment": {
+            "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "seconds": round(elapsed, 3),
+        "overall": summarize(all_latencies, sum(errors.values()), elapsed),
+        "workloads": {name: summarize(latencies[name], errors[name], elapsed) for name in names},
+    }
+
+
+def compare(report, baseline, tolerance=0.10):
+    """
+    Compare a report with a saved baseline.
+
+    Returns:
+        List of ``(workload, metric, baseline, current, change)`` for every
+        latency that grew, or throughput that fell, by more than ``tolerance``
+    """
+    regressions = []
+    for name, current in report["workloads"].items():
+        previous = baseline.get("workloads", {}).get(name)
+        if not previous:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            if previous.get(metric) and current.get(metric) is not None:
+                change = current[metric] / previous[metric] - 1
+                if change > tolerance:
+                    regressions.append((name, metric, previous[metric], current[metric], change))
+        if previous.get("rps") and current.get("rps") is not None:
+            change = current["rps"] / previous["rps"] - 1
+            if change < -tolerance:
+                regressions.append((name, "rps", previous["rps"], current["rps"], change))
+    return regressions
+
+
+def format_report(report):
+    lines = [f"{'workload':<14}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+    rows = list(report["workloads"].items()) + [("overall", report["overall"])]
+    for name, result in rows:
+        cells = [result[key] if result[key] is not None else "-" for key in ("rps", "p50_ms", "p95_ms", "p99_ms")]
+        lines.append(f"{name:<14}{result['requests']:>9}{result['errors']:>8}" + "".join(f"{cell:>10}" for cell in cells))
+    return "\n".join(lines)
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="In-process load test for the KPI backend")
+    parser.add_argument("--db", help="Database to benchmark; a seeded temporary one by default")
+    parser.add_argument("--rows", type=int, default=100000, help="Rows to seed into the kpis table")
+    parser.add_argument("--no-seed", action="store_true", help="Use --db as it is")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Workload weights (default {DEFAULT_MIX})")
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--import-rows", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="Write the JSON report to this file")
+    parser.add_argument("--compare", help="Baseline JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed regression (default 0.10)")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's per-request logging")
+    args = parser.parse_args(argv)
+    if args.no_seed and not args.db:
+        parser.error("--no-seed requires --db")
+
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        db_path = args.db or os.path.join(scratch, "bench.db")
+        if not args.no_seed:
+            start = time.perf_counter()
+            seed_database(db_path, args.rows, args.seed)
+            print(f"Seeded {args.rows} rows in {time.perf_counter() - start:.2f}s")
+        report = asyncio.run(run_benchmark(
+            db_path, args.requests, args.concurrency, args.mix, args.page_size, args.import_rows, args.seed,
+        ))
+    report["config"]["rows"] = args.rows
+
+    print(format_report(report))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved report to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for name, metric, before, after, change in regressions:
+            print(f"REGRESSION {name} {metric}: {before} -> {after} ({change:+.0%})")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
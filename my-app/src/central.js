@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import './KPIUploader.css';
 import KPIUploader from './sidebar';
 import { Line } from 'react-chartjs-2';
@@ -16,6 +16,7 @@ function App() {
     const [dataSource, setDataSource] = useState('csv');
     const [tableNames, setTableNames] = useState([]);
     const rowsPerPage = 10;
+    const PAGE_SIZE = 1000;
     const [joinedData, setJoinedData] = useState(null);
     const [commonColumns, setCommonColumns] = useState([]);
     const [currentData, setCurrentData] = useState([]);
@@ -30,6 +31,8 @@ function App() {
     const [secondTable, setSecondTable] = useState('');
     const [selectedCommonColumn, setSelectedCommonColumn] = useState('');
     const [chartData, setChartData] = useState({ labels: [], datasets: [] });
+    // Keyset paging of database tables by AlaSQL name: rows loaded so far and where the next page starts
+    const pagedTables = useRef({});
 
     const joinTypes = ['INNER JOIN', 'LEFT JOIN', 'RIGHT JOIN', 'FULL OUTER JOIN'];
 
@@ -50,6 +53,7 @@ function App() {
     // Function to handle table removal
     const handleRemoveTable = (tableName) => {
         setTableNames((prevTableNames) => prevTableNames.filter(name => name !== tableName));
+        delete pagedTables.current[tableName];
 
         setCurrentData([]);
         setColumnNames([]);
@@ -63,6 +67,10 @@ function App() {
             setIsJoinedData(tableName === "Joined_Data");
             setFileName(tableName);
             setCurrentPage(1);
+        } else if (pagedTables.current[tableName]) {
+            // Partly paged: show the rows loaded so far and keep paging from there
+            const paged = pagedTables.current[tableName];
+            handleFileUpload(paged.name, paged.rows, Object.keys(paged.rows[0] || {}), false);
         } else {
             fetchTableData(tableName);
         }
@@ -91,21 +99,31 @@ function App() {
         }
     };
 
-    // Fetch data from the selected table
+    const fetchPage = async (tableName, cursor) => {
+        const params = new URLSearchParams({ table: tableName, limit: PAGE_SIZE });
+        if (cursor) {
+            params.set('cursor', cursor);
+        }
+        const response = await fetch(`http://localhost:8001/api/kpis?${params}`);
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        return response.json();
+    };
+
+    const alaSQLName = (tableName) => tableName.replace(/[^a-zA-Z0-9_]/g, "_");
+
+    // Fetch the first keyset page of the selected table; later pages load as the table is paged through
     const fetchTableData = async (tableName) => {
         console.log(`Fetching data for table: ${tableName}`);
         try {
-            const response = await fetch(`http://localhost:8001/api/kpis?table=${tableName}`);
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-            const data = await response.json();
-            console.log('Fetched data:', data);
-            
-            // Use handleFileUpload to process the data as if it were a CSV
-            handleFileUpload(tableName, data, Object.keys(data[0]));
-            
-            setIsDataLoaded(true);
+            const page = await fetchPage(tableName, null);
+            pagedTables.current[alaSQLName(tableName)] = {
+                name: tableName, rows: page.rows, cursor: page.next_cursor, loading: null,
+            };
+            // The AlaSQL copy is created once every page has arrived (or a join needs it)
+            handleFileUpload(tableName, page.rows, Object.keys(page.rows[0] || {}), !page.next_cursor);
+            console.log(`Fetched first ${page.rows.length} rows`);
             console.log('State updated with new data');
         } catch (error) {
             console.error('Error fetching data from table:', error);
@@ -113,6 +131,47 @@ function App() {
         }
     };
 
+    // Append the next page of a paged table; concurrent callers share one request.
+    // Resolves to whether a page was appended.
+    const loadNextPage = (key) => {
+        const paged = pagedTables.current[key];
+        if (!paged || !paged.cursor) {
+            return Promise.resolve(false);
+        }
+        if (!paged.loading) {
+            paged.loading = fetchPage(paged.name, paged.cursor)
+                .then((page) => {
+                    const previous = paged.rows;
+                    paged.rows = previous.concat(page.rows);
+                    paged.cursor = page.next_cursor;
+                    // Only swap in the new rows if this table is still the one on screen
+                    setCurrentData((shown) => (shown === previous ? paged.rows : shown));
+                    setCsvData((shown) => (shown === previous ? paged.rows : shown));
+                    if (!page.next_cursor) {
+                        createAlaSQLTable(key, paged.rows);
+                    }
+                    return true;
+                })
+                .catch((error) => {
+                    console.error('Error fetching data from table:', error);
+                    alert('Error fetching data from table: ' + error.message);
+                    return false;
+                })
+                .finally(() => {
+                    paged.loading = null;
+                });
+        }
+        return paged.loading;
+    };
+
+    // Load every remaining page of any paged table, e.g. before it takes part in a join
+    const ensureTableLoaded = async (key) => {
+        const paged = pagedTables.current[key];
+        while (paged && paged.cursor && (await loadNextPage(key))) {
+            // keep appending until the last page
+        }
+    };
+
     // Use effect to fetch data from the selected table
     useEffect(() => {
         if (dataSource === 'db' && selectedTable) {
@@ -150,7 +209,7 @@ function App() {
     }, [dataSource]);
 
     // Modify handleFileUpload to accept data directly
-    const handleFileUpload = (uploadedFileName, data, columns = null) => {
+    const handleFileUpload = (uploadedFileName, data, columns = null, createTable = true) => {
         setFileUploaded(true);
         setFileName(uploadedFileName);
         setCsvData(data);
@@ -162,7 +221,9 @@ function App() {
 
         // Create a unique table name for the file
         const tableName = uploadedFileName.replace(/\.[^/.]+$/, "").replace(/[^a-zA-Z0-9_]/g, "_");
-        createAlaSQLTable(tableName, data);
+        if (createTable) {
+            createAlaSQLTable(tableName, data);
+        }
         handleTableCreated(tableName);
     };
 
@@ -251,6 +312,18 @@ function App() {
     // Add this function before the renderTable function
     const renderPagination = () => {
         const totalPages = Math.ceil(currentData.length / rowsPerPage);
+        // Rows past the loaded ones come from the server when the table is paged up to them
+        const key = alaSQLName(fileName);
+        const paged = pagedTables.current[key];
+        const hasMore = Boolean(paged && paged.cursor) && currentData === paged.rows;
+        const nextPage = async () => {
+            let rowCount = currentData.length;
+            if (currentPage >= totalPages && hasMore) {
+                await loadNextPage(key);
+                rowCount = paged.rows.length;
+            }
+            setCurrentPage(prev => Math.min(prev + 1, Math.ceil(rowCount / rowsPerPage)));
+        };
         return (
             <div className="pagination">
                 <button 
@@ -259,10 +332,10 @@ function App() {
                 >
                     Previous
                 </button>
-                <span>{`Page ${currentPage} of ${totalPages}`}</span>
+                <span>{`Page ${currentPage} of ${totalPages}${hasMore ? '+' : ''}`}</span>
                 <button 
-                    onClick={() => setCurrentPage(prev => Math.min(prev + 1, totalPages))}
-                    disabled={currentPage === totalPages}
+                    onClick={nextPage}
+                    disabled={currentPage === totalPages && !hasMore}
                 >
                     Next
                 </button>
@@ -321,6 +394,7 @@ function App() {
 
     const calculateCommonColumns = () => {
         if (!firstTable || !secondTable) return;
+        if (!alasql.tables[firstTable] || !alasql.tables[secondTable]) return;
 
         const firstTableColumns = alasql(`SHOW COLUMNS FROM [${firstTable}]`).map(col => col.columnid);
         const secondTableColumns = alasql(`SHOW COLUMNS FROM [${secondTable}]`).map(col => col.columnid);
@@ -331,7 +405,10 @@ function App() {
     };
 
     useEffect(() => {
-        calculateCommonColumns();
+        // A partly paged table is loaded in full before its columns are compared
+        Promise.all([ensureTableLoaded(firstTable), ensureTableLoaded(secondTable)])
+            .then(calculateCommonColumns)
+            .catch((error) => console.error('Error comparing table columns:', error));
     }, [firstTable, secondTable]);
 
     const handleJoinSubmit = () => {
@@ -0,0 +1,166 @@
+import re
+from datetime import datetime
+from functools import lru_cache
+
+INTEGER = "INTEGER"
+REAL = "REAL"
+TIMESTAMP = "TIMESTAMP"
+TEXT = "TEXT"
+
+# Widening order: a column only ever moves up this lattice
+#   INTEGER -> REAL -> TEXT
+#   TIMESTAMP ------> TEXT
+_JOINS = {
+    frozenset([INTEGER, REAL]): REAL,
+}
+
+SQLITE_INT_MIN = -(2 ** 63)
+SQLITE_INT_MAX = 2 ** 63 - 1
+
+INTEGER_PATTERN = re.compile(r"[+-]?\d+")
+ISO_TIMESTAMP_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}(?: \d{2}:\d{2}:\d{2})?")
+TIMESTAMP_FORMATS = (
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%dT%H:%M",
+    "%Y-%m-%d",
+    "%m/%d/%Y %H:%M",
+    "%m/%d/%Y %H:%M:%S",
+    "%m/%d/%Y",
+)
+
+
+def column_affinity(declared_type):
+    """Map a declared column type to its SQLite affinity (section 3.1 of the SQLite docs)."""
+    declared = (declared_type or "").upper()
+    if "INT" in declared:
+        return "INTEGER"
+    if any(word in declared for word in ("CHAR", "CLOB", "TEXT")):
+        return "TEXT"
+    if not declared or "BLOB" in declared:
+        return "BLOB"
+    if any(word in declared for word in ("REAL", "FLOA", "DOUB")):
+        return "REAL"
+    return "NUMERIC"
+
+
+def join_types(a, b):
+    """Return the narrowest type that can hold values of both ``a`` and ``b``."""
+    if a is None:
+        return b
+    if b is None or a == b:
+        return a
+    return _JOINS.get(frozenset([a, b]), TEXT)
+
+
+def declared_to_type(declared_type):
+    """Map a column's declared SQL type onto the inference lattice."""
+    declared = (declared_type or "").upper()
+    if declared in ("TIMESTAMP", "DATETIME", "DATE"):
+        return TIMESTAMP
+    affinity = column_affinity(declared)
+    if affinity == "INTEGER":
+        return INTEGER
+    if affinity in ("REAL", "NUMERIC"):
+        return REAL
+    return TEXT
+
+
+@lru_cache(maxsize=4096)
+def normalize_timestamp(value):
+    """
+    Convert a recognised date/time string to ISO-8601, or return None.
+
+    ISO strings sort and compare correctly as text, which is what makes
+    range filters on a TIMESTAMP column work.
+    """
+    if ISO_TIMESTAMP_PATTERN.fullmatch(value):
+        return value
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        if fmt.endswith("%Y") or fmt.endswith("%d"):
+            return parsed.strftime("%Y-%m-%d")
+        return parsed.strftime("%Y-%m-%d %H:%M:%S")
+    return None
+
+
+def value_type(value):
+    """Classify a single value; None and empty strings carry no type information."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (bool, int)):
+        return INTEGER if SQLITE_INT_MIN <= value <= SQLITE_INT_MAX else TEXT
+    if isinstance(value, float):
+        return REAL
+    if not isinstance(value, str):
+        return TEXT
+
+    text = value.strip()
+    if text.isdigit() or INTEGER_PATTERN.fullmatch(text):
+        # Keep identifiers such as "007" as text so the zeros survive
+        digits = text.lstrip("+-")
+        if len(digits) > 1 and digits.startswith("0"):
+            return TEXT
+        return INTEGER if SQLITE_INT_MIN <= int(text) <= SQLITE_INT_MAX else TEXT
+    try:
+        float(text)
+        return REAL
+    except ValueError:
+        pass
+    if normalize_timestamp(text) is not None:
+        return TIMESTAMP
+    return TEXT
+
+
+def infer_types(columns, rows, known=None):
+    """
+    Infer the narrowest type of each column from a sample of value tuples.
+
+    Each distinct value is classified once, and columns that ``known``
+    already maps to TEXT are skipped since they cannot widen any further.
+
+    Returns:
+        ``{column: type}``; a column with no non-empty values maps to None
+    """
+    types = {}
+    for index, column in enumerate(columns):
+        if known and known.get(column) == TEXT:
+            types[column] = TEXT
+            continue
+        inferred = None
+        for value in {row[index] for row in rows}:
+            inferred = join_types(inferred, value_type(value))
+            if inferred == TEXT:
+                break
+        types[column] = inferred
+    return types
+
+
+def coerce_rows(columns, rows, types):
+    """
+    Prepare value tuples for insertion into columns of the given types.
+
+    SQLite's column affinity already turns numeric strings into numbers, so
+    only timestamps need converting (to ISO-8601) and empty strings become
+    NULL in typed columns.
+    """
+    timestamp_columns = [i for i, column in enumerate(columns) if types.get(column) == TIMESTAMP]
+    typed_columns = [i for i, column in enumerate(columns) if types.get(column) not in (None, TEXT)]
+    if not typed_columns:
+        return rows
+
+    coerced = []
+    for row in rows:
+        row = list(row)
+        for i in typed_columns:
+            if row[i] == "":
+                row[i] = None
+        for i in timestamp_columns:
+            if isinstance(row[i], str):
+                row[i] = normalize_timestamp(row[i].strip())
+        coerced.append(row)
+    return coerced
@@ -0,0 +1,157 @@
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it only gzip is offered
+    brotli = None
+
+DEFAULT_MINIMUM_SIZE = 1024
+# Streams that must reach the client unbuffered, and formats that compress themselves
+UNCOMPRESSED_MEDIA_TYPES = ("text/event-stream", "application/vnd.apache.parquet")
+
+
+def parse_accept_encoding(header):
+    """Return ``{coding: q}`` for an Accept-Encoding header."""
+    accepted = {}
+    for part in (header or "").split(","):
+        coding, *params = [item.strip() for item in part.split(";")]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.lower()] = q
+    return accepted
+
+
+def negotiate_encoding(header):
+    """Pick ``"br"``, ``"gzip"`` or None for a request's Accept-Encoding."""
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0.0)
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best, best_q = None, 0.0
+    for coding in candidates:
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class GzipEncoder:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        # Sync-flush every chunk so streamed rows reach the client as they are produced
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with brotli or gzip, whichever the client prefers.
+
+    Works like Starlette's GZipMiddleware: bodies smaller than
+    ``minimum_size`` are sent as they are, single-message bodies are
+    compressed in one go and streamed bodies chunk by chunk. Brotli is only
+    offered when the ``brotli`` package is installed. Compression changes the
+    bytes on the wire, so a strong ETag on a compressed response is
+    downgraded to a weak one.
+
+    Args:
+        minimum_size: Smallest body, in bytes, worth compressing
+        gzip_level: zlib compression level
+        brotli_quality: Brotli quality; low values favour speed
+    """
+
+    def __init__(self, app, minimum_size=DEFAULT_MINIMUM_SIZE, gzip_level=6, brotli_quality=4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _encoder(self, coding):
+        if coding == "br":
+            return BrotliEncoder(self.brotli_quality)
+        return GzipEncoder(self.gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        coding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        encoder = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, encoder, passthrough
+            if message["type"] == "http.response.start":
+                # Hold the headers back until the first body message decides them
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                initial, start = start, None
+                headers = MutableHeaders(raw=initial["headers"])
+                media_type = headers.get("content-type", "").split(";")[0].strip()
+                passthrough = (
+                    "content-encoding" in headers
+                    or media_type in UNCOMPRESSED_MEDIA_TYPES
+                    or (not more_body and len(body) < self.minimum_size)
+                )
+                if not passthrough:
+                    encoder = self._encoder(coding)
+                    headers["Content-Encoding"] = coding
+                    headers.add_vary_header("Accept-Encoding")
+                    etag = headers.get("etag")
+                    if etag and not etag.startswith("W/"):
+                        headers["ETag"] = "W/" + etag
+                    if more_body:
+                        del headers["Content-Length"]
+                    else:
+                        body = encoder.compress(body) + encoder.finish()
+                        headers["Content-Length"] = str(len(body))
+                        await send(initial)
+                        await send({"type": "http.response.body", "body": body})
+                        return
+                await send(initial)
+
+            if passthrough:
+                await send(message)
+                return
+            body = encoder.compress(body)
+            if not more_body:
+                body += encoder.finish()
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,197 @@
+import codecs
+import csv
+import io
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import multipart
+    from multipart.multipart import parse_options_header
+except ImportError:  # pragma: no cover
+    multipart = None
+
+RECORD_BOUNDARY = re.compile(r'["\n]')
+MAX_FINISHED_IMPORTS = 100
+
+_imports = OrderedDict()
+_imports_lock = threading.Lock()
+
+
+class CsvStreamParser:
+    """
+    Incremental CSV parser for bytes that arrive in arbitrary pieces.
+
+    Only complete records are parsed; the tail after the last record
+    boundary is kept until more bytes arrive. A newline ends a record
+    only when it is outside quotes, i.e. after an even number of ``"``
+    characters, so quoted fields may contain newlines.
+    """
+
+    def __init__(self, encoding="utf-8-sig"):
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self._pending = ""
+
+    def _last_boundary(self, text):
+        quotes, boundary = 0, 0
+        for match in RECORD_BOUNDARY.finditer(text):
+            if match.group() == '"':
+                quotes += 1
+            elif quotes % 2 == 0:
+                boundary = match.end()
+        return boundary
+
+    def feed(self, data, final=False):
+        """Parse ``data`` and return the list of records it completed."""
+        text = self._pending + self._decoder.decode(data, final)
+        cut = len(text) if final else self._last_boundary(text)
+        complete, self._pending = text[:cut], text[cut:]
+        if not complete:
+            return []
+        return [row for row in csv.reader(io.StringIO(complete)) if row]
+
+    def close(self):
+        return self.feed(b"", final=True)
+
+
+class RowFeed:
+    """
+    Bounded hand-off of parsed rows from the event loop to the writer thread.
+
+    The producer blocks (in a worker thread) once ``max_chunks`` chunks are
+    waiting, which in turn stops reading the request body, so memory stays
+    bounded no matter how fast the client uploads. Iterating the feed
+    yields individual rows until finish() is called, and gives up with
+    TimeoutError if the producer goes quiet for ``idle_timeout`` seconds,
+    so a stalled upload cannot hold the write transaction forever.
+    """
+
+    _DONE = object()
+
+    def __init__(self, max_chunks=4, idle_timeout=60.0):
+        self._queue = queue.Queue(maxsize=max_chunks)
+        self._stopped = threading.Event()
+        self.idle_timeout = idle_timeout
+
+    def put(self, rows):
+        """Queue a chunk of rows; returns False if the consumer has stopped reading."""
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(rows, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def finish(self, error=None):
+        """Signal the end of the data, or make the consumer raise ``error``."""
+        return self.put(error if error is not None else self._DONE)
+
+    def __iter__(self):
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.idle_timeout)
+                except queue.Empty:
+                    raise TimeoutError(f"No CSV data received for {self.idle_timeout}s")
+                if item is self._DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield from item
+        finally:
+            self._stopped.set()
+
+
+class ImportProgress:
+    """Counters for one streaming import, readable while it is running."""
+
+    def __init__(self, import_id, table):
+        self.import_id = import_id
+        self.table = table
+        self.status = "running"
+        self.bytes_received = 0
+        self.rows_received = 0
+        self.rows_inserted = 0
+        self.error = None
+        self.started = time.monotonic()
+        self.finished = None
+
+    def to_dict(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return {
+            "import_id": self.import_id,
+            "table": self.table,
+            "status": self.status,
+            "bytes_received": self.bytes_received,
+            "rows_received": self.rows_received,
+            "rows_inserted": self.rows_inserted,
+            "seconds": round(elapsed, 3),
+            "error": self.error,
+        }
+
+    def on_chunk(self, inserted):
+        self.rows_inserted = inserted
+
+    def done(self, error=None):
+        self.status = "failed" if error else "completed"
+        self.error = error
+        self.finished = time.monotonic()
+
+
+def start_progress(import_id, table):
+    progress = ImportProgress(import_id, table)
+    with _imports_lock:
+        _imports[import_id] = progress
+        # Keep only the most recent imports around for polling
+        while len(_imports) > MAX_FINISHED_IMPORTS:
+            _imports.popitem(last=False)
+    return progress
+
+
+def get_progress(import_id):
+    with _imports_lock:
+        return _imports.get(import_id)
+
+
+async def multipart_file_chunks(request):
+    """
+    Yield the bytes of the first part of a multipart/form-data body as they arrive.
+
+    Unlike ``await request.form()``, nothing is spooled: each network chunk
+    is pushed through python-multipart's streaming parser and whatever part
+    data it produced is yielded right away.
+    """
+    if multipart is None:
+        raise RuntimeError("python-multipart must be installed to upload multipart CSV files")
+
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise ValueError("Missing boundary in multipart body")
+
+    parts = 0
+    data = []
+
+    def on_part_begin():
+        nonlocal parts
+        parts += 1
+
+    def on_part_data(buffer, start, end):
+        if parts == 1:
+            data.append(buffer[start:end])
+
+    parser = multipart.MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_part_data": on_part_data,
+    })
+    async for chunk in request.stream():
+        parser.write(chunk)
+        if data:
+            yield b"".join(data)
+            data.clear()
+    parser.finalize()
+    if data:
+        yield b"".join(data)
@@ -0,0 +1,115 @@
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import DB_QUEUE_SECONDS, DB_SECONDS, ROWS_RETURNED, timed
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseExecutor:
+    """
+    Runs blocking SQLite work on worker threads so the event loop stays free.
+
+    Reads go to a pool of ``read_workers`` threads; writes go to a single
+    dedicated thread. SQLite only allows one writer at a time anyway, so
+    serializing writes here avoids lock contention, and a long import can
+    never starve readers of threads. With WAL enabled, readers keep seeing
+    the last committed snapshot while a write is in progress.
+
+    Each call receives a pooled connection as its first argument. Because
+    the pool reuses a thread's connection, every worker thread effectively
+    keeps one warm connection. Streams hold their own connection for as
+    long as the client keeps reading, so they are capped separately.
+
+    Args:
+        pool: ConnectionPool that hands out connections
+        read_workers: Maximum number of concurrent read calls
+        max_streams: Maximum number of cursors streamed at the same time
+    """
+
+    def __init__(self, pool, read_workers=4, max_streams=2):
+        if read_workers < 1 or max_streams < 0:
+            raise ValueError(f"read_workers must be at least 1 and max_streams at least 0, got {read_workers} and {max_streams}")
+        if read_workers + 1 + max_streams > pool.size:
+            raise ValueError(
+                f"Pool size {pool.size} is too small for {read_workers} readers, "
+                f"a writer and {max_streams} streams"
+            )
+        self.pool = pool
+        self.read_workers = read_workers
+        self.max_streams = max_streams
+        self._stream_slots = asyncio.Semaphore(max_streams)
+        self._readers = ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix="db-read")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+
+    def _call(self, kind, submitted, fn, args, kwargs):
+        DB_QUEUE_SECONDS.labels(kind).observe(time.perf_counter() - submitted)
+        with timed(DB_SECONDS.labels(kind, getattr(fn, "__name__", "call"))):
+            with self.pool.connection() as conn:
+                return fn(conn, *args, **kwargs)
+
+    async def read(self, fn, *args, **kwargs):
+        """Run ``fn(conn, *args, **kwargs)`` on a reader thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._readers, functools.partial(self._call, "read", time.perf_counter(), fn, args, kwargs)
+        )
+
+    async def write(self, fn, *args, **kwargs):
+        """Run ``fn(conn, *args, **kwargs)`` on the writer thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._writer, functools.partial(self._call, "write", time.perf_counter(), fn, args, kwargs)
+        )
+
+    async def stream(self, fn, *args, batch_size=1000):
+        """
+        Stream the cursor returned by ``fn(conn, *args)`` in batches.
+
+        The first item yielded is the list of column names; every item after
+        that is a list of at most ``batch_size`` rows. Each batch is fetched
+        on a reader thread, so only one batch is in memory at a time and the
+        event loop is never blocked. The connection goes back to the pool
+        when the generator finishes or the client disconnects.
+        """
+        if self.max_streams == 0:
+            # Waiting on a zero-slot semaphore would hang the request forever
+            raise RuntimeError("This executor was created without stream slots (max_streams=0)")
+        loop = asyncio.get_running_loop()
+        async with self._stream_slots:
+            conn = await loop.run_in_executor(self._readers, self.pool.checkout)
+            cursor = None
+            rows = 0
+            try:
+                seconds = DB_SECONDS.labels("stream", getattr(fn, "__name__", "call"))
+                cursor = await loop.run_in_executor(
+                    self._readers, functools.partial(self._timed_call, seconds, fn, conn, *args)
+                )
+                yield [column[0] for column in cursor.description]
+                while True:
+                    batch = await loop.run_in_executor(
+                        self._readers, self._timed_call, seconds, cursor.fetchmany, batch_size
+                    )
+                    if not batch:
+                        break
+                    rows += len(batch)
+                    yield batch
+            finally:
+                ROWS_RETURNED.labels("stream").observe(rows)
+                # Closing the cursor ends the read snapshot held by a half-read query
+                if cursor is not None:
+                    cursor.close()
+                self.pool.checkin(conn)
+
+    @staticmethod
+    def _timed_call(histogram, fn, *args):
+        with timed(histogram):
+            return fn(*args)
+
+    def shutdown(self, wait=True):
+        self._readers.shutdown(wait=wait)
+        self._writer.shutdown(wait=wait)
+        logger.info("Database executor shut down")
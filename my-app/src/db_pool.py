@@ -0,0 +1,197 @@
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(sqlite3.OperationalError):
+    """Raised when no connection becomes available within the pool timeout."""
+
+
+class ConnectionPool:
+    """
+    A small, thread-safe pool of SQLite connections.
+
+    Connections are opened once (including the WAL pragma) and handed out
+    again on later requests. A thread that already holds a connection gets
+    the same one back on nested acquires, so helpers can open their own
+    ``with pool.connection()`` block without deadlocking the pool.
+
+    Args:
+        db_path: Path to the SQLite database file
+        size: Maximum number of open connections
+        timeout: Seconds to wait for a free connection before giving up
+        health_check_interval: Idle seconds after which a connection is
+            pinged with ``SELECT 1`` before being handed out again
+        on_connect: Optional callable run on every new connection, e.g. to
+            register user-defined SQL functions
+    """
+
+    def __init__(self, db_path, size=5, timeout=10.0, health_check_interval=30.0, on_connect=None):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.on_connect = on_connect
+
+        self._cond = threading.Condition()
+        self._idle = []          # stack of (connection, last_used) pairs
+        self._open = 0
+        self._closed = False
+        self._local = threading.local()
+        self._stats = {
+            "created": 0,
+            "reused": 0,
+            "discarded": 0,
+            "waits": 0,
+            "timeouts": 0,
+        }
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.row_factory = sqlite3.Row
+        if self.on_connect is not None:
+            self.on_connect(conn)
+        return conn
+
+    def _is_healthy(self, conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._cond:
+            self._open -= 1
+            self._stats["discarded"] += 1
+            self._cond.notify()
+
+    def checkout(self):
+        """
+        Take a connection out of the pool without tying it to this thread.
+
+        Use this for work that hops between threads, such as streaming a
+        cursor; hand the connection back with checkin().
+        """
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("Connection pool is closed")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    conn, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeoutError(
+                        f"Timed out after {self.timeout}s waiting for a database connection"
+                    )
+                self._stats["waits"] += 1
+                self._cond.wait(remaining)
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except sqlite3.Error:
+                with self._cond:
+                    self._open -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats["created"] += 1
+            return conn
+
+        # Only ping connections that have been sitting idle for a while
+        if time.monotonic() - last_used > self.health_check_interval and not self._is_healthy(conn):
+            logger.warning("Discarding unhealthy pooled connection")
+            self._discard(conn)
+            return self.checkout()
+
+        with self._cond:
+            self._stats["reused"] += 1
+        return conn
+
+    def acquire(self):
+        """Check out a connection, reusing the one this thread already holds."""
+        lease = getattr(self._local, "lease", None)
+        if lease is not None:
+            lease[1] += 1
+            return lease[0]
+        conn = self.checkout()
+        self._local.lease = [conn, 1]
+        return conn
+
+    def release(self, conn):
+        """Return a connection obtained from acquire()."""
+        lease = getattr(self._local, "lease", None)
+        if lease is None or lease[0] is not conn:
+            raise sqlite3.ProgrammingError("Connection was not acquired by this thread")
+        lease[1] -= 1
+        if lease[1] > 0:
+            return
+        self._local.lease = None
+        self.checkin(conn)
+
+    def checkin(self, conn):
+        """Return a connection obtained from checkout()."""
+        # Never hand a connection with an open transaction to the next caller
+        if conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                self._discard(conn)
+                return
+
+        with self._cond:
+            if self._closed:
+                self._open -= 1
+                conn.close()
+                return
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Close idle connections and refuse further checkouts."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            conn.close()
+        logger.info(f"Connection pool for '{self.db_path}' closed")
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self.size,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle),
+                "closed": self._closed,
+                **self._stats,
+            }
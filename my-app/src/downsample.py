@@ -0,0 +1,259 @@
+import math
+
+from fastapi import HTTPException
+
+from column_types import INTEGER, REAL, TIMESTAMP, column_affinity, declared_to_type, normalize_timestamp
+from query_builder import quote_identifier
+
+METHODS = ("lttb", "minmax")
+MIN_POINTS = 3
+MAX_POINTS = 10000
+# LTTB candidates per bucket are the min and max of this many equal slices
+SLICES = 4
+
+
+class Bucket:
+    """
+    Running state of one x-range bucket: the mean point for LTTB's next
+    bucket average, and the lowest and highest point of each of SLICES
+    equal slices of the bucket as LTTB candidates. Only those are kept,
+    never the bucket's rows.
+    """
+
+    __slots__ = ("start", "slice_width", "count", "sum_x", "sum_y", "extremes")
+
+    def __init__(self, start, width):
+        self.start = start
+        self.slice_width = width / SLICES
+        self.count = 0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.extremes = {}  # slice -> [lowest, highest]
+
+    def add(self, point):
+        self.count += 1
+        self.sum_x += point[0]
+        self.sum_y += point[2]
+        index = min(int((point[0] - self.start) / self.slice_width), SLICES - 1)
+        extremes = self.extremes.get(index)
+        if extremes is None:
+            self.extremes[index] = [point, point]
+        elif point[2] < extremes[0][2]:
+            extremes[0] = point
+        elif point[2] > extremes[1][2]:
+            extremes[1] = point
+
+    @property
+    def mean(self):
+        return self.sum_x / self.count, self.sum_y / self.count
+
+    @property
+    def low(self):
+        return min((low for low, _ in self.extremes.values()), key=lambda point: point[2])
+
+    @property
+    def high(self):
+        return max((high for _, high in self.extremes.values()), key=lambda point: point[2])
+
+    @property
+    def candidates(self):
+        return [point for extremes in self.extremes.values() for point in extremes]
+
+
+class Downsampler:
+    """
+    Reduce a series ordered by x to about ``points`` points in one pass.
+
+    Points are ``(x as a number, x as stored, y)``. The x range is split
+    into equal-width buckets; ``minmax`` keeps each bucket's lowest and
+    highest point, and ``lttb`` runs largest-triangle-three-buckets over a
+    min/max preselection of each bucket (MinMaxLTTB). The preselection
+    always keeps spikes and usually picks the point full LTTB would, while
+    only two buckets of state are ever held. Series no longer than
+    ``points`` are returned unchanged. Memory is O(points) whatever the
+    number of rows.
+    """
+
+    def __init__(self, points, method, x_min, x_max):
+        if method not in METHODS:
+            raise HTTPException(status_code=400, detail=f"Unknown downsampling method '{method}'")
+        self.points = points
+        self.method = method
+        self.x_min = x_min
+        # LTTB keeps the first and last points outside the buckets
+        self.buckets = max(1, points - 2) if method == "lttb" else max(1, points // 2)
+        self.width = (x_max - x_min) / self.buckets or 1.0
+        self.rows = 0
+        self.raw = []          # every point, until there are more than ``points``
+        self.first = None
+        self.last = None
+        self.selected = []
+        self.pending = None    # (index, Bucket) waiting for the next bucket's mean
+        self.current = None
+
+    def _bucket_index(self, x):
+        return min(int((x - self.x_min) / self.width), self.buckets - 1)
+
+    def add(self, batch):
+        for point in batch:
+            self.rows += 1
+            if self.raw is not None:
+                self.raw.append(point)
+                if len(self.raw) > self.points:
+                    self.raw = None
+            if self.first is None:
+                self.first = point
+                if self.method == "lttb":
+                    continue
+            if self.last is not None and self.method == "lttb":
+                # The previous last point is not the series end after all
+                self._add_to_bucket(self.last)
+            self.last = point
+            if self.method == "minmax":
+                self._add_to_bucket(point)
+
+    def _add_to_bucket(self, point):
+        index = self._bucket_index(point[0])
+        if self.current is not None and self.current[0] == index:
+            self.current[1].add(point)
+            return
+        if self.current is not None:
+            self._complete(self.current)
+        self.current = (index, Bucket(self.x_min + index * self.width, self.width))
+        self.current[1].add(point)
+
+    def _complete(self, bucket):
+        """``bucket`` is full: emit it (minmax) or let it choose the pending bucket's point (lttb)."""
+        if self.method == "minmax":
+            low, high = bucket[1].low, bucket[1].high
+            self.selected.extend([low] if low is high else sorted((low, high), key=lambda p: p[0]))
+            return
+        if self.pending is not None:
+            self._select(self.pending[1], bucket[1].mean)
+        self.pending = bucket
+
+    def _select(self, bucket, next_mean):
+        ax, ay = (self.selected[-1] if self.selected else self.first)[0::2]
+        cx, cy = next_mean
+        best = max(
+            bucket.candidates,
+            key=lambda p: abs((ax - cx) * (p[2] - ay) - (ax - p[0]) * (cy - ay)),
+        )
+        self.selected.append(best)
+
+    def result(self):
+        """Return the selected ``(x, y)`` pairs in x order."""
+        if self.raw is not None:
+            return [(point[1], point[2]) for point in self.raw]
+        if self.method == "minmax":
+            if self.current is not None:
+                self._complete(self.current)
+                self.current = None
+            return [(point[1], point[2]) for point in self.selected]
+
+        if self.current is not None:
+            self._complete(self.current)
+            self.current = None
+        if self.pending is not None:
+            self._select(self.pending[1], (self.last[0], self.last[2]))
+            self.pending = None
+        series = [self.first, *self.selected, self.last]
+        return [(point[1], point[2]) for point in series]
+
+
+def parse_range_value(value, declared):
+    """Convert a start/end bound to the column's stored form."""
+    if value is None:
+        return None
+    if declared_to_type(declared) == TIMESTAMP:
+        normalized = normalize_timestamp(value)
+        if normalized is None:
+            raise HTTPException(status_code=400, detail=f"Invalid timestamp: {value}")
+        return normalized
+    try:
+        return float(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid number: {value}")
+
+
+def numeric_value(value):
+    """``value`` as a finite number, or None for text that is not one (e.g. "n/a")."""
+    if isinstance(value, (int, float)):
+        return value if math.isfinite(value) else None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def downsample(conn, info, x, y, points, method="lttb", start=None, end=None, batch_size=10000):
+    """
+    Downsample ``y`` over ``x`` of a table in one streaming pass.
+
+    ``x`` is the rowid, a numeric column or a TIMESTAMP column (bucketed by
+    time); rows whose x or y is not a number (or a parseable timestamp)
+    are skipped rather than plotted as zero. Rows are read in x order within ``[start, end]``, which an index
+    on ``x`` turns into a range scan, ``batch_size`` rows at a time.
+
+    Returns:
+        ``{"headers": [x, y], "columns": [[xs], [ys]], ...}``
+    """
+    if x != "rowid" and x not in info.columns:
+        raise HTTPException(status_code=400, detail=f"Unknown column '{x}'")
+    if y not in info.columns:
+        raise HTTPException(status_code=400, detail=f"Unknown column '{y}'")
+    declared = info.columns.get(x, "INTEGER")
+    x_type = declared_to_type(declared)
+    if x_type not in (TIMESTAMP, INTEGER, REAL):
+        # Text orders as text and CASTs to its numeric prefix ("9/25/2024" is 9.0)
+        raise HTTPException(status_code=400, detail=f"Cannot downsample over '{x}': x must be numeric or a timestamp")
+    x_column = "rowid" if x == "rowid" else quote_identifier(x)
+    y_value = quote_identifier(y)
+    if x_type == TIMESTAMP:
+        x_number = f"(julianday({x_column}) - 2440587.5) * 86400.0"
+        clauses = [f"julianday({x_column}) IS NOT NULL"]
+    else:
+        x_number = x_column
+        clauses = [f"typeof({x_column}) IN ('integer', 'real')"]
+    # Text y values are converted row by row, since CAST turns "n/a" into 0.0
+    text_y = column_affinity(info.columns[y]) in ("TEXT", "BLOB")
+    clauses.append(f"{y_value} IS NOT NULL" if text_y else f"typeof({y_value}) IN ('integer', 'real')")
+
+    params = []
+    for operator, bound in ((">=", start), ("<=", end)):
+        value = parse_range_value(bound, declared)
+        if value is not None:
+            clauses.append(f"{x_column} {operator} ?")
+            params.append(value)
+    table = quote_identifier(info.name)
+    where = " AND ".join(clauses)
+
+    # With an index on x each of these is a single seek
+    low = conn.execute(f"SELECT {x_number} FROM {table} WHERE {where} ORDER BY {x_column} ASC LIMIT 1", params).fetchone()
+    high = conn.execute(f"SELECT {x_number} FROM {table} WHERE {where} ORDER BY {x_column} DESC LIMIT 1", params).fetchone()
+    result = {"headers": [x, y], "columns": [[], []], "method": method, "rows_scanned": 0}
+    if low is None or low[0] is None or high[0] is None:
+        return result
+
+    sampler = Downsampler(points, method, low[0], high[0])
+    cursor = conn.execute(
+        f"SELECT {x_number}, {x_column}, {y_value} FROM {table} WHERE {where} ORDER BY {x_column}", params
+    )
+    try:
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            if text_y:
+                points = ((row[0], row[1], numeric_value(row[2])) for row in batch)
+                sampler.add(point for point in points if point[2] is not None)
+            else:
+                sampler.add(tuple(row) for row in batch)
+    finally:
+        cursor.close()
+
+    series = sampler.result()
+    result["columns"] = [[point[0] for point in series], [point[1] for point in series]]
+    result["rows_scanned"] = sampler.rows
+    return result
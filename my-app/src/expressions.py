@@ -0,0 +1,389 @@
+import ast
+import re
+import time
+
+import numpy as np
+from fastapi import HTTPException
+
+from column_types import INTEGER, REAL, TEXT, declared_to_type
+from metrics import ROWS_RETURNED
+from query_builder import decode_cursor_payload, encode_cursor_payload, quote_identifier
+from serializers import to_columns
+from table_versions import bump_version
+
+OPERATIONS = ("add", "subtract", "multiply", "divide", "concat", "custom")
+MAX_EXPRESSION_LENGTH = 1000
+MAX_EXPRESSION_NODES = 200
+
+# [Column] or [Table].[Column], as the client's expression editor writes them
+COLUMN_REFERENCE = re.compile(r"\[([^\[\]]+)\](?:\.\[([^\[\]]+)\])?")
+
+SQL_OPERATORS = {"add": "+", "subtract": "-", "multiply": "*", "divide": "/"}
+NUMPY_OPERATORS = {"add": np.add, "subtract": np.subtract, "multiply": np.multiply, "divide": np.true_divide}
+
+BINARY_OPERATORS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.true_divide,
+    ast.FloorDiv: np.floor_divide,
+    ast.Mod: np.mod,
+    ast.Pow: np.power,
+}
+UNARY_OPERATORS = {ast.USub: np.negative, ast.UAdd: np.positive, ast.Not: np.logical_not}
+COMPARISONS = {
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+}
+FUNCTIONS = {
+    "abs": np.abs, "sqrt": np.sqrt, "exp": np.exp, "log": np.log, "log10": np.log10, "log2": np.log2,
+    "floor": np.floor, "ceil": np.ceil, "round": np.round, "sign": np.sign,
+    "sin": np.sin, "cos": np.cos, "tan": np.tan,
+    "minimum": np.minimum, "maximum": np.maximum, "clip": np.clip, "where": np.where,
+    "isnan": np.isnan, "nan_to_num": np.nan_to_num,
+}
+CONSTANTS = {"pi": np.pi, "e": np.e, "nan": np.nan, "inf": np.inf}
+
+
+class ExpressionError(ValueError):
+    """A custom expression that is malformed or uses something not allowed."""
+
+
+def _compile_node(node, variables):
+    """Turn one validated AST node into a function of the variable arrays."""
+    if isinstance(node, ast.Expression):
+        return _compile_node(node.body, variables)
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise ExpressionError(f"Only numeric constants are allowed, not {node.value!r}")
+        value = float(node.value)
+        return lambda env: value
+    if isinstance(node, ast.Name):
+        if node.id in variables:
+            name = node.id
+            return lambda env: env[name]
+        if node.id in CONSTANTS:
+            value = CONSTANTS[node.id]
+            return lambda env: value
+        raise ExpressionError(f"Unknown name '{node.id}'")
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+        op, left, right = BINARY_OPERATORS[type(node.op)], _compile_node(node.left, variables), _compile_node(node.right, variables)
+        return lambda env: op(left(env), right(env))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+        op, operand = UNARY_OPERATORS[type(node.op)], _compile_node(node.operand, variables)
+        return lambda env: op(operand(env))
+    if isinstance(node, ast.BoolOp):
+        op = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        values = [_compile_node(value, variables) for value in node.values]
+
+        def bool_op(env):
+            result = values[0](env)
+            for value in values[1:]:
+                result = op(result, value(env))
+            return result
+        return bool_op
+    if isinstance(node, ast.Compare) and all(type(op) in COMPARISONS for op in node.ops):
+        operands = [_compile_node(operand, variables) for operand in [node.left, *node.comparators]]
+        ops = [COMPARISONS[type(op)] for op in node.ops]
+
+        def compare(env):
+            values = [operand(env) for operand in operands]
+            result = ops[0](values[0], values[1])
+            for i, op in enumerate(ops[1:], 1):
+                result = np.logical_and(result, op(values[i], values[i + 1]))
+            return result
+        return compare
+    if isinstance(node, ast.IfExp):
+        test, body, orelse = (_compile_node(part, variables) for part in (node.test, node.body, node.orelse))
+        return lambda env: np.where(test(env), body(env), orelse(env))
+    if isinstance(node, ast.Call) and not node.keywords:
+        func = node.func
+        # Accept both abs(x) and np.abs(x)
+        if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name) and func.value.id in ("np", "numpy"):
+            name = func.attr
+        elif isinstance(func, ast.Name):
+            name = func.id
+        else:
+            name = None
+        if name not in FUNCTIONS:
+            raise ExpressionError(f"Function '{name or ast.dump(func)}' is not allowed")
+        function, args = FUNCTIONS[name], [_compile_node(arg, variables) for arg in node.args]
+        return lambda env: function(*(arg(env) for arg in args))
+    raise ExpressionError(f"'{type(node).__name__}' is not allowed in expressions")
+
+
+class CustomExpression:
+    """
+    A custom expression compiled into a vectorized function over NumPy arrays.
+
+    ``x`` is the source column and ``y`` the target column; other columns of
+    the source table are written ``[Column]`` or ``[Table].[Column]``. Only
+    arithmetic, comparisons, ``a if cond else b``, numeric constants and the
+    functions in FUNCTIONS are accepted. The expression is parsed with
+    ``ast`` and turned into a tree of closures over NumPy ufuncs, so nothing
+    is ever passed to eval() and each call runs once per batch, not per row.
+    """
+
+    def __init__(self, text, source_table, source_columns):
+        if not text or not text.strip():
+            raise ExpressionError("Custom expression is empty")
+        if len(text) > MAX_EXPRESSION_LENGTH:
+            raise ExpressionError(f"Expressions are limited to {MAX_EXPRESSION_LENGTH} characters")
+
+        self.columns = {}  # placeholder variable -> source column
+
+        def replace(match):
+            table, column = (match.group(1), match.group(2)) if match.group(2) else (None, match.group(1))
+            if table is not None and table != source_table:
+                raise ExpressionError(f"Column references must be to the source table '{source_table}'")
+            if column not in source_columns:
+                raise ExpressionError(f"Unknown column '{column}'")
+            for name, existing in self.columns.items():
+                if existing == column:
+                    return name
+            name = f"__column_{len(self.columns)}"
+            self.columns[name] = column
+            return name
+
+        rewritten = COLUMN_REFERENCE.sub(replace, text.strip())
+        try:
+            tree = ast.parse(rewritten, mode="eval")
+        except SyntaxError as e:
+            raise ExpressionError(f"Invalid expression: {e.msg}")
+        if sum(1 for _ in ast.walk(tree)) > MAX_EXPRESSION_NODES:
+            raise ExpressionError("Expression is too complex")
+        self._evaluate = _compile_node(tree, {"x", "y", *self.columns})
+
+    def __call__(self, env, size):
+        try:
+            with np.errstate(all="ignore"):
+                result = self._evaluate(env)
+            return np.broadcast_to(np.asarray(result, dtype=float), (size,))
+        except (TypeError, ValueError) as e:
+            # e.g. a function called with the wrong arguments, or a result of the wrong shape
+            raise HTTPException(status_code=400, detail=f"Cannot evaluate expression: {e}")
+
+
+def to_float_array(values):
+    """Convert a column batch to float64, with NaN wherever a value is not a number."""
+    try:
+        return np.array(values, dtype=float)
+    except (TypeError, ValueError):
+        converted = []
+        for value in values:
+            try:
+                converted.append(float(value))
+            except (TypeError, ValueError):
+                converted.append(np.nan)
+        return np.array(converted, dtype=float)
+
+
+def to_values(result):
+    """Turn a float result array into JSON/SQLite values; NaN and infinities become NULL."""
+    finite = np.isfinite(result)
+    return [float(value) if ok else None for value, ok in zip(result.tolist(), finite.tolist())]
+
+
+class ExpressionPlan:
+    """
+    How to evaluate the client's Expression model against database tables.
+
+    Rows of the source and target tables are paired by position in rowid
+    order, as the client pairs HistoryItem rows by index; source rows
+    without a partner get NULL. Built-in operations between INTEGER/REAL
+    columns of the same table run in SQL. Everything else (TEXT columns,
+    two different tables, custom expressions) runs through NumPy over
+    batches of rows.
+    """
+
+    def __init__(self, source, target, source_column, target_column, operation, name, expression=""):
+        if operation not in OPERATIONS:
+            raise HTTPException(status_code=400, detail=f"Unknown operation '{operation}'")
+        for info, column in ((source, source_column), (target, target_column)):
+            if column not in info.columns:
+                raise HTTPException(status_code=400, detail=f"Unknown column '{column}' in table '{info.name}'")
+        self.source = source
+        self.target = target
+        self.source_column = source_column
+        self.target_column = target_column
+        self.operation = operation
+        self.name = name
+        self.same_table = source.name == target.name
+        self.result_type = TEXT if operation == "concat" else REAL
+
+        self.custom = None
+        if operation == "custom":
+            try:
+                self.custom = CustomExpression(expression, source.name, source.columns)
+            except ExpressionError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        numeric = all(
+            declared_to_type(info.columns[column]) in (INTEGER, REAL)
+            for info, column in ((source, source_column), (target, target_column))
+        )
+        self.sql = None
+        if self.same_table and (operation == "concat" or (operation in SQL_OPERATORS and numeric)):
+            self.sql = self._sql_expression()
+
+    def _sql_expression(self):
+        x, y = quote_identifier(self.source_column), quote_identifier(self.target_column)
+        if self.operation == "concat":
+            return f"(CAST({x} AS TEXT) || CAST({y} AS TEXT))"
+        # CAST keeps integer division from truncating; x / 0 is NULL in SQLite
+        return f"(CAST({x} AS REAL) {SQL_OPERATORS[self.operation]} {y})"
+
+    @property
+    def source_columns(self):
+        """Source columns the NumPy path needs."""
+        columns = [self.source_column]
+        if self.custom is not None:
+            columns.extend(column for column in self.custom.columns.values() if column not in columns)
+        if self.same_table and self.target_column not in columns:
+            columns.append(self.target_column)
+        return columns
+
+    def evaluate(self, source_values, target_values):
+        """Evaluate a batch: ``source_values`` maps column -> list, ``target_values`` is the y list."""
+        size = len(target_values)
+        if self.operation == "concat":
+            return [
+                None if a is None or b is None else f"{a}{b}"
+                for a, b in zip(source_values[self.source_column], target_values)
+            ]
+        x = to_float_array(source_values[self.source_column])
+        y = to_float_array(target_values)
+        if self.custom is not None:
+            env = {"x": x, "y": y}
+            env.update((name, to_float_array(source_values[column])) for name, column in self.custom.columns.items())
+            return to_values(self.custom(env, size))
+        with np.errstate(all="ignore"):
+            return to_values(NUMPY_OPERATORS[self.operation](x, y))
+
+    def batch(self, conn, after_source, after_target, size, columns="*"):
+        """
+        Evaluate the next ``size`` source rows after the given rowids.
+
+        Args:
+            columns: "*" for every source column, a list, or None for none
+
+        Returns:
+            (rowids, rows, values, last target rowid) where ``rows`` are the
+            selected source columns of each row
+        """
+        select = ["rowid"]
+        if columns == "*":
+            select.append("*")
+            width = 1 + len(self.source.columns)
+        else:
+            select.extend(quote_identifier(column) for column in columns or ())
+            width = len(select)
+        extra = [self.sql] if self.sql is not None else [quote_identifier(c) for c in self.source_columns]
+        rows = conn.execute(
+            f"SELECT {', '.join(select + extra)} FROM {quote_identifier(self.source.name)} "
+            f"WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (after_source, size),
+        ).fetchall()
+        rowids = [row[0] for row in rows]
+        selected = [tuple(row)[1:width] for row in rows]
+
+        if self.sql is not None:
+            return rowids, selected, [row[width] for row in rows], rowids[-1] if rows else after_target
+
+        source_values = {column: [row[width + i] for row in rows] for i, column in enumerate(self.source_columns)}
+        if self.same_table:
+            target_values = source_values[self.target_column]
+            last_target = rowids[-1] if rows else after_target
+        else:
+            targets = conn.execute(
+                f"SELECT rowid, {quote_identifier(self.target_column)} FROM {quote_identifier(self.target.name)} "
+                f"WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (after_target, len(rows)),
+            ).fetchall()
+            target_values = [row[1] for row in targets] + [None] * (len(rows) - len(targets))
+            last_target = targets[-1][0] if targets else after_target
+        values = self.evaluate(source_values, target_values) if rows else []
+        return rowids, selected, values, last_target
+
+    @property
+    def headers(self):
+        return [*self.source.columns, self.name]
+
+
+def encode_expression_cursor(source_rowid, target_rowid):
+    return encode_cursor_payload({"s": source_rowid, "t": target_rowid})
+
+
+def decode_expression_cursor(cursor):
+    return tuple(decode_cursor_payload(cursor, s=int, t=int))
+
+
+def fetch_expression_page(conn, plan, cursor=None, limit=1000, columnar=False):
+    """
+    Return one page of source rows with the expression appended as a column,
+    as ``{"rows": [...], "next_cursor": ...}`` (or ``{"headers", "columns",
+    "next_cursor"}`` with ``columnar``).
+    """
+    after_source, after_target = decode_expression_cursor(cursor) if cursor else (0, 0)
+    rowids, rows, values, last_target = plan.batch(conn, after_source, after_target, limit)
+
+    next_cursor = None
+    if len(rowids) == limit:
+        more = conn.execute(
+            f"SELECT 1 FROM {quote_identifier(plan.source.name)} WHERE rowid > ? LIMIT 1", (rowids[-1],)
+        ).fetchone()
+        if more:
+            next_cursor = encode_expression_cursor(rowids[-1], last_target)
+
+    ROWS_RETURNED.labels("expression").observe(len(rows))
+    values = [(*row, value) for row, value in zip(rows, values)]
+    if columnar:
+        return {"headers": plan.headers, "columns": to_columns(plan.headers, values), "next_cursor": next_cursor}
+    return {"rows": [dict(zip(plan.headers, row)) for row in values], "next_cursor": next_cursor}
+
+
+def persist_expression(conn, plan, batch_size=10000):
+    """
+    Add the expression as a new column of the source table, in one transaction.
+
+    The SQL path is a single UPDATE; the NumPy path updates by rowid one
+    batch at a time.
+    """
+    # SQLite column names are case-insensitive
+    if plan.name.lower() in (column.lower() for column in plan.source.columns):
+        raise HTTPException(status_code=409, detail=f"Column '{plan.name}' already exists")
+
+    start = time.perf_counter()
+    table = quote_identifier(plan.source.name)
+    column = quote_identifier(plan.name)
+    conn.execute("BEGIN")
+    try:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {plan.result_type}")
+        if plan.sql is not None:
+            updated = conn.execute(f"UPDATE {table} SET {column} = {plan.sql}").rowcount
+        else:
+            updated = 0
+            after_source = after_target = 0
+            while True:
+                rowids, _, values, after_target = plan.batch(conn, after_source, after_target, batch_size, columns=None)
+                if not rowids:
+                    break
+                conn.executemany(f"UPDATE {table} SET {column} = ? WHERE rowid = ?", zip(values, rowids))
+                updated += len(rowids)
+                after_source = rowids[-1]
+        bump_version(conn, plan.source.name)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return {
+        "table": plan.source.name,
+        "column": plan.name,
+        "rows": updated,
+        "engine": "sql" if plan.sql is not None else "numpy",
+        "seconds": round(time.perf_counter() - start, 3),
+    }
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+MAX_FINISHED_JOBS = 100
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+
+class ImportCancelled(Exception):
+    """Raised inside a running import to make it roll back."""
+
+
+class QueueFullError(Exception):
+    """The job queue has no room for another job."""
+
+
+class ImportJob:
+    """
+    One background import and its progress.
+
+    ``on_chunk`` is passed to bulk_insert() as its progress callback, so it
+    runs on the writer thread after every chunk. That is also where a
+    cancellation takes effect: it raises ImportCancelled, which rolls back
+    the import's transaction.
+    """
+
+    def __init__(self, table, rows_total=None):
+        self.job_id = uuid.uuid4().hex
+        self.table = table
+        self.status = QUEUED
+        self.rows_total = rows_total
+        self.rows_processed = 0
+        self.result = None
+        self.error = None
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def on_chunk(self, processed):
+        self.rows_processed = processed
+        if self._cancel.is_set():
+            raise ImportCancelled(f"Import job {self.job_id} was cancelled")
+
+    def to_dict(self):
+        now = time.monotonic()
+        elapsed = (self.finished or now) - self.started if self.started else 0.0
+        rate = self.rows_processed / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if self.status == RUNNING and self.rows_total is not None and rate > 0:
+            eta = round((self.rows_total - self.rows_processed) / rate, 3)
+        return {
+            "job_id": self.job_id,
+            "table": self.table,
+            "status": self.status,
+            "rows_total": self.rows_total,
+            "rows_processed": self.rows_processed,
+            "rows_per_sec": round(rate),
+            "seconds": round(elapsed, 3),
+            "queued_seconds": round((self.started or now) - self.submitted, 3),
+            "eta_seconds": eta,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """
+    In-process queue of background jobs run by a fixed number of workers.
+
+    Jobs are coroutine functions taking the ImportJob. At most ``workers`` of
+    them run at once and at most ``max_queued`` wait; submit() refuses more
+    rather than letting pending payloads pile up in memory. Finished jobs
+    are kept for polling, up to MAX_FINISHED_JOBS.
+
+    Args:
+        workers: Number of jobs run concurrently
+        max_queued: Number of jobs allowed to wait for a worker
+    """
+
+    def __init__(self, workers=2, max_queued=32):
+        self.workers = workers
+        self._queue = asyncio.Queue(maxsize=max_queued)
+        self._jobs = OrderedDict()
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for job in self._jobs.values():
+            if job.status not in FINISHED_STATES:
+                job.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job, run):
+        try:
+            self._queue.put_nowait((job, run))
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Too many queued jobs (max {self._queue.maxsize})")
+        self._jobs[job.job_id] = job
+        self._prune()
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def jobs(self):
+        return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        """Request cancellation; a queued job is dropped, a running one rolls back."""
+        job = self._jobs.get(job_id)
+        if job is None or job.status in FINISHED_STATES:
+            return job
+        job.cancel()
+        if job.status == QUEUED:
+            self._finish(job, CANCELLED)
+        return job
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED_STATES]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _finish(self, job, status, error=None):
+        job.status = status
+        job.error = error
+        job.finished = time.monotonic()
+
+    async def _worker(self):
+        while True:
+            job, run = await self._queue.get()
+            try:
+                if job.status != QUEUED:
+                    continue
+                job.status = RUNNING
+                job.started = time.monotonic()
+                try:
+                    job.result = await run(job)
+                except ImportCancelled:
+                    logger.info(f"Import job {job.job_id} cancelled and rolled back")
+                    self._finish(job, CANCELLED)
+                except Exception as e:
+                    logger.error(f"Import job {job.job_id} failed: {e}")
+                    self._finish(job, FAILED, str(e))
+                else:
+                    self._finish(job, COMPLETED)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,292 @@
+import logging
+import sqlite3
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+from column_types import TEXT, coerce_rows, declared_to_type, infer_types, join_types
+from metrics import IMPORT_ROWS, IMPORT_ROWS_PER_SEC, IMPORT_SECONDS
+from query_builder import quote_identifier
+from summaries import refresh_summaries
+from table_versions import bump_version
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 5000
+# INTEGER PRIMARY KEY of every table an import creates
+ROWID_COLUMN = "id"
+
+# Applied for the duration of an import only. With WAL, synchronous=NORMAL
+# stays crash-safe for the database file and skips an fsync per commit.
+IMPORT_PRAGMAS = {
+    "synchronous": "NORMAL",
+    "cache_size": "-65536",     # 64 MiB page cache
+    "temp_store": "MEMORY",
+}
+
+
+@contextmanager
+def import_pragmas(conn, pragmas=IMPORT_PRAGMAS):
+    """Temporarily apply import-friendly PRAGMAs, restoring the old values afterwards."""
+    previous = {name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in pragmas}
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name}={value}")
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            conn.execute(f"PRAGMA {name}={value}")
+
+
+def ensure_import_table(conn, table_name, columns, types, existing=None):
+    """
+    Create the target table, or add any columns it is missing.
+
+    New columns get the inferred type (TEXT when nothing could be inferred);
+    existing columns keep theirs. SQLite compares column names without
+    case, so names that differ only in case are rejected, as is an ``id``
+    column when the table is created: ``id`` is the rowid alias every
+    imported table gets. An existing table's ``id`` can be imported into.
+
+    Args:
+        existing: ``{column: declared type}`` of the table if the caller
+            already knows it exists (e.g. from the schema catalog); saves
+            the PRAGMA table_info round trip
+
+    Raises:
+        ValueError: If the column names clash
+
+    Returns:
+        ``{column: type}`` for ``columns`` as they now exist in the table
+    """
+    table = quote_identifier(table_name)
+    if existing is None:
+        existing = {row[1]: row[2] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if len({col.lower() for col in columns}) != len(columns):
+        raise ValueError("Column names must be unique, ignoring case")
+    if not existing:
+        if any(col.lower() == ROWID_COLUMN for col in columns):
+            raise ValueError(f"Column name '{ROWID_COLUMN}' is reserved for the row id")
+        conn.execute(f"""
+        CREATE TABLE {table} (
+            {ROWID_COLUMN} INTEGER PRIMARY KEY AUTOINCREMENT,
+            {', '.join(f'{quote_identifier(col)} {types.get(col) or TEXT}' for col in columns)}
+        )
+        """)
+        existing = {row[1]: row[2] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+    current = {col: declared_to_type(declared) for col, declared in existing.items()}
+    known = {col.lower(): col for col in current}
+    for col in columns:
+        if col not in current:
+            if col.lower() in known:
+                raise ValueError(f"Column '{col}' clashes with existing column '{known[col.lower()]}'")
+            current[col] = types.get(col) or TEXT
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {quote_identifier(col)} {current[col]}')
+            logger.info(f"Added new column '{col}' to table '{table_name}'")
+    return {col: current[col] for col in columns}
+
+
+def widen_columns(conn, table_name, widened):
+    """
+    Change the declared type of some columns by rebuilding the table.
+
+    SQLite cannot ALTER a column's type, so the table is copied into a new
+    one with the wider types (keeping rowids, the AUTOINCREMENT counter,
+    indexes and triggers) and swapped in. Must run inside a transaction.
+
+    Args:
+        widened: ``{column: new type}`` for the columns to change
+    """
+    table = quote_identifier(table_name)
+    temp = quote_identifier(f"{table_name}__widen")
+    info = conn.execute(f"PRAGMA table_info({table})").fetchall()
+    create_sql, = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table_name,)
+    ).fetchone()
+    dependents = [sql for sql, in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name=? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+        (table_name,),
+    )]
+    autoincrement = "AUTOINCREMENT" in create_sql.upper()
+    sequence = None
+    if autoincrement:
+        sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name=?", (table_name,)).fetchone()
+
+    # PRAGMA table_info rows are (cid, name, type, notnull, dflt_value, pk)
+    pk_columns = sorted((pk, name, type_) for _, name, type_, _, _, pk in info if pk)
+    rowid_alias = len(pk_columns) == 1 and pk_columns[0][2].upper() == "INTEGER"
+    definitions = []
+    for _, name, type_, notnull, default, pk in info:
+        definition = f"{quote_identifier(name)} {widened.get(name, type_)}"
+        if notnull:
+            definition += " NOT NULL"
+        if default is not None:
+            definition += f" DEFAULT {default}"
+        if rowid_alias and pk:
+            definition += " PRIMARY KEY AUTOINCREMENT" if autoincrement else " PRIMARY KEY"
+        definitions.append(definition)
+    if pk_columns and not rowid_alias:
+        definitions.append(f"PRIMARY KEY ({', '.join(quote_identifier(name) for _, name, _ in pk_columns)})")
+
+    names = ", ".join(quote_identifier(row[1]) for row in info)
+    # Without an INTEGER PRIMARY KEY the rowid is hidden, so copy it explicitly
+    copied = names if rowid_alias else f"rowid, {names}"
+    conn.execute(f"CREATE TABLE {temp} ({', '.join(definitions)})")
+    conn.execute(f"INSERT INTO {temp} ({copied}) SELECT {copied} FROM {table}")
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {temp} RENAME TO {table}")
+    for sql in dependents:
+        conn.execute(sql)
+    if sequence is not None:
+        conn.execute("UPDATE sqlite_sequence SET seq=? WHERE name=?", (sequence[0], table_name))
+    logger.info(f"Widened columns {widened} in table '{table_name}'")
+
+
+def ensure_unique_key(conn, table_name, keys):
+    """
+    Make sure a unique index covers exactly ``keys``, creating one if needed.
+
+    ``INSERT ... ON CONFLICT(keys)`` needs such an index. Creating it fails
+    with IntegrityError if the rows already in the table repeat a key.
+    """
+    table = quote_identifier(table_name)
+    for (index,) in conn.execute('SELECT name FROM pragma_index_list(?) WHERE "unique"', (table_name,)).fetchall():
+        columns = [row[0] for row in conn.execute("SELECT name FROM pragma_index_info(?)", (index,))]
+        if sorted(columns) == sorted(keys):
+            return index
+    name = f"uq_{table_name}_{'_'.join(keys)}"
+    conn.execute(
+        f"CREATE UNIQUE INDEX {quote_identifier(name)} ON {table} ({', '.join(quote_identifier(key) for key in keys)})"
+    )
+    logger.info(f"Created unique index '{name}' on '{table_name}' ({', '.join(keys)})")
+    return name
+
+
+def _max_rowid(conn, table_name):
+    return conn.execute(f"SELECT MAX(rowid) FROM {quote_identifier(table_name)}").fetchone()[0] or 0
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bulk_insert(conn, table_name, columns, rows, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, existing=None, keys=None):
+    """
+    Insert value tuples with executemany(), chunk by chunk, in one transaction.
+
+    Column types are inferred from the first chunk (INTEGER, REAL, TIMESTAMP
+    or TEXT) when the table or a column is created. Every later chunk is
+    checked against them, and a column is widened (INTEGER to REAL to TEXT,
+    TIMESTAMP to TEXT) when its values no longer fit. The table is created
+    or widened inside the same transaction, so a failure anywhere rolls back
+    both the rows and any schema change. Summaries declared over the table
+    fold in the new rows in that transaction too.
+
+    With ``keys`` the import is an upsert: a unique index on the key
+    columns is created if missing, and a row whose key already exists
+    updates that row's other columns instead of adding a duplicate, so
+    importing the same file twice leaves the table unchanged. Rows with a
+    NULL key column never conflict and are always inserted.
+
+    Args:
+        conn: SQLite connection with no transaction in progress
+        table_name: Target table, created if missing
+        columns: Column names, in the order of the values in each row
+        rows: Iterable of value tuples; it is consumed lazily
+        chunk_size: Number of rows passed to each executemany() call
+        progress: Optional callable given the running row count after each chunk
+        existing: Known ``{column: declared type}`` of an existing table
+        keys: Optional key columns (a subset of ``columns``) to upsert on
+
+    Returns:
+        Dict with the number of rows imported, elapsed seconds and rows/sec;
+        with ``keys`` also how many of them were inserted and updated
+    """
+    insert_columns = ', '.join(quote_identifier(col) for col in columns)
+    placeholders = ', '.join('?' for _ in columns)
+    insert_query = f'INSERT INTO {quote_identifier(table_name)} ({insert_columns}) VALUES ({placeholders})'
+    if keys:
+        missing = [key for key in keys if key not in columns]
+        if missing:
+            raise ValueError(f"Key columns missing from the import: {', '.join(missing)}")
+        updates = [f"{quote_identifier(col)} = excluded.{quote_identifier(col)}" for col in columns if col not in keys]
+        conflict = f"DO UPDATE SET {', '.join(updates)}" if updates else "DO NOTHING"
+        insert_query += f" ON CONFLICT({', '.join(quote_identifier(key) for key in keys)}) {conflict}"
+
+    start = time.perf_counter()
+    inserted = 0
+    before = None
+    with import_pragmas(conn):
+        conn.execute("BEGIN")
+        try:
+            types = None
+            for chunk in _chunks(rows, chunk_size):
+                inferred = infer_types(columns, chunk, types)
+                if types is None:
+                    types = ensure_import_table(conn, table_name, columns, inferred, existing)
+                    if keys:
+                        ensure_unique_key(conn, table_name, keys)
+                        before = _max_rowid(conn, table_name)
+                widened = {
+                    col: join_types(types[col], inferred[col])
+                    for col in columns
+                    if join_types(types[col], inferred[col]) != types[col]
+                }
+                if ROWID_COLUMN in widened and existing and ROWID_COLUMN in existing:
+                    raise ValueError(f"Column '{ROWID_COLUMN}' is the row id and only takes integers")
+                if widened:
+                    widen_columns(conn, table_name, widened)
+                    types.update(widened)
+                conn.executemany(insert_query, coerce_rows(columns, chunk, types))
+                inserted += len(chunk)
+                if progress is not None:
+                    progress(inserted)
+            if types is None:
+                ensure_import_table(conn, table_name, columns, {}, existing)
+                if keys:
+                    ensure_unique_key(conn, table_name, keys)
+            updated = 0
+            if before is not None:
+                # Upserted rows keep their rowid; only inserts land above the old maximum
+                added = conn.execute(
+                    f"SELECT COUNT(*) FROM {quote_identifier(table_name)} WHERE rowid > ?", (before,)
+                ).fetchone()[0]
+                updated = inserted - added
+            # Summaries can only fold in appended rows; rows changed in place need a rebuild
+            refresh_summaries(conn, table_name, rebuild=updated > 0)
+            bump_version(conn, table_name)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "rows": inserted,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(inserted / elapsed) if elapsed > 0 else inserted,
+    }
+    if keys:
+        stats.update(inserted=inserted - updated, updated=updated)
+    IMPORT_ROWS.inc(inserted)
+    IMPORT_SECONDS.observe(elapsed)
+    IMPORT_ROWS_PER_SEC.set(stats["rows_per_sec"])
+    logger.info(f"Imported {inserted} rows into '{table_name}' ({stats['rows_per_sec']} rows/sec)")
+    return stats
+
+
+def import_records(conn, table_name, data, chunk_size=DEFAULT_CHUNK_SIZE, existing=None, progress=None, keys=None):
+    """Bulk-import a list of dicts, using the first record's keys as the column set."""
+    columns = list(data[0].keys())
+    rows = (tuple(record.get(col) for col in columns) for record in data)
+    try:
+        return bulk_insert(conn, table_name, columns, rows, chunk_size, progress, existing=existing, keys=keys)
+    except sqlite3.Error as e:
+        logger.error(f"Import into '{table_name}' rolled back: {e}")
+        raise
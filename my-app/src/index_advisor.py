@@ -0,0 +1,211 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from fastapi import HTTPException
+
+from query_builder import parse_filter, parse_order_by, quote_identifier
+
+logger = logging.getLogger(__name__)
+
+MAX_INDEX_COLUMNS = 4
+# Operators an index can serve; "!=" still has to scan
+RANGE_OPERATORS = ("<", "<=", ">", ">=", "BETWEEN")
+
+
+def candidate_key(filters=(), order_by=None, group_by=()):
+    """
+    Derive the index that would serve one query, as a tuple of columns.
+
+    Equality-filtered columns come first, followed by a single range column,
+    or failing that the sort column or the group-by columns: the column
+    order in which SQLite can use every part of a composite index.
+
+    Args:
+        filters: ``(column, operator)`` pairs
+        order_by: Sort column, without the descending dash
+        group_by: Group-by columns
+    """
+    key = []
+    for column, operator in filters:
+        if operator == "=" and column not in key:
+            key.append(column)
+    ranges = [column for column, operator in filters if operator in RANGE_OPERATORS and column not in key]
+    if ranges:
+        key.append(ranges[0])
+    elif order_by and order_by != "rowid":
+        if order_by not in key:
+            key.append(order_by)
+    else:
+        key.extend(column for column in group_by if column not in key)
+    return tuple(key[:MAX_INDEX_COLUMNS])
+
+
+def is_covered(key, info):
+    """True if an existing index (or the rowid) already leads with ``key``."""
+    if not key:
+        return True
+    if key == (info.rowid_alias,) or key == ("rowid",):
+        return True
+    return any(tuple(columns[:len(key)]) == key for columns in info.indexes.values())
+
+
+def index_name(table, columns):
+    return f"idx_{table}_{'_'.join(columns)}"
+
+
+class IndexAdvisor:
+    """
+    Counts how queries use each table's columns and suggests indexes.
+
+    Every read records the composite key candidate_key() derives from its
+    filters, sort and group-by. A key used at least ``threshold`` times that
+    no existing index covers is suggested; with ``auto_create`` it is also
+    queued for creation, collected with take_pending().
+
+    Args:
+        threshold: Uses of a key before it is suggested
+        auto_create: Queue suggested indexes for automatic creation
+    """
+
+    def __init__(self, threshold=20, auto_create=False):
+        self.threshold = threshold
+        self.auto_create = auto_create
+        self._lock = threading.Lock()
+        self._keys = {}      # table -> Counter of column tuples
+        self._columns = {}   # table -> Counter of single columns
+        self._pending = []
+        self._queued = set()
+
+    def record(self, info, filters=(), order_by=None, group_by=()):
+        """
+        Record one query against the table described by ``info``.
+
+        ``filters`` are the raw filter expressions; they have already been
+        validated by the query itself.
+        """
+        parsed = [parse_filter(expression, info.columns)[:2] for expression in filters]
+        order_column = parse_order_by(order_by)[0] if order_by else None
+        if order_column not in info.columns:
+            # rowid needs no index, and an unknown sort column must not become a suggestion
+            order_column = None
+        used = {column for column, _ in parsed} | set(group_by)
+        if order_column:
+            used.add(order_column)
+        self.record_key(info, candidate_key(parsed, order_column, group_by), used)
+
+    def record_key(self, info, key, used=None):
+        """Record one use of an index key directly, e.g. a join column."""
+        if not key:
+            return
+        key = tuple(key)
+        with self._lock:
+            self._columns.setdefault(info.name, Counter()).update(used if used is not None else key)
+            keys = self._keys.setdefault(info.name, Counter())
+            keys[key] += 1
+            if (
+                self.auto_create
+                and keys[key] >= self.threshold
+                and (info.name, key) not in self._queued
+                and not is_covered(key, info)
+            ):
+                self._queued.add((info.name, key))
+                self._pending.append((info.name, key))
+
+    def take_pending(self):
+        """Return and clear the indexes queued for automatic creation."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            return pending
+
+    def usage(self, table):
+        with self._lock:
+            return dict(self._columns.get(table, {}))
+
+    def suggestions(self, info):
+        """Uncovered keys used at least ``threshold`` times, most used first."""
+        with self._lock:
+            keys = list(self._keys.get(info.name, Counter()).most_common())
+        return [
+            {"columns": list(key), "uses": uses, "name": index_name(info.name, key)}
+            for key, uses in keys
+            if uses >= self.threshold and not is_covered(key, info)
+        ]
+
+    def forget(self, table, key):
+        with self._lock:
+            self._queued.discard((table, tuple(key)))
+
+
+def probe_query(table, columns):
+    """An equality lookup on ``columns`` of ``table``: the query an index on them serves."""
+    clauses = " AND ".join(f"{quote_identifier(column)} = ?" for column in columns)
+    return f"SELECT COUNT(*) FROM {quote_identifier(table)} WHERE {clauses}"
+
+
+def query_plan(conn, sql, params=()):
+    # An EXPLAIN never touches the schema cookie, so a statement cached before an
+    # index change would keep its old plan; tagging it with the schema version avoids that
+    version = conn.execute("PRAGMA schema_version").fetchone()[0]
+    return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql} -- schema {version}", params).fetchall()]
+
+
+def _timed_change(conn, table, columns, change):
+    # Only the plan is probed: timing a query would scan the table on every build
+    start = time.perf_counter()
+    change()
+    conn.commit()
+    seconds = round(time.perf_counter() - start, 3)
+    sql = probe_query(table, columns)
+    return {"seconds": seconds, "probe": {"sql": sql, "plan": query_plan(conn, sql, [None] * len(columns))}}
+
+
+def create_index(conn, table, columns, name=None, unique=False):
+    """
+    Create an index on ``columns`` of ``table``, timing the build.
+
+    Returns:
+        Dict with the index name, columns, build seconds and the query plan
+        of an equality lookup on the columns
+    """
+    name = name or index_name(table, columns)
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)
+    ).fetchone()
+    if exists:
+        raise HTTPException(status_code=409, detail=f"Index '{name}' already exists")
+
+    sql = (
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX {quote_identifier(name)} "
+        f"ON {quote_identifier(table)} ({', '.join(quote_identifier(column) for column in columns)})"
+    )
+
+    def build():
+        try:
+            conn.execute(sql)
+        except sqlite3.IntegrityError:
+            # Rows already in the table repeat a value of the unique key
+            raise HTTPException(
+                status_code=409, detail=f"Cannot create unique index: duplicate values in {', '.join(columns)}",
+            )
+
+    timings = _timed_change(conn, table, columns, build)
+    logger.info(f"Created index '{name}' on '{table}' ({', '.join(columns)}) in {timings['seconds']}s")
+    return {"name": name, "columns": list(columns), "unique": unique, **timings}
+
+
+def drop_index(conn, table, name, columns):
+    """Drop index ``name`` of ``table``, returning the query plan of a lookup on its columns afterwards."""
+    row = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND name = ? AND tbl_name = ?", (name, table)
+    ).fetchone()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Index not found")
+    if row[0] is None:
+        raise HTTPException(status_code=400, detail="Indexes backing PRIMARY KEY or UNIQUE constraints cannot be dropped")
+
+    timings = _timed_change(conn, table, columns, lambda: conn.execute(f"DROP INDEX {quote_identifier(name)}"))
+    logger.info(f"Dropped index '{name}' on '{table}'")
+    return {"name": name, "columns": list(columns), **timings}
@@ -0,0 +1,197 @@
+import time
+
+from fastapi import HTTPException
+
+from query_builder import decode_cursor_payload, encode_cursor_payload, quote_identifier
+from serializers import to_columns
+from table_versions import bump_version
+
+JOIN_TYPES = ("inner", "left", "right", "full")
+LEFT_ROWID = "__left_rowid__"
+RIGHT_ROWID = "__right_rowid__"
+
+# A paginated join runs in two phases: the left-driven join, then (for
+# right and full joins) the right rows that matched nothing
+MATCHED = 0
+UNMATCHED_RIGHT = 1
+
+
+class JoinPlan:
+    """
+    SQL for joining two tables the way the client's JoinConfig does.
+
+    The result has every left column followed by the right columns except
+    the right join column. A right column whose name is already taken is
+    renamed ``<right table>_<column>``. Rows that exist only on the right
+    carry their key in the left join column.
+
+    SQLite before 3.39 has no RIGHT or FULL OUTER JOIN, so both are built
+    from a left-driven join (INNER for right, LEFT for full) followed by
+    the right rows with no match, found with NOT EXISTS. The same split
+    lets each part be paginated by rowid.
+    """
+
+    def __init__(self, left, right, left_column, right_column, join_type):
+        if join_type not in JOIN_TYPES:
+            raise HTTPException(status_code=400, detail=f"Unknown join type '{join_type}'")
+        for info, column in ((left, left_column), (right, right_column)):
+            if column not in info.columns:
+                raise HTTPException(status_code=400, detail=f"Unknown column '{column}' in table '{info.name}'")
+
+        self.left = left
+        self.right = right
+        self.left_column = left_column
+        self.right_column = right_column
+        self.join_type = join_type
+
+        self.headers = list(left.columns)
+        self.declared = dict(left.columns)
+        # (output name, source column) for the right side
+        self.right_columns = []
+        for column, declared in right.columns.items():
+            if column == right_column:
+                continue
+            name = column
+            while name in self.declared:
+                name = f"{right.name}_{name}"
+            self.right_columns.append((name, column))
+            self.headers.append(name)
+            self.declared[name] = declared
+
+    @property
+    def includes_unmatched_right(self):
+        return self.join_type in ("right", "full")
+
+    def probed_columns(self):
+        """``(TableInfo, column)`` pairs looked up once per row of the other side."""
+        probed = [(self.right, self.right_column)]
+        if self.includes_unmatched_right:
+            probed.append((self.left, self.left_column))
+        return probed
+
+    def _from_left(self):
+        join = "LEFT JOIN" if self.join_type in ("left", "full") else "JOIN"
+        return (
+            f"FROM {quote_identifier(self.left.name)} AS l {join} {quote_identifier(self.right.name)} AS r "
+            f"ON l.{quote_identifier(self.left_column)} = r.{quote_identifier(self.right_column)}"
+        )
+
+    def _from_unmatched_right(self):
+        return (
+            f"FROM {quote_identifier(self.right.name)} AS r WHERE NOT EXISTS ("
+            f"SELECT 1 FROM {quote_identifier(self.left.name)} AS l "
+            f"WHERE l.{quote_identifier(self.left_column)} = r.{quote_identifier(self.right_column)})"
+        )
+
+    def _select(self, unmatched_right):
+        select = []
+        for column in self.left.columns:
+            if not unmatched_right:
+                source = f"l.{quote_identifier(column)}"
+            elif column == self.left_column:
+                source = f"r.{quote_identifier(self.right_column)}"
+            else:
+                source = "NULL"
+            select.append(f"{source} AS {quote_identifier(column)}")
+        select.extend(f"r.{quote_identifier(column)} AS {quote_identifier(name)}" for name, column in self.right_columns)
+        return ", ".join(select)
+
+    def select_all(self):
+        """The whole join as one unordered query, for streaming and materializing."""
+        sql = f"SELECT {self._select(False)} {self._from_left()}"
+        if self.includes_unmatched_right:
+            sql += f" UNION ALL SELECT {self._select(True)} {self._from_unmatched_right()}"
+        return sql
+
+    def page_query(self, phase, left_rowid, right_rowid, limit):
+        """One phase of a keyset page, ordered by (left rowid, right rowid)."""
+        if phase == MATCHED:
+            sql = f"SELECT l.rowid AS {LEFT_ROWID}, r.rowid AS {RIGHT_ROWID}, {self._select(False)} {self._from_left()}"
+            params = []
+            if left_rowid is not None:
+                if right_rowid is None:
+                    # A left row without a match is a single row, so it is finished
+                    sql += " WHERE l.rowid > ?"
+                    params.append(left_rowid)
+                else:
+                    # The leading range keeps this a rowid search rather than a scan
+                    sql += " WHERE l.rowid >= ? AND (l.rowid > ? OR r.rowid > ?)"
+                    params.extend([left_rowid, left_rowid, right_rowid])
+            sql += " ORDER BY l.rowid, r.rowid LIMIT ?"
+        else:
+            sql = (
+                f"SELECT NULL AS {LEFT_ROWID}, r.rowid AS {RIGHT_ROWID}, {self._select(True)} "
+                f"{self._from_unmatched_right()}"
+            )
+            params = []
+            if right_rowid is not None:
+                sql += " AND r.rowid > ?"
+                params.append(right_rowid)
+            sql += " ORDER BY r.rowid LIMIT ?"
+        params.append(limit)
+        return sql, params
+
+
+def encode_join_cursor(phase, left_rowid, right_rowid):
+    return encode_cursor_payload({"p": phase, "l": left_rowid, "r": right_rowid})
+
+
+def decode_join_cursor(cursor):
+    phase, left_rowid, right_rowid = decode_cursor_payload(cursor, p=int, l=None, r=None)
+    if phase not in (MATCHED, UNMATCHED_RIGHT):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return phase, left_rowid, right_rowid
+
+
+def fetch_join_page(conn, plan, cursor=None, limit=1000, columnar=False):
+    """
+    Return one page of a join as ``{"rows": [...], "next_cursor": ...}``
+    (or ``{"headers", "columns", "next_cursor"}`` with ``columnar``).
+    """
+    phase, left_rowid, right_rowid = decode_join_cursor(cursor) if cursor else (MATCHED, None, None)
+    phases = [MATCHED, UNMATCHED_RIGHT] if plan.includes_unmatched_right else [MATCHED]
+    if phase not in phases:
+        raise HTTPException(status_code=400, detail="Cursor does not match join type")
+
+    rows = []
+    for current in phases[phases.index(phase):]:
+        if current != phase:
+            left_rowid = right_rowid = None
+        # Fetch one extra row to know whether another page exists
+        sql, params = plan.page_query(current, left_rowid, right_rowid, limit + 1 - len(rows))
+        fetched = conn.execute(sql, params).fetchall()
+        rows.extend((current, row) for row in fetched)
+        if len(rows) > limit:
+            break
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_phase, last = rows[-1]
+        next_cursor = encode_join_cursor(last_phase, last[0], last[1])
+
+    values = [tuple(row)[2:] for _, row in rows]
+    if columnar:
+        return {"headers": plan.headers, "columns": to_columns(plan.headers, values), "next_cursor": next_cursor}
+    return {"rows": [dict(zip(plan.headers, row)) for row in values], "next_cursor": next_cursor}
+
+
+def materialize_join(conn, plan, table_name):
+    """Write the whole join into a new table, in one transaction."""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)).fetchone()
+    if exists:
+        raise HTTPException(status_code=409, detail=f"Table '{table_name}' already exists")
+
+    start = time.perf_counter()
+    table = quote_identifier(table_name)
+    columns = ", ".join(f"{quote_identifier(name)} {plan.declared[name] or ''}".strip() for name in plan.headers)
+    conn.execute("BEGIN")
+    try:
+        conn.execute(f"CREATE TABLE {table} ({columns})")
+        inserted = conn.execute(f"INSERT INTO {table} {plan.select_all()}").rowcount
+        bump_version(conn, table_name)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return {"table": table_name, "rows": inserted, "seconds": round(time.perf_counter() - start, 3)}
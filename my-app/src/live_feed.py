@@ -0,0 +1,193 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+from serializers import json_dumps
+
+logger = logging.getLogger(__name__)
+
+EVENT_STREAM_MEDIA_TYPE = "text/event-stream"
+
+
+def sse_event(data, event=None, event_id=None):
+    """Encode one Server-Sent Event; ``data`` is serialized as JSON."""
+    head = ""
+    if event_id is not None:
+        head += f"id: {event_id}\n"
+    if event is not None:
+        head += f"event: {event}\n"
+    # Compact JSON has no newlines, so it fits on one data: line
+    return head.encode() + b"data: " + json_dumps(data) + b"\n\n"
+
+
+KEEPALIVE = b": keepalive\n\n"
+
+
+class TableFeed:
+    """
+    New rows of one table, fetched and serialized once for every subscriber.
+
+    ``events`` maps the rowid a batch starts after to ``(last rowid, row
+    count, encoded event)``. Batches are contiguous, so a subscriber that
+    has seen up to rowid R reads the batch keyed R next. Only the newest
+    ``buffer_rows`` rows are kept; a subscriber that falls further behind
+    reads its own pages from the database until it catches up.
+    """
+
+    def __init__(self, table, high):
+        self.table = table
+        self.high = high            # highest rowid fetched (or present at start)
+        self.events = OrderedDict()
+        self.buffered = 0
+        self.subscribers = 0
+        self.dirty = asyncio.Event()
+        self.changed = asyncio.Condition()
+        self.task = None
+
+
+class LiveFeed:
+    """
+    Pushes rows appended to a table to Server-Sent Event subscribers.
+
+    Imports call publish() after they commit. However many subscribers a
+    table has and however many commits land while a fetch is running, one
+    task per table reads the new rows once (``rowid > high``) and encodes
+    them once, so the database sees one query per burst of commits rather
+    than one per subscriber per commit.
+
+    Subscribers pull events through an async generator. A slow client
+    therefore only holds back its own generator (the server waits for the
+    socket to drain before producing more), never the shared feed; if it
+    falls out of the ring buffer it catches up from the database one page
+    at a time, so memory per subscriber stays bounded either way.
+
+    Args:
+        fetch: ``async fetch(table, after, upto, limit)`` returning
+            ``(rows, last rowid)`` for rowids in ``(after, upto]`` (``upto``
+            None for no bound), or ``(None, None)`` if the table is gone
+        max_rowid: ``async max_rowid(table)``
+        batch_size: Rows per event
+        buffer_rows: Rows kept per table for subscribers to share
+        heartbeat: Seconds between keepalive comments on an idle stream
+    """
+
+    def __init__(self, fetch, max_rowid, batch_size=1000, buffer_rows=10000, heartbeat=15.0):
+        self.fetch = fetch
+        self.max_rowid = max_rowid
+        self.batch_size = batch_size
+        self.buffer_rows = buffer_rows
+        self.heartbeat = heartbeat
+        self._feeds = {}
+        self._loop = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+
+    async def stop(self):
+        for feed in list(self._feeds.values()):
+            if feed.task is not None:
+                feed.task.cancel()
+        self._feeds.clear()
+
+    def publish(self, table):
+        """Note that ``table`` has new rows. Safe to call from any thread."""
+        if self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._mark, table)
+
+    def _mark(self, table):
+        feed = self._feeds.get(table)
+        if feed is not None:
+            feed.dirty.set()
+
+    def stats(self):
+        return {
+            table: {"subscribers": feed.subscribers, "high": feed.high, "buffered_rows": feed.buffered}
+            for table, feed in self._feeds.items()
+        }
+
+    async def _feed(self, table):
+        feed = self._feeds.get(table)
+        if feed is None:
+            feed = TableFeed(table, await self.max_rowid(table))
+            # Another subscriber may have created it while we awaited
+            feed = self._feeds.setdefault(table, feed)
+            if feed.task is None:
+                feed.task = asyncio.ensure_future(self._run(feed))
+        return feed
+
+    async def _run(self, feed):
+        try:
+            while True:
+                await feed.dirty.wait()
+                feed.dirty.clear()
+                while True:
+                    rows, last = await self.fetch(feed.table, feed.high, None, self.batch_size)
+                    if not rows:
+                        break
+                    event = sse_event(
+                        {"table": feed.table, "rows": rows, "last_rowid": last}, event="rows", event_id=last,
+                    )
+                    feed.events[feed.high] = (last, len(rows), event)
+                    feed.buffered += len(rows)
+                    while feed.buffered > self.buffer_rows and len(feed.events) > 1:
+                        _, (_, count, _) = feed.events.popitem(last=False)
+                        feed.buffered -= count
+                    feed.high = last
+                    async with feed.changed:
+                        feed.changed.notify_all()
+                    if len(rows) < self.batch_size:
+                        break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Live feed for '{feed.table}' stopped: {e}")
+            self._feeds.pop(feed.table, None)
+            async with feed.changed:
+                feed.changed.notify_all()
+
+    async def subscribe(self, table, after=None):
+        """
+        Yield encoded SSE events for rows of ``table`` with rowid above
+        ``after`` (default: only rows appended from now on).
+        """
+        feed = await self._feed(table)
+        feed.subscribers += 1
+        position = feed.high if after is None else after
+        try:
+            yield sse_event({"table": table, "last_rowid": position}, event="ready")
+            while True:
+                if self._feeds.get(table) is not feed:
+                    return
+                cached = feed.events.get(position)
+                if cached is not None:
+                    position = cached[0]
+                    yield cached[2]
+                    continue
+                if position < feed.high:
+                    # Behind the shared buffer: page through the database up to what it holds
+                    rows, last = await self.fetch(table, position, feed.high, self.batch_size)
+                    if rows is None:
+                        return
+                    if not rows:
+                        position = feed.high
+                        continue
+                    position = last
+                    yield sse_event({"table": table, "rows": rows, "last_rowid": last}, event="rows", event_id=last)
+                    continue
+                # Never yield while holding the lock, or a slow client would stall the fetcher
+                idle = False
+                async with feed.changed:
+                    if feed.high <= position and self._feeds.get(table) is feed:
+                        try:
+                            await asyncio.wait_for(feed.changed.wait(), self.heartbeat)
+                        except asyncio.TimeoutError:
+                            idle = True
+                if idle:
+                    yield KEEPALIVE
+        finally:
+            feed.subscribers -= 1
+            if feed.subscribers == 0 and self._feeds.get(table) is feed:
+                self._feeds.pop(table)
+                if feed.task is not None:
+                    feed.task.cancel()
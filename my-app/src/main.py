@@ -1,16 +1,146 @@
+import asyncio
+import csv
 import logging
-from fastapi import FastAPI, HTTPException, Body
+import uuid
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Body, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 import sqlite3
 import os
-from typing import List, Dict
-from pydantic import BaseModel
+from typing import List, Dict, Optional
+from pydantic import BaseModel, Field
+
+from aggregates import build_aggregate_query, parse_aggregate, parse_bucket, parse_group_by, register_functions
+from compression import DEFAULT_MINIMUM_SIZE, CompressionMiddleware
+from csv_import import CsvStreamParser, RowFeed, get_progress, multipart_file_chunks, start_progress
+from db_executor import DatabaseExecutor
+from db_pool import ConnectionPool
+from downsample import MAX_POINTS, MIN_POINTS, downsample
+from expressions import ExpressionPlan, fetch_expression_page, persist_expression
+from import_jobs import FINISHED_STATES, ImportJob, JobQueue, QueueFullError
+from index_advisor import IndexAdvisor, create_index, drop_index, is_covered
+from importer import DEFAULT_CHUNK_SIZE, bulk_insert, import_records
+from joins import JoinPlan, fetch_join_page, materialize_join
+from live_feed import EVENT_STREAM_MEDIA_TYPE, LiveFeed
+from metrics import CONTENT_TYPE, POOL_CONNECTIONS, REGISTRY, ROWS_RETURNED, MetricsMiddleware
+from query_builder import (
+    MAX_PAGE_SIZE,
+    ROWID_ALIAS,
+    build_select,
+    check_order_by,
+    compile_filters,
+    fetch_page,
+    parse_columns,
+    quote_identifier,
+)
+from result_cache import ResultCache
+from schema_catalog import SchemaCatalog
+from serializers import (
+    ARROW_MEDIA_TYPE,
+    CSV_MEDIA_TYPE,
+    JSON_MEDIA_TYPE,
+    NDJSON_MEDIA_TYPE,
+    PARQUET_MEDIA_TYPE,
+    FastJSONResponse,
+    arrow_chunks,
+    csv_chunks,
+    encode_json,
+    ndjson_chunks,
+    parquet_chunks,
+    pyarrow,
+    to_columns,
+)
+from summaries import Summary, create_summary, drop_summary, find_summary, load_summaries
+from table_stats import TableStatsCache, register_sketch_function
+from table_versions import all_versions, etag_matches, is_internal_table, make_etag, table_version
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.environ.get("KPI_DB_PATH", os.path.join(script_dir, 'database_sample_data.db'))
+DB_POOL_SIZE = int(os.environ.get("KPI_DB_POOL_SIZE", "8"))
+DB_READ_WORKERS = int(os.environ.get("KPI_DB_READ_WORKERS", "4"))
+DB_POOL_TIMEOUT = float(os.environ.get("KPI_DB_POOL_TIMEOUT", "10"))
+STREAM_BATCH_SIZE = int(os.environ.get("KPI_STREAM_BATCH_SIZE", "1000"))
+COLUMNAR_BATCH_SIZE = int(os.environ.get("KPI_COLUMNAR_BATCH_SIZE", "50000"))
+IMPORT_CHUNK_SIZE = int(os.environ.get("KPI_IMPORT_CHUNK_SIZE", str(DEFAULT_CHUNK_SIZE)))
+JOB_WORKERS = int(os.environ.get("KPI_JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.environ.get("KPI_JOB_QUEUE_SIZE", "32"))
+INDEX_THRESHOLD = int(os.environ.get("KPI_INDEX_THRESHOLD", "20"))
+AUTO_INDEX = os.environ.get("KPI_AUTO_INDEX", "0") == "1"
+SCHEMA_CHECK_INTERVAL = float(os.environ.get("KPI_SCHEMA_CHECK_INTERVAL", "0"))
+COMPRESSION_MIN_SIZE = int(os.environ.get("KPI_COMPRESSION_MIN_SIZE", str(DEFAULT_MINIMUM_SIZE)))
+LIVE_BUFFER_ROWS = int(os.environ.get("KPI_LIVE_BUFFER_ROWS", "10000"))
+LIVE_HEARTBEAT = float(os.environ.get("KPI_LIVE_HEARTBEAT", "15"))
+RESULT_CACHE_TTL = float(os.environ.get("KPI_RESULT_CACHE_TTL", "5"))
+RESULT_CACHE_BYTES = int(os.environ.get("KPI_RESULT_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+# format -> (chunk encoder, media type) for the pyarrow-backed formats
+COLUMNAR_FORMATS = {
+    "arrow": (arrow_chunks, ARROW_MEDIA_TYPE),
+    "parquet": (parquet_chunks, PARQUET_MEDIA_TYPE),
+}
+
+db_pool = None
+db_executor = None
+schema_catalog = None
+job_queue = None
+index_advisor = None
+live_feed = None
+table_stats = None
+result_cache = None
+
+def prepare_connection(conn):
+    register_functions(conn)
+    register_sketch_function(conn)
+
+@asynccontextmanager
+async def lifespan(app):
+    global db_pool, db_executor, schema_catalog, job_queue, index_advisor, live_feed, table_stats, result_cache
+    stream_slots = DB_POOL_SIZE - DB_READ_WORKERS - 1
+    if stream_slots < 1:
+        raise ValueError(
+            f"KPI_DB_POOL_SIZE={DB_POOL_SIZE} leaves no connection for streaming exports after "
+            f"KPI_DB_READ_WORKERS={DB_READ_WORKERS} readers and the writer; "
+            f"set KPI_DB_POOL_SIZE to at least {DB_READ_WORKERS + 2}"
+        )
+    schema_catalog = SchemaCatalog(check_interval=SCHEMA_CHECK_INTERVAL)
+    index_advisor = IndexAdvisor(threshold=INDEX_THRESHOLD, auto_create=AUTO_INDEX)
+    table_stats = TableStatsCache()
+    result_cache = ResultCache(ttl=RESULT_CACHE_TTL, max_bytes=RESULT_CACHE_BYTES)
+    db_pool = ConnectionPool(
+        DB_PATH, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT, on_connect=prepare_connection
+    )
+    # Whatever the readers and the writer don't need is left for streams
+    db_executor = DatabaseExecutor(
+        db_pool,
+        read_workers=DB_READ_WORKERS,
+        max_streams=stream_slots,
+    )
+    logger.info(f"Opened connection pool for '{DB_PATH}' (size={DB_POOL_SIZE})")
+    job_queue = JobQueue(workers=JOB_WORKERS, max_queued=JOB_QUEUE_SIZE)
+    job_queue.start()
+    live_feed = LiveFeed(
+        fetch_live_rows, live_max_rowid,
+        batch_size=STREAM_BATCH_SIZE, buffer_rows=LIVE_BUFFER_ROWS, heartbeat=LIVE_HEARTBEAT,
+    )
+    live_feed.start()
+    try:
+        yield
+    finally:
+        # A build already on the writer thread finishes; queued ones are dropped
+        for task in list(index_tasks):
+            task.cancel()
+        await asyncio.gather(*index_tasks, return_exceptions=True)
+        await live_feed.stop()
+        await job_queue.stop()
+        db_executor.shutdown()
+        db_pool.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -19,19 +149,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
-
-def get_db_connection():
-    try:
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        db_path = os.path.join(script_dir, 'database_sample_data.db')
-        conn = sqlite3.connect(db_path, timeout=10)
-        conn.execute('PRAGMA journal_mode=WAL')
-        conn.row_factory = sqlite3.Row
-        return conn
-    except sqlite3.Error as e:
-        print(f"Database connection error: {e}")
-        raise HTTPException(status_code=500, detail=f"Database connection error: {str(e)}")
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+# Outermost, so latency and response size cover everything below it
+app.add_middleware(MetricsMiddleware)
 
 def ensure_table_exists(conn):
     cursor = conn.cursor()
@@ -46,27 +168,174 @@ def ensure_table_exists(conn):
 async def root():
     return {"message": "FastAPI server is running"}
 
+def ensure_table(conn, table):
+    # Check if the table exists; the API's own bookkeeping tables are not served
+    info = None if is_internal_table(table) else schema_catalog.table(conn, table)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Table not found")
+    return info
+
+def prepare_query(conn, table, columns=None, filters=()):
+    info = ensure_table(conn, table)
+
+    # Validate the projection and filters against the table's real columns
+    selected = parse_columns(columns, info.columns)
+    clauses, params = compile_filters(filters, info.columns)
+    return selected, clauses, params
+
+def execute_query(conn, sql, params):
+    return conn.execute(sql, params)
+
+def fetch_kpis(conn, table, limit=None, cursor=None, order_by=None, columns=None, filters=(), shape="rows"):
+    selected, clauses, params = prepare_query(conn, table, columns, filters)
+    columnar = shape == "columnar"
+
+    # Without a limit, keep returning the whole table as a plain list
+    if limit is None:
+        sql, params = build_select(table, selected, clauses, params)
+        result = conn.execute(sql, params)
+        headers = [description[0] for description in result.description]
+        rows = result.fetchall()
+        ROWS_RETURNED.labels("select").observe(len(rows))
+        if columnar:
+            return {"headers": headers, "columns": to_columns(headers, rows)}
+        return [dict(zip(headers, row)) for row in rows]
+    sortable = schema_catalog.table(conn, table).sortable
+    return fetch_page(conn, table, sortable, order_by, cursor, limit, selected, clauses, params, columnar)
+
+def table_etag(conn, table, *params):
+    ensure_table(conn, table)
+    return make_etag(table, table_version(conn, table), schema_catalog.schema_version, params)
+
+def kpis_etag(conn, table, limit, cursor, order_by, format, shape, columns, filters):
+    # Validate first, so a bad request gets no ETag or cache entry and is not counted by the advisor
+    prepare_query(conn, table, columns, filters)
+    if limit is not None:
+        check_order_by(order_by, schema_catalog.table(conn, table).sortable)
+    etag = table_etag(conn, table, limit, cursor, order_by, format, shape, columns, filters)
+    if format == "json":
+        # Counted per request rather than per query, since cached and shared reads never reach fetch_kpis
+        index_advisor.record(schema_catalog.table(conn, table), filters, order_by)
+    return etag
+
+def cache_headers(etag):
+    # no-cache makes browsers revalidate every time, which is what turns repeat fetches into 304s
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+def not_modified(etag):
+    return Response(status_code=304, headers=cache_headers(etag))
+
 @app.get("/api/kpis")
-async def read_kpis(table: str):
+async def read_kpis(
+    request: Request,
+    table: str,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    order_by: Optional[str] = None,
+    format: str = Query("json", regex="^(json|ndjson|csv|arrow|parquet)$"),
+    shape: str = Query("rows", regex="^(rows|columnar)$"),
+    columns: Optional[str] = None,
+    filters: List[str] = Query([], alias="filter"),
+):
+    """
+    Read rows from a table.
+
+    ``shape=columnar`` returns ``{"headers": [...], "columns": [[...], ...]}``
+    (plus ``next_cursor`` when paginated): the column names once and one
+    array per column, instead of repeating every name in every row.
+    ``format=arrow`` (Arrow IPC stream) and ``format=parquet`` stream the
+    same columns as typed binary data, for loading straight into pandas.
+    """
     try:
         # Sanitize the table name to prevent SQL injection
         if not table.isidentifier():
             raise HTTPException(status_code=400, detail="Invalid table name")
+        if limit is None and (cursor is not None or order_by is not None):
+            raise HTTPException(status_code=400, detail="cursor and order_by require limit")
+        if shape != "rows" and format != "json":
+            raise HTTPException(status_code=400, detail=f"shape={shape} is only available with format=json")
+        if format in COLUMNAR_FORMATS and pyarrow is None:
+            raise HTTPException(status_code=400, detail=f"format={format} requires pyarrow on the server")
+        if format != "json" and limit is not None:
+            raise HTTPException(status_code=400, detail=f"format={format} streams the whole table and cannot be paginated")
+
+        # Answer from the table's change version alone when the client is up to date
+        etag = await db_executor.read(kpis_etag, table, limit, cursor, order_by, format, shape, columns, filters)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return not_modified(etag)
+
+        if format != "json":
+            selected, clauses, params, declared = await db_executor.read(prepare_export, table, columns, filters)
+            streamed = stream_kpis(table, format, *build_select(table, selected, clauses, params), declared)
+            streamed.headers.update(cache_headers(etag))
+            return streamed
+
+        async def query():
+            return encode_json(await db_executor.read(fetch_kpis, table, limit, cursor, order_by, columns, filters, shape))
+
+        # Identical concurrent reads share one query and one encoded body; the ETag covers the version
+        body = await result_cache.get(("kpis", etag), query)
+        schedule_pending_indexes()
+        return Response(body, media_type=JSON_MEDIA_TYPE, headers=cache_headers(etag))
+    except HTTPException:
+        raise
+    except sqlite3.Error as e:
+        logger.error(f"Database query error: {e}")
+        raise HTTPException(status_code=500, detail="Database query error")
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        raise HTTPException(status_code=500, detail="Unexpected error")
+
+def fetch_aggregates(conn, table, group_by, aggregates, filters, bucket=None):
+    info = ensure_table(conn, table)
+    groups = parse_group_by(group_by, info.columns)
+    time_bucket = parse_bucket(bucket, info.columns)
+    parsed = [parse_aggregate(spec, info.columns) for spec in aggregates]
+    clauses, params = compile_filters(filters, info.columns)
+    names = groups + ([time_bucket[0]] if time_bucket else [])
+
+    # A current summary answers in time proportional to its groups, not the table
+    summary = None if filters else find_summary(conn, table, groups, bucket, aggregates)
+    if summary is not None:
+        rows = [dict(row) for row in conn.execute(summary.query(groups, bucket, aggregates, info)).fetchall()]
+        ROWS_RETURNED.labels("summary").observe(len(rows))
+        return {"group_by": names, "rows": rows, "summary": summary.name}
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
+    index_advisor.record(info, filters, group_by=groups)
+    sql, params = build_aggregate_query(table, groups, parsed, clauses, params, time_bucket)
+    rows = [dict(row) for row in conn.execute(sql, params).fetchall()]
+    ROWS_RETURNED.labels("aggregate").observe(len(rows))
+    return {"group_by": names, "rows": rows}
 
-        # Check if the table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
-        if not cursor.fetchone():
-            raise HTTPException(status_code=404, detail="Table not found")
+@app.get("/api/kpis/aggregate")
+async def aggregate_kpis(
+    request: Request,
+    table: str,
+    aggregates: List[str] = Query(..., alias="agg"),
+    group_by: Optional[str] = None,
+    filters: List[str] = Query([], alias="filter"),
+    bucket: Optional[str] = None,
+):
+    """
+    Aggregate a table inside SQLite, e.g.
+    ``?table=kpis&group_by=Application_Type&agg=mean:Latency&agg=p95:Latency&agg=count``.
 
-        # Use parameterized query to fetch data
-        query = f"SELECT * FROM {table}"
-        cursor.execute(query)
-        kpis = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in kpis]
+    ``bucket=Timestamp:hour`` (minute, hour, day or month) also groups by a
+    truncated TIMESTAMP column. Unfiltered queries a declared summary can
+    answer are served from it (see /api/summaries).
+    """
+    try:
+        if not table.isidentifier():
+            raise HTTPException(status_code=400, detail="Invalid table name")
+
+        etag = await db_executor.read(table_etag, table, "aggregate", group_by, aggregates, filters, bucket)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return not_modified(etag)
+        content = await db_executor.read(fetch_aggregates, table, group_by, aggregates, filters, bucket)
+        schedule_pending_indexes()
+        return FastJSONResponse(content, headers=cache_headers(etag))
+    except HTTPException:
+        raise
     except sqlite3.Error as e:
         logger.error(f"Database query error: {e}")
         raise HTTPException(status_code=500, detail="Database query error")
@@ -74,81 +343,423 @@ async def read_kpis(table: str):
         logger.error(f"Unexpected error: {e}")
         raise HTTPException(status_code=500, detail="Unexpected error")
 
+def fetch_downsampled(conn, table, x, y, points, method, start, end):
+    info = ensure_table(conn, table)
+    if x != "rowid":
+        index_advisor.record_key(info, [x])
+    content = downsample(conn, info, x, y, points, method, start, end, STREAM_BATCH_SIZE)
+    ROWS_RETURNED.labels("downsample").observe(len(content["columns"][0]))
+    return content
+
+@app.get("/api/kpis/downsample")
+async def downsample_kpis(
+    request: Request,
+    table: str,
+    x: str,
+    y: str,
+    points: int = Query(1000, ge=MIN_POINTS, le=MAX_POINTS),
+    method: str = Query("lttb", regex="^(lttb|minmax)$"),
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+):
+    """
+    Reduce ``y`` over ``x`` to at most ``points`` points for charting, e.g.
+    ``?table=kpis&x=Timestamp&y=Latency&points=1000``.
+
+    ``method=lttb`` (largest-triangle-three-buckets) keeps the visual shape;
+    ``minmax`` keeps every bucket's extremes. ``start``/``end`` limit the x
+    range. Rows are read once in x order, so an index on ``x`` makes this a
+    range scan; repeated use queues one through the index advisor.
+    """
+    try:
+        if not table.isidentifier():
+            raise HTTPException(status_code=400, detail="Invalid table name")
+
+        etag = await db_executor.read(table_etag, table, "downsample", x, y, points, method, start, end)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return not_modified(etag)
+        content = await db_executor.read(fetch_downsampled, table, x, y, points, method, start, end)
+        schedule_pending_indexes()
+        return FastJSONResponse(content, headers=cache_headers(etag))
+    except HTTPException:
+        raise
+    except sqlite3.Error as e:
+        logger.error(f"Database query error: {e}")
+        raise HTTPException(status_code=500, detail="Database query error")
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        raise HTTPException(status_code=500, detail="Unexpected error")
+
+class SummaryRequest(BaseModel):
+    name: str
+    table: str
+    group_by: List[str] = []
+    bucket: Optional[str] = None
+    aggregates: List[str]
+
+def add_summary(conn, request):
+    info = ensure_table(conn, request.table)
+    summary = Summary(request.name, request.table, request.group_by, request.bucket, request.aggregates)
+    return create_summary(conn, summary, info)
+
+def list_summaries(conn, table=None):
+    return {"summaries": [summary.to_dict() for summary in load_summaries(conn, table)]}
+
+@app.post("/api/summaries")
+async def declare_summary(summary: SummaryRequest):
+    """
+    Declare a materialized summary, e.g. ``{"name": "latency_hourly", "table":
+    "kpis", "group_by": ["Application_Type"], "bucket": "Timestamp:hour",
+    "aggregates": ["mean:Latency", "sum:Allocated_Bandwidth"]}``.
+
+    It is built from the current rows, then kept up to date by every import
+    into the table, and /api/kpis/aggregate answers matching queries from it.
+    """
+    try:
+        for name in (summary.name, summary.table):
+            if not name.isidentifier():
+                raise HTTPException(status_code=400, detail="Invalid name")
+        result = await db_executor.write(add_summary, summary)
+        logger.info(f"Declared summary {summary.name} over {summary.table}")
+        return result
+    except HTTPException:
+        raise
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+        raise HTTPException(status_code=500, detail="Database error")
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        raise HTTPException(status_code=500, detail="Unexpected error")
+
+@app.get("/api/summaries")
+async def get_summaries(table: Optional[str] = None):
+    try:
+        return await db_executor.read(list_summaries, table)
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+        raise HTTPException(status_code=500, detail="Database error")
+
+@app.delete("/api/summaries/{name}")
+async def delete_summary(name: str):
+    try:
+        return await db_executor.write(drop_summary, name)
+    except HTTPException:
+        raise
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+        raise HTTPException(status_code=500, detail="Database error")
+
+def prepare_export(conn, table, columns=None, filters=()):
+    selected, clauses, params = prepare_query(conn, table, columns, filters)
+    info = ensure_table(conn, table)
+    index_advisor.record(info, filters)
+    return selected, clauses, params, info.columns
+
+def add_index(conn, table, columns, name=None, unique=False):
+    info = ensure_table(conn, table)
+    unknown = [column for column in columns if column not in info.columns]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(unknown)}")
+    try:
+        return create_index(conn, table, columns, name, unique)
+    finally:
+        schema_catalog.invalidate()
+
+def remove_index(conn, table, name):
+    info = ensure_table(conn, table)
+    try:
+        result = drop_index(conn, table, name, info.indexes.get(name, []))
+    finally:
+        schema_catalog.invalidate()
+    index_advisor.forget(table, result["columns"])
+    return result
+
+async def auto_create_index(table, columns):
+    try:
+        result = await db_executor.write(add_index, table, list(columns))
+        logger.info(f"Auto-created index {result['name']}: probe {result['probe']}")
+    except HTTPException as e:
+        logger.info(f"Skipped automatic index on '{table}' {columns}: {e.detail}")
+    except Exception as e:
+        logger.error(f"Automatic index on '{table}' {columns} failed: {e}")
+
+# Running automatic index builds; the loop only keeps weak references to tasks
+index_tasks = set()
+
+def schedule_pending_indexes():
+    # Build indexes the advisor queued on the writer thread, after the response is sent
+    for table, columns in index_advisor.take_pending():
+        task = asyncio.ensure_future(auto_create_index(table, columns))
+        index_tasks.add(task)
+        task.add_done_callback(index_tasks.discard)
+
+def stream_kpis(table, format, sql, params, declared):
+    if format in COLUMNAR_FORMATS:
+        # Columnar encoders work best on large batches
+        batches = db_executor.stream(execute_query, sql, params, batch_size=COLUMNAR_BATCH_SIZE)
+        chunks, media_type = COLUMNAR_FORMATS[format]
+        return StreamingResponse(
+            chunks(batches, declared),
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="{table}.{format}"'},
+        )
+
+    batches = db_executor.stream(execute_query, sql, params, batch_size=STREAM_BATCH_SIZE)
+    if format == "csv":
+        return StreamingResponse(
+            csv_chunks(batches),
+            media_type=CSV_MEDIA_TYPE,
+            headers={"Content-Disposition": f'attachment; filename="{table}.csv"'},
+        )
+    return StreamingResponse(ndjson_chunks(batches), media_type=NDJSON_MEDIA_TYPE)
+
+def note_table_import(conn, table_name, base_version, stats):
+    # Only bookkeeping on the writer; the stats are rescanned when /api/tables?stats=1 asks for them
+    table_stats.note_import(table_name, base_version, table_version(conn, table_name), not stats.get("updated"))
+
+def insert_records(conn, table_name, data, chunk_size, progress=None, keys=None):
+    info = schema_catalog.table(conn, table_name)
+    base_version = table_version(conn, table_name)
+    try:
+        stats = import_records(
+            conn, table_name, data, chunk_size, existing=info and info.columns, progress=progress, keys=keys,
+        )
+    finally:
+        schema_catalog.invalidate()
+    note_table_import(conn, table_name, base_version, stats)
+    live_feed.publish(table_name)
+    return stats
+
+def insert_rows(conn, table_name, columns, rows, chunk_size, progress=None, keys=None):
+    info = schema_catalog.table(conn, table_name)
+    base_version = table_version(conn, table_name)
+    try:
+        stats = bulk_insert(conn, table_name, columns, rows, chunk_size, progress, existing=info and info.columns, keys=keys)
+    finally:
+        schema_catalog.invalidate()
+    note_table_import(conn, table_name, base_version, stats)
+    live_feed.publish(table_name)
+    return stats
+
 class ImportData(BaseModel):
     data: List[Dict]
     table_name: str
+    chunk_size: Optional[int] = None
+    background: bool = False
+    keys: Optional[List[str]] = None
 
 @app.post("/api/import_kpis")
-async def import_kpis(import_data: ImportData):
-    conn = None
+async def import_kpis(import_data: ImportData, response: Response):
+    """
+    Import rows into a table, creating it if needed.
+
+    With ``background`` set the import is queued as a job instead: the
+    response (202) carries a job id right away, and progress is polled at
+    /api/jobs/{job_id}. With ``keys`` (e.g. ``["Timestamp", "User_ID"]``)
+    rows whose key already exists update that row instead of being
+    appended, so re-importing a corrected file is idempotent.
+    """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         data = import_data.data
         table_name = import_data.table_name
+        chunk_size = import_data.chunk_size or IMPORT_CHUNK_SIZE
 
         logger.info(f"Attempting to import {len(data)} rows into table '{table_name}'")
 
+        if not table_name.isidentifier():
+            raise HTTPException(status_code=400, detail="Invalid table name")
         if not data:
             raise HTTPException(status_code=400, detail="No data provided for import")
+        if chunk_size < 1:
+            raise HTTPException(status_code=400, detail="chunk_size must be positive")
+        keys = import_data.keys or None
+        if keys:
+            missing = [key for key in keys if key not in data[0]]
+            if missing:
+                raise HTTPException(status_code=400, detail=f"Unknown key columns: {', '.join(missing)}")
 
-        # Dynamically create or alter the table based on the first row of data
-        columns = list(data[0].keys())
-        create_table_query = f"""
-        CREATE TABLE IF NOT EXISTS {table_name} (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            {', '.join(f'"{col}" TEXT' for col in columns)}
-        )
-        """
-        cursor.execute(create_table_query)
-        logger.info(f"Table '{table_name}' created or already exists")
-
-        # Check for new columns and add them if necessary
-        existing_columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table_name})")]
-        for col in columns:
-            if col not in existing_columns:
-                cursor.execute(f'ALTER TABLE {table_name} ADD COLUMN "{col}" TEXT')
-                logger.info(f"Added new column '{col}' to table '{table_name}'")
-
-        # Prepare the insert query
-        insert_columns = ', '.join(f'"{col}"' for col in columns)
-        placeholders = ', '.join('?' for _ in columns)
-        insert_query = f'INSERT INTO {table_name} ({insert_columns}) VALUES ({placeholders})'
-
-        # Insert data
-        for row in data:
-            values = [row.get(col, None) for col in columns]
-            try:
-                cursor.execute(insert_query, values)
-            except sqlite3.Error as e:
-                logger.error(f"Error inserting row: {row}")
-                logger.error(f"SQLite error: {e}")
-                raise HTTPException(status_code=500, detail=f"Error inserting data: {str(e)}")
-
-        conn.commit()
-        return {"message": f"Successfully imported {len(data)} rows into table {table_name}"}
+        if import_data.background:
+            job = ImportJob(table_name, rows_total=len(data))
+
+            def run(job):
+                return db_executor.write(insert_records, table_name, data, chunk_size, job.on_chunk, keys)
+
+            job_queue.submit(job, run)
+            logger.info(f"Queued import job {job.job_id} for table '{table_name}'")
+            response.status_code = 202
+            return {"message": f"Import of {len(data)} rows into table {table_name} queued", **job.to_dict()}
+
+        stats = await db_executor.write(insert_records, table_name, data, chunk_size, None, keys)
+        return {"message": f"Successfully imported {len(data)} rows into table {table_name}", **stats}
+    except HTTPException:
+        raise
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except sqlite3.IntegrityError as e:
+        # Existing rows repeat a key, so the unique index cannot be created
+        logger.error(f"Integrity error: {e}")
+        raise HTTPException(status_code=409, detail=f"Key columns are not unique: {str(e)}")
     except sqlite3.Error as e:
         logger.error(f"Database error: {e}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
+
+@app.get("/api/jobs")
+async def list_jobs():
+    return [job.to_dict() for job in job_queue.jobs()]
+
+@app.get("/api/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a job; a running import rolls back at its next chunk boundary."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status in FINISHED_STATES:
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+    job_queue.cancel(job_id)
+    return job.to_dict()
+
+def normalize_csv_row(record, width):
+    # Pad short rows, drop extra trailing fields and store empty fields as NULL
+    record = record[:width] + [None] * (width - len(record))
+    return tuple(value if value != "" else None for value in record)
+
+@app.post("/api/import_csv")
+async def import_csv(
+    request: Request,
+    table: str,
+    chunk_size: Optional[int] = Query(None, ge=1),
+    import_id: Optional[str] = None,
+    keys: Optional[str] = None,
+):
+    """
+    Import a CSV upload while it is still arriving.
+
+    The body is either raw CSV or multipart/form-data (the first part is the
+    file). Bytes are parsed as they come in, the header row defines the
+    columns, and parsed rows are handed to the writer thread through a
+    bounded queue, so neither the payload nor the parsed rows are ever held
+    in memory in full. Progress can be polled at /api/import_csv/{import_id}.
+    ``keys=Timestamp,User_ID`` upserts on those columns like /api/import_kpis.
+    """
+    if not table.isidentifier():
+        raise HTTPException(status_code=400, detail="Invalid table name")
+    key_columns = [key.strip() for key in keys.split(",") if key.strip()] if keys else None
+
+    loop = asyncio.get_running_loop()
+    progress = start_progress(import_id or uuid.uuid4().hex, table)
+    parser = CsvStreamParser()
+    feed = RowFeed()
+    columns = None
+    write = None
+
+    async def push(records):
+        nonlocal columns, write
+        if columns is None and records:
+            columns = [name.strip() for name in records.pop(0)]
+            if not all(columns) or len({name.lower() for name in columns}) != len(columns):
+                raise ValueError("CSV header must have unique, non-empty column names")
+            logger.info(f"Streaming CSV import into '{table}' with columns {columns}")
+            write = asyncio.ensure_future(db_executor.write(
+                insert_rows, table, columns, feed, chunk_size or IMPORT_CHUNK_SIZE, progress.on_chunk, key_columns
+            ))
+        if records:
+            rows = [normalize_csv_row(record, len(columns)) for record in records]
+            progress.rows_received += len(rows)
+            if not await loop.run_in_executor(None, feed.put, rows):
+                # The writer stopped early; awaiting it surfaces its error
+                await write
+
+    async def run():
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            body = multipart_file_chunks(request)
+        else:
+            body = request.stream()
+        async for data in body:
+            progress.bytes_received += len(data)
+            await push(parser.feed(data))
+        await push(parser.close())
+
+        if write is None:
+            raise ValueError("CSV upload has no header row")
+        await loop.run_in_executor(None, feed.finish)
+        return await write
+
+    try:
+        try:
+            stats = await run()
+        except BaseException as e:
+            progress.done(error=str(e) or type(e).__name__)
+            if write is not None and not write.done():
+                # Make the writer raise so the partial transaction rolls back
+                await loop.run_in_executor(None, feed.finish, RuntimeError("CSV upload aborted"))
+                await asyncio.gather(write, return_exceptions=True)
+            raise
+        progress.done()
+        return {
+            "message": f"Successfully imported {stats['rows']} rows into table {table}",
+            "import_id": progress.import_id,
+            **stats,
+        }
+    except HTTPException:
+        raise
+    except (ValueError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid CSV: {str(e)}")
+    except sqlite3.IntegrityError as e:
+        logger.error(f"Integrity error: {e}")
+        raise HTTPException(status_code=409, detail=f"Key columns are not unique: {str(e)}")
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+@app.get("/api/import_csv/{import_id}")
+async def import_csv_progress(import_id: str):
+    progress = get_progress(import_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return progress.to_dict()
+
+def fetch_table_names(conn):
+    names = [name for name in schema_catalog.tables(conn) if not is_internal_table(name)]
+    return names, make_etag("tables", schema_catalog.schema_version)
+
+def fetch_table_stats(conn):
+    """Per-table stats from the cache; only tables changed since it was filled are scanned."""
+    names, _ = fetch_table_names(conn)
+    schema_version = schema_catalog.schema_version
+    versions = all_versions(conn)
+    etag = make_etag("table-stats", schema_version, sorted((name, versions.get(name, 0)) for name in names))
+    tables = [table_stats.get(conn, schema_catalog.table(conn, name), schema_version).to_dict() for name in names]
+    return tables, etag
 
 @app.get("/api/tables")
-async def list_tables():
+async def list_tables(request: Request, response: Response, stats: bool = False):
     logger.info("Received request to list tables")  # Log the request
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        conn.close()
-        table_names = [table['name'] for table in tables]
+        if stats:
+            tables, etag = await db_executor.read(fetch_table_stats)
+            if etag_matches(request.headers.get("if-none-match"), etag):
+                return not_modified(etag)
+            return FastJSONResponse(tables, headers=cache_headers(etag))
+        table_names, etag = await db_executor.read(fetch_table_names)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return not_modified(etag)
         logger.info(f"Tables found: {table_names}")  # Log the tables found
+        response.headers.update(cache_headers(etag))
         return table_names
     except sqlite3.Error as e:
         logger.error(f"Database error: {e}")
@@ -157,6 +768,284 @@ async def list_tables():
         logger.error(f"Unexpected error: {e}")
         raise HTTPException(status_code=500, detail="Unexpected error")
 
+class JoinRequest(BaseModel):
+    # Same field names as the client's JoinConfig
+    leftTable: str
+    rightTable: str
+    leftColumn: str
+    rightColumn: str
+    type: str = Field("inner", regex="^(inner|left|right|full)$")
+    limit: int = Field(1000, ge=1, le=MAX_PAGE_SIZE)
+    cursor: Optional[str] = None
+    format: str = Field("json", regex="^(json|ndjson|csv|arrow|parquet)$")
+    shape: str = Field("rows", regex="^(rows|columnar)$")
+    into: Optional[str] = None
+
+def plan_join(conn, join):
+    plan = JoinPlan(
+        ensure_table(conn, join.leftTable), ensure_table(conn, join.rightTable),
+        join.leftColumn, join.rightColumn, join.type,
+    )
+    for info, column in plan.probed_columns():
+        index_advisor.record_key(info, [column])
+    return plan
+
+def fetch_join(conn, join):
+    plan = plan_join(conn, join)
+    page = fetch_join_page(conn, plan, join.cursor, join.limit, join.shape == "columnar")
+    # Without an index every probe is a full scan of the other table
+    missing = [(info.name, column) for info, column in plan.probed_columns() if not is_covered((column,), info)]
+    if missing:
+        page["suggested_indexes"] = [{"table": table, "columns": [column]} for table, column in missing]
+    return page
+
+def prepare_join_export(conn, join):
+    plan = plan_join(conn, join)
+    return plan.select_all(), plan.declared
+
+def create_join_table(conn, join):
+    try:
+        return materialize_join(conn, plan_join(conn, join), join.into)
+    finally:
+        schema_catalog.invalidate()
+
+@app.post("/api/join")
+async def join_tables(join: JoinRequest):
+    """
+    Join two tables in SQLite using the client's JoinConfig shape.
+
+    By default one page of ``limit`` rows is returned with a ``next_cursor``
+    to pass back for the next page. ``format=ndjson|csv|arrow|parquet``
+    streams the whole result instead, and ``into`` writes it to a new table.
+    Probed join columns count towards the index advisor like filter columns
+    (and are only indexed automatically with KPI_AUTO_INDEX=1); pages list
+    the ones still unindexed under ``suggested_indexes``.
+    """
+    try:
+        for name in (join.leftTable, join.rightTable):
+            if not name.isidentifier():
+                raise HTTPException(status_code=400, detail="Invalid table name")
+        if join.format in COLUMNAR_FORMATS and pyarrow is None:
+            raise HTTPException(status_code=400, detail=f"format={join.format} requires pyarrow on the server")
+
+        if join.into is not None:
+            if not join.into.isidentifier():
+                raise HTTPException(status_code=400, detail="Invalid table name")
+            result = await db_executor.write(create_join_table, join)
+            schedule_pending_indexes()
+            return {"message": f"Created table {join.into} with {result['rows']} joined rows", **result}
+
+        if join.format != "json":
+            sql, declared = await db_executor.read(prepare_join_export, join)
+            name = f"{join.leftTable}_{join.rightTable}_join"
+            schedule_pending_indexes()
+            return stream_kpis(name, join.format, sql, [], declared)
+
+        content = await db_executor.read(fetch_join, join)
+        schedule_pending_indexes()
+        return FastJSONResponse(content)
+    except HTTPException:
+        raise
+    except sqlite3.Error as e:
+        logger.error(f"Database query error: {e}")
+        raise HTTPException(status_code=500, detail="Database query error")
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        raise HTTPException(status_code=500, detail="Unexpected error")
+
+class ExpressionRequest(BaseModel):
+    # Same field names as the client's Expression
+    name: str = Field(..., min_length=1)
+    expression: str = ""
+    sourceTable: str
+    sourceColumn: str
+    operation: str = Field(..., regex="^(add|subtract|multiply|divide|concat|custom)$")
+    targetTable: str
+    targetColumn: str
+    persist: bool = False
+    limit: int = Field(1000, ge=1, le=MAX_PAGE_SIZE)
+    cursor: Optional[str] = None
+    shape: str = Field("rows", regex="^(rows|columnar)$")
+
+def plan_expression(conn, expr):
+    return ExpressionPlan(
+        ensure_table(conn, expr.sourceTable), ensure_table(conn, expr.targetTable),
+        expr.sourceColumn, expr.targetColumn, expr.operation, expr.name, expr.expression,
+    )
+
+def fetch_expression(conn, expr):
+    return fetch_expression_page(conn, plan_expression(conn, expr), expr.cursor, expr.limit, expr.shape == "columnar")
+
+def add_expression_column(conn, expr):
+    try:
+        return persist_expression(conn, plan_expression(conn, expr))
+    finally:
+        schema_catalog.invalidate()
+
+@app.post("/api/expression")
+async def evaluate_expression(expr: ExpressionRequest):
+    """
+    Evaluate the client's Expression model over database tables.
+
+    Built-in operations between numeric columns of one table run as a
+    single SQL expression; other cases are computed with NumPy one batch
+    of rows at a time. Custom expressions use ``x`` (source column), ``y``
+    (target column) and ``[Column]`` references. A page of source rows with
+    the result appended is returned, or with ``persist`` the result is
+    stored as a new column of the source table.
+    """
+    try:
+        for name in (expr.sourceTable, expr.targetTable):
+            if not name.isidentifier():
+                raise HTTPException(status_code=400, detail="Invalid table name")
+
+        if expr.persist:
+            result = await db_executor.write(add_expression_column, expr)
+            logger.info(f"Added column {expr.name} to {expr.sourceTable} ({result['rows']} rows, {result['engine']})")
+            return {"message": f"Added column {expr.name} to {expr.sourceTable}", **result}
+
+        content = await db_executor.read(fetch_expression, expr)
+        return FastJSONResponse(content)
+    except HTTPException:
+        raise
+    except sqlite3.Error as e:
+        logger.error(f"Database query error: {e}")
+        raise HTTPException(status_code=500, detail="Database query error")
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        raise HTTPException(status_code=500, detail="Unexpected error")
+
+def fetch_indexes(conn, table):
+    info = ensure_table(conn, table)
+    return {
+        "indexes": [{"name": name, "columns": columns} for name, columns in info.indexes.items()],
+        "suggestions": index_advisor.suggestions(info),
+        "usage": index_advisor.usage(table),
+        "threshold": index_advisor.threshold,
+        "auto_create": index_advisor.auto_create,
+    }
+
+class IndexRequest(BaseModel):
+    columns: List[str]
+    name: Optional[str] = None
+    unique: bool = False
+
+@app.get("/api/tables/{table}/indexes")
+async def list_indexes(table: str):
+    """List a table's indexes along with the advisor's suggestions and per-column usage."""
+    try:
+        if not table.isidentifier():
+            raise HTTPException(status_code=400, detail="Invalid table name")
+        return await db_executor.read(fetch_indexes, table)
+    except HTTPException:
+        raise
+    except sqlite3.Error as e:
+        logger.error(f"Database query error: {e}")
+        raise HTTPException(status_code=500, detail="Database query error")
+
+@app.post("/api/tables/{table}/indexes")
+async def create_table_index(table: str, index: IndexRequest):
+    """Create an index; the response has the build time and the plan of a lookup on its columns."""
+    try:
+        if not table.isidentifier():
+            raise HTTPException(status_code=400, detail="Invalid table name")
+        if not index.columns or len(set(index.columns)) != len(index.columns):
+            raise HTTPException(status_code=400, detail="columns must be a non-empty list of distinct columns")
+        if index.name is not None and not index.name.isidentifier():
+            raise HTTPException(status_code=400, detail="Invalid index name")
+        return await db_executor.write(add_index, table, index.columns, index.name, index.unique)
+    except HTTPException:
+        raise
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+@app.delete("/api/tables/{table}/indexes/{name}")
+async def drop_table_index(table: str, name: str):
+    try:
+        if not table.isidentifier():
+            raise HTTPException(status_code=400, detail="Invalid table name")
+        return await db_executor.write(remove_index, table, name)
+    except HTTPException:
+        raise
+    except sqlite3.Error as e:
+        logger.error(f"Database error: {e}")
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+def rows_after(conn, table, after, upto, limit):
+    info = schema_catalog.table(conn, table)
+    if info is None:
+        return None, None
+    sql = f"SELECT rowid AS {ROWID_ALIAS}, * FROM {quote_identifier(table)} WHERE rowid > ?"
+    params = [after]
+    if upto is not None:
+        sql += " AND rowid <= ?"
+        params.append(upto)
+    result = conn.execute(sql + " ORDER BY rowid LIMIT ?", params + [limit])
+    keys = [description[0] for description in result.description[1:]]
+    rows = result.fetchall()
+    ROWS_RETURNED.labels("live").observe(len(rows))
+    return [dict(zip(keys, tuple(row)[1:])) for row in rows], rows[-1][0] if rows else after
+
+def max_rowid(conn, table):
+    ensure_table(conn, table)
+    return conn.execute(f"SELECT MAX(rowid) FROM {quote_identifier(table)}").fetchone()[0] or 0
+
+async def fetch_live_rows(table, after, upto, limit):
+    return await db_executor.read(rows_after, table, after, upto, limit)
+
+async def live_max_rowid(table):
+    return await db_executor.read(max_rowid, table)
+
+@app.get("/api/kpis/live")
+async def live_kpis(request: Request, table: str, after: Optional[int] = None):
+    """
+    Server-Sent Events feed of rows appended to ``table``.
+
+    Each ``rows`` event carries the rows with rowid above the last one sent
+    and has that rowid as its id, so a reconnecting EventSource resumes
+    from Last-Event-ID. ``after`` starts from a given rowid (0 replays the
+    table); by default only rows imported from now on are sent.
+    """
+    try:
+        if not table.isidentifier():
+            raise HTTPException(status_code=400, detail="Invalid table name")
+        last_event_id = request.headers.get("last-event-id")
+        if after is None and last_event_id and last_event_id.isdigit():
+            after = int(last_event_id)
+        await db_executor.read(ensure_table, table)
+        return StreamingResponse(
+            live_feed.subscribe(table, after),
+            media_type=EVENT_STREAM_MEDIA_TYPE,
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    except HTTPException:
+        raise
+    except sqlite3.Error as e:
+        logger.error(f"Database query error: {e}")
+        raise HTTPException(status_code=500, detail="Database query error")
+
+@app.get("/api/kpis/live/stats")
+async def live_stats():
+    return live_feed.stats()
+
+@app.get("/api/pool")
+async def pool_stats():
+    return db_pool.stats()
+
+def collect_pool_metrics():
+    if db_pool is not None:
+        stats = db_pool.stats()
+        for state in ("idle", "in_use"):
+            POOL_CONNECTIONS.labels(state).set(stats[state])
+
+REGISTRY.add_collector(collect_pool_metrics)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics in the text exposition format."""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8001, reload=True)
@@ -0,0 +1,254 @@
+import base64
+import json
+import math
+import re
+
+from fastapi import HTTPException
+
+from column_types import TIMESTAMP, column_affinity, declared_to_type, normalize_timestamp
+from metrics import ROWS_RETURNED
+from serializers import to_columns
+
+ROWID_ALIAS = "__rowid__"
+ORDER_ALIAS = "__order__"
+MAX_PAGE_SIZE = 10000
+MAX_FILTERS = 20
+
+# column, operator, value -- e.g. "Latency>30", "Application_Type=Gaming"
+FILTER_PATTERN = re.compile(r"^\s*([^<>=!]+?)\s*(>=|<=|!=|=|>|<)\s*(.*?)\s*$")
+RANGE_SEPARATOR = ".."
+
+
+def quote_identifier(name):
+    """Quote a table or column name for safe interpolation into SQL."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def parse_columns(columns, available):
+    """Validate a comma-separated projection; ``None`` means every column."""
+    if not columns:
+        return None
+    selected = [name.strip() for name in columns.split(",") if name.strip()]
+    unknown = [name for name in selected if name not in available]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(unknown)}")
+    return selected
+
+
+def _parse_value(raw):
+    for convert in (int, float):
+        try:
+            value = convert(raw)
+        except ValueError:
+            continue
+        # float() accepts "nan" and "inf", which would bind a NaN that no comparison matches
+        if math.isfinite(value):
+            return value
+    return raw
+
+
+def parse_filter(expression, available):
+    """
+    Parse one filter expression into ``(column, operator, values)``.
+
+    Supported forms are ``col=value``, ``col!=value``, ``col>value``,
+    ``col>=value``, ``col<value``, ``col<=value`` and the inclusive range
+    ``col=low..high``. Values that look like numbers are compared as numbers.
+    """
+    match = FILTER_PATTERN.match(expression)
+    if not match:
+        raise HTTPException(status_code=400, detail=f"Invalid filter: {expression}")
+    column, operator, raw = match.groups()
+    if column not in available:
+        raise HTTPException(status_code=400, detail=f"Unknown filter column: {column}")
+
+    if operator == "=" and RANGE_SEPARATOR in raw:
+        low, high = raw.split(RANGE_SEPARATOR, 1)
+        return column, "BETWEEN", [_parse_value(low.strip()), _parse_value(high.strip())]
+    return column, operator, [_parse_value(raw)]
+
+
+def compile_filters(filters, available):
+    """
+    Compile filter expressions into a parameterized WHERE fragment.
+
+    Column names come only from the validated column list and values are
+    always bound as parameters. Numeric values against a column without
+    numeric affinity (the TEXT columns created by imports) compare through
+    ``CAST(... AS REAL)`` so that ``Latency>30`` is not a string comparison.
+    Values for TIMESTAMP columns are normalized to ISO-8601 first.
+
+    Returns:
+        (clauses, params) where clauses is a list of SQL conditions to AND
+    """
+    if len(filters) > MAX_FILTERS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_FILTERS} filters are allowed")
+
+    clauses, params = [], []
+    for expression in filters:
+        column, operator, values = parse_filter(expression, available)
+        if declared_to_type(available[column]) == TIMESTAMP:
+            # TIMESTAMP columns hold ISO-8601 text; accept any format imports accept
+            values = [normalize_timestamp(str(value)) or value for value in values]
+        target = quote_identifier(column)
+        numeric = all(isinstance(value, (int, float)) for value in values)
+        if numeric and column_affinity(available[column]) in ("TEXT", "BLOB"):
+            target = f"CAST({target} AS REAL)"
+
+        if operator == "BETWEEN":
+            clauses.append(f"{target} BETWEEN ? AND ?")
+        else:
+            clauses.append(f"{target} {operator} ?")
+        params.extend(values)
+    return clauses, params
+
+
+def select_list(columns):
+    if columns is None:
+        return "*"
+    return ", ".join(quote_identifier(name) for name in columns)
+
+
+def build_select(table, columns=None, clauses=(), params=()):
+    """Build a plain (unpaginated) SELECT with optional projection and filters."""
+    sql = f"SELECT {select_list(columns)} FROM {quote_identifier(table)}"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    return sql, list(params)
+
+
+def encode_cursor_payload(payload):
+    """Encode a cursor's fields as an opaque URL-safe token."""
+    data = json.dumps(payload, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor_payload(cursor, **fields):
+    """
+    Decode a token from encode_cursor_payload().
+
+    ``fields`` maps each expected key to a converter (None keeps the value
+    as is); their values are returned in that order. Malformed tokens are a
+    400, never a 500.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return [payload[key] if convert is None else convert(payload[key]) for key, convert in fields.items()]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def encode_cursor(order_by, value, rowid):
+    return encode_cursor_payload({"o": order_by, "v": value, "r": rowid})
+
+
+def decode_cursor(cursor, order_by):
+    cursor_order, value, rowid = decode_cursor_payload(cursor, o=None, v=None, r=int)
+    if cursor_order != order_by:
+        raise HTTPException(status_code=400, detail="Cursor does not match order_by")
+    return value, rowid
+
+
+def parse_order_by(order_by):
+    """Split ``-col`` into ``("col", True)``; the leading dash means descending."""
+    if not order_by:
+        return "rowid", False
+    if order_by.startswith("-"):
+        return order_by[1:], True
+    return order_by, False
+
+
+def build_page_query(table, order_by, cursor, limit, columns=None, clauses=(), params=()):
+    """
+    Build a keyset-paginated SELECT.
+
+    Rows are ordered by ``(order column, rowid)`` so pages are stable even
+    when the order column has duplicates. The cursor carries the last
+    row's sort value and rowid, and the next page starts strictly after
+    it, so the cost of a page does not grow with its position the way
+    OFFSET does. NULLs sort first ascending and last descending, which
+    matches SQLite's own ordering.
+
+    Returns:
+        (sql, params) fetching up to ``limit + 1`` rows; the extra row only
+        tells the caller whether another page exists.
+    """
+    column, descending = parse_order_by(order_by)
+    by_rowid = column == "rowid"
+    col = "rowid" if by_rowid else quote_identifier(column)
+    direction = "DESC" if descending else "ASC"
+    cmp = "<" if descending else ">"
+
+    clauses, params = list(clauses), list(params)
+    if cursor is not None:
+        value, rowid = decode_cursor(cursor, order_by or "rowid")
+        if by_rowid:
+            clauses.append(f"rowid {cmp} ?")
+            params.append(rowid)
+        elif value is None:
+            # NULLs come first ascending and last descending
+            if descending:
+                clauses.append(f"{col} IS NULL AND rowid < ?")
+            else:
+                clauses.append(f"(({col} IS NULL AND rowid > ?) OR {col} IS NOT NULL)")
+            params.append(rowid)
+        else:
+            keyset = f"{col} {cmp} ? OR ({col} = ? AND rowid {cmp} ?)"
+            if descending:
+                keyset += f" OR {col} IS NULL"
+            clauses.append(f"({keyset})")
+            params.extend([value, value, rowid])
+
+    hidden = f"rowid AS {ROWID_ALIAS}"
+    if not by_rowid:
+        hidden += f", {col} AS {ORDER_ALIAS}"
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    order = f"rowid {direction}" if by_rowid else f"{col} {direction}, rowid {direction}"
+    sql = (
+        f"SELECT {hidden}, {select_list(columns)} FROM {quote_identifier(table)}"
+        f"{where} ORDER BY {order} LIMIT ?"
+    )
+    params.append(limit + 1)
+    return sql, params
+
+
+def check_order_by(order_by, sortable):
+    """Raise a 400 unless ``order_by`` names a column in ``sortable``; returns the column."""
+    column, _ = parse_order_by(order_by)
+    if column not in sortable:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot order by '{column}': only rowid and indexed columns are supported",
+        )
+    return column
+
+
+def fetch_page(conn, table, sortable, order_by, cursor, limit, columns=None, clauses=(), params=(), columnar=False):
+    """
+    Run a page query and return ``{"rows": [...], "next_cursor": ...}``.
+
+    ``sortable`` is the set of columns the table can be ordered by
+    (see TableInfo.sortable). With ``columnar`` the page is returned as
+    ``{"headers": [...], "columns": [[...], ...], "next_cursor": ...}``
+    instead, one list per column.
+    """
+    column = check_order_by(order_by, sortable)
+    sql, params = build_page_query(table, order_by, cursor, limit, columns, clauses, params)
+    result = conn.execute(sql, params)
+    rows = result.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        value = None if column == "rowid" else last[ORDER_ALIAS]
+        next_cursor = encode_cursor(order_by or "rowid", value, last[ROWID_ALIAS])
+
+    ROWS_RETURNED.labels("page").observe(len(rows))
+    hidden = 1 if column == "rowid" else 2
+    keys = [description[0] for description in result.description[hidden:]]
+    values = [tuple(row)[hidden:] for row in rows]
+    if columnar:
+        return {"headers": keys, "columns": to_columns(keys, values), "next_cursor": next_cursor}
+    return {"rows": [dict(zip(keys, row)) for row in values], "next_cursor": next_cursor}
@@ -0,0 +1,85 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from metrics import RESULT_CACHE_REQUESTS
+
+
+class ResultCache:
+    """
+    Single-flight execution plus a short-lived cache of encoded responses.
+
+    Keys are ETags, which already cover the table, its change version, the
+    schema version and every query parameter, so an import makes the old
+    entries unreachable rather than stale. Identical requests that arrive
+    while one is running await that one execution and get the same encoded
+    buffer; finished buffers are kept for ``ttl`` seconds. The TTL only
+    bounds how long writes made outside the API (which leave the version
+    alone) can go unnoticed, and how long memory is held.
+
+    The shared execution runs as its own task, so a client that disconnects
+    does not cancel it for the others waiting on it. Failures are shared
+    with the requests already waiting but never cached.
+
+    Args:
+        ttl: Seconds a finished result is served from memory; 0 only coalesces
+        max_entries: Results kept at most, least recently used evicted first
+        max_bytes: Total bytes of results kept; larger results are shared
+            while in flight but not kept
+    """
+
+    def __init__(self, ttl=5.0, max_entries=128, max_bytes=64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> (expires, body)
+        self._inflight = {}
+        self.bytes = 0
+
+    def stats(self):
+        return {"entries": len(self._entries), "bytes": self.bytes, "inflight": len(self._inflight)}
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    async def get(self, key, compute):
+        """Return the encoded result for ``key``, awaiting ``compute()`` at most once per key at a time."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                RESULT_CACHE_REQUESTS.labels("hit").inc()
+                return entry[1]
+            self._evict(key)
+
+        task = self._inflight.get(key)
+        if task is not None:
+            RESULT_CACHE_REQUESTS.labels("shared").inc()
+        else:
+            RESULT_CACHE_REQUESTS.labels("miss").inc()
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None or self.ttl <= 0:
+            return
+        body = task.result()
+        if len(body) > self.max_bytes // 4:
+            return
+        if key in self._entries:
+            self._evict(key)
+        self._entries[key] = (time.monotonic() + self.ttl, body)
+        self.bytes += len(body)
+        now = time.monotonic()
+        for old in [k for k, (expires, _) in self._entries.items() if expires <= now]:
+            self._evict(old)
+        while self.bytes > self.max_bytes or len(self._entries) > self.max_entries:
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, key):
+        _, body = self._entries.pop(key)
+        self.bytes -= len(body)
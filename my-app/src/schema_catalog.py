@@ -0,0 +1,109 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TableInfo:
+    """Cached metadata for one table."""
+
+    def __init__(self, name):
+        self.name = name
+        self.columns = {}       # column name -> declared type, in table order
+        self.rowid_alias = None  # the INTEGER PRIMARY KEY column, if any
+        self.indexes = {}       # index name -> list of column names
+
+    @property
+    def sortable(self):
+        """Columns keyset pagination may order by: rowid, its alias and leading index columns."""
+        columns = {"rowid"}
+        if self.rowid_alias:
+            columns.add(self.rowid_alias)
+        columns.update(cols[0] for cols in self.indexes.values() if cols and cols[0] is not None)
+        return columns
+
+
+class SchemaCatalog:
+    """
+    In-process cache of table, column and index metadata.
+
+    The whole catalog is loaded with two queries over sqlite_master and the
+    pragma table-valued functions, then reused until ``PRAGMA
+    schema_version`` changes (any CREATE/ALTER/DROP from any connection
+    bumps it) or invalidate() is called after a write made through the API.
+    Checking the version is a single read of the database header; with a
+    ``check_interval`` above zero even that is skipped for requests that
+    arrive within the interval.
+
+    Args:
+        check_interval: Seconds to trust the cache without re-reading
+            schema_version; 0 checks on every lookup
+    """
+
+    def __init__(self, check_interval=0.0):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._tables = None
+        self._schema_version = None
+        self._checked_at = 0.0
+        self.loads = 0
+
+    @property
+    def schema_version(self):
+        """The schema_version the cached metadata was loaded at."""
+        return self._schema_version
+
+    def invalidate(self):
+        with self._lock:
+            self._tables = None
+
+    def _load(self, conn):
+        tables = {}
+        primary_keys = {}
+        for table, column, declared, pk in conn.execute("""
+            SELECT m.name, p.name, p.type, p.pk
+            FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS p
+            WHERE m.type = 'table'
+            ORDER BY m.rowid, p.cid
+        """):
+            info = tables.setdefault(table, TableInfo(table))
+            info.columns[column] = declared
+            if pk:
+                primary_keys.setdefault(table, []).append((column, declared))
+        for table, keys in primary_keys.items():
+            # Only a single INTEGER PRIMARY KEY aliases the rowid
+            if len(keys) == 1 and keys[0][1].upper() == "INTEGER":
+                tables[table].rowid_alias = keys[0][0]
+
+        for table, index, column in conn.execute("""
+            SELECT m.name, il.name, ii.name
+            FROM sqlite_master AS m
+            JOIN pragma_index_list(m.name) AS il
+            JOIN pragma_index_info(il.name) AS ii
+            WHERE m.type = 'table'
+            ORDER BY m.name, il.name, ii.seqno
+        """):
+            if table in tables:
+                tables[table].indexes.setdefault(index, []).append(column)
+        return tables
+
+    def tables(self, conn):
+        """Return ``{table name: TableInfo}``, reloading if the schema changed."""
+        with self._lock:
+            now = time.monotonic()
+            if self._tables is not None and now - self._checked_at < self.check_interval:
+                return self._tables
+
+            version = conn.execute("PRAGMA schema_version").fetchone()[0]
+            self._checked_at = now
+            if self._tables is None or version != self._schema_version:
+                self._tables = self._load(conn)
+                self._schema_version = version
+                self.loads += 1
+                logger.info(f"Schema catalog loaded ({len(self._tables)} tables, schema_version={version})")
+            return self._tables
+
+    def table(self, conn, name):
+        """Return the TableInfo for ``name``, or None if there is no such table."""
+        return self.tables(conn).get(name)
@@ -256,6 +256,21 @@ function KPIUploader({
         document.body.removeChild(link);
     };
 
+    const waitForImportJob = async (jobId) => {
+        while (true) {
+            const response = await fetch(`http://localhost:8001/api/jobs/${jobId}`);
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            const job = await response.json();
+            console.log(`Import job ${jobId}: ${job.rows_processed}/${job.rows_total} rows, ETA ${job.eta_seconds ?? '-'}s`);
+            if (['completed', 'failed', 'cancelled'].includes(job.status)) {
+                return job;
+            }
+            await new Promise(resolve => setTimeout(resolve, 500));
+        }
+    };
+
     const handleImport = async () => {
         if (!currentData || currentData.length === 0) {
             alert('No data to import');
@@ -280,7 +295,8 @@ function KPIUploader({
                 },
                 body: JSON.stringify({
                     data: currentData,
-                    table_name: tableName
+                    table_name: tableName,
+                    background: true
                 }),
             });
 
@@ -290,8 +306,13 @@ function KPIUploader({
                 throw new Error(`HTTP error! status: ${response.status}, message: ${JSON.stringify(errorData)}`);
             }
 
-            const result = await response.json();
-            alert(result.message);
+            // The import runs as a background job; poll it instead of holding the request open
+            const queued = await response.json();
+            const job = await waitForImportJob(queued.job_id);
+            if (job.status !== 'completed') {
+                throw new Error(`Import ${job.status}${job.error ? `: ${job.error}` : ''}`);
+            }
+            alert(`Successfully imported ${job.rows_processed} rows into table ${job.table}`);
         } catch (error) {
             console.error('Error importing data:', error);
             alert('Error importing data: ' + error.message);
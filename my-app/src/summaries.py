@@ -0,0 +1,291 @@
+import json
+import logging
+import sqlite3
+import time
+
+from fastapi import HTTPException
+
+from aggregates import bucket_group, parse_aggregate, parse_bucket, parse_group_by, split_aggregate
+from query_builder import quote_identifier
+from table_versions import INTERNAL_PREFIX
+
+logger = logging.getLogger(__name__)
+
+SUMMARIES_TABLE = f"{INTERNAL_PREFIX}summaries"
+SUMMARY_PREFIX = f"{INTERNAL_PREFIX}summary_"
+KEY_COLUMN = "_key"
+
+# Aggregates that can be maintained from per-group state as rows are
+# appended, and the states each one needs. Medians, percentiles and
+# distinct counts cannot be merged this way and are always computed live.
+STATES = {
+    "sum": ("sum",),
+    "mean": ("sum", "count"),
+    "avg": ("sum", "count"),
+    "min": ("min",),
+    "max": ("max",),
+    "count": ("count",),
+}
+STATE_SQL = {"sum": "SUM({col})", "count": "COUNT({col})", "min": "MIN({col})", "max": "MAX({col})"}
+# How a new partial state merges into a stored one; SUM/MIN/MAX of no values is NULL
+MERGE_SQL = {
+    "sum": "CASE WHEN {old} IS NULL THEN {new} WHEN {new} IS NULL THEN {old} ELSE {old} + {new} END",
+    "count": "{old} + {new}",
+    "min": "COALESCE(MIN({old}, {new}), {old}, {new})",
+    "max": "COALESCE(MAX({old}, {new}), {old}, {new})",
+}
+# How stored states roll up into the aggregate the client asked for
+ROLLUP_SQL = {
+    "sum": "SUM({sum})",
+    "mean": "CAST(SUM({sum}) AS REAL) / SUM({count})",
+    "avg": "CAST(SUM({sum}) AS REAL) / SUM({count})",
+    "min": "MIN({min})",
+    "max": "MAX({max})",
+    "count": "COALESCE(SUM({count}), 0)",
+}
+
+
+def state_column(function, column):
+    return f"{function}({column or '*'})"
+
+
+class Summary:
+    """
+    A declared summary: aggregates of ``source`` grouped by columns and an
+    optional time bucket, e.g. mean Latency and sum Allocated_Bandwidth by
+    Application_Type by hour.
+
+    The summary table holds one row per group with mergeable state (sums,
+    counts, minimums and maximums) and the registry records the highest
+    source rowid folded in. Appending rows only has to aggregate the rows
+    above that watermark and merge them in with an upsert, so the cost of
+    keeping a summary current is proportional to the rows imported, not to
+    the size of the table.
+    """
+
+    def __init__(self, name, source, group_by, bucket, aggregates, last_rowid=0):
+        self.name = name
+        self.source = source
+        self.group_by = group_by
+        self.bucket = bucket            # "column:interval" or None
+        self.aggregates = aggregates    # "name:column" specs
+        self.last_rowid = last_rowid
+
+    @property
+    def table(self):
+        return f"{SUMMARY_PREFIX}{self.name}"
+
+    @property
+    def states(self):
+        """``(function, column)`` pairs stored for the declared aggregates."""
+        states = [("count", "")]
+        for spec in self.aggregates:
+            name, column = split_aggregate(spec)
+            for function in STATES[name]:
+                if (function, column) not in states:
+                    states.append((function, column))
+        return states
+
+    def definition(self):
+        return {"group_by": self.group_by, "bucket": self.bucket, "aggregates": self.aggregates}
+
+    def to_dict(self):
+        return {"name": self.name, "table": self.source, **self.definition(), "last_rowid": self.last_rowid}
+
+    def validate(self, info):
+        parse_group_by(",".join(self.group_by), info.columns)
+        parse_bucket(self.bucket, info.columns)
+        for spec in self.aggregates:
+            name, _ = split_aggregate(spec)
+            parse_aggregate(spec, info.columns)
+            if name not in STATES:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"'{spec}' cannot be maintained incrementally; use sum, mean, min, max or count",
+                )
+
+    @property
+    def keys(self):
+        """``(alias, sql)`` for each group key over the source table."""
+        keys = [(column, quote_identifier(column)) for column in self.group_by]
+        if self.bucket:
+            column, _, interval = self.bucket.partition(":")
+            keys.append(bucket_group(column.strip(), interval.strip().lower()))
+        return keys
+
+    def create(self, conn):
+        columns = [f"{KEY_COLUMN} TEXT PRIMARY KEY"]
+        columns += [quote_identifier(alias) for alias, _ in self.keys]
+        columns += [quote_identifier(state_column(*state)) for state in self.states]
+        conn.execute(f"CREATE TABLE {quote_identifier(self.table)} ({', '.join(columns)})")
+
+    def refresh(self, conn):
+        """Fold source rows above the watermark into the summary; returns the groups touched."""
+        high = conn.execute(f"SELECT MAX(rowid) FROM {quote_identifier(self.source)}").fetchone()[0] or 0
+        if high <= self.last_rowid:
+            return 0
+
+        keys = self.keys
+        states = self.states
+        names = [KEY_COLUMN] + [alias for alias, _ in keys] + [state_column(*state) for state in states]
+        expressions = [expression for _, expression in keys]
+        select = [f"json_array({', '.join(expressions)})"] + expressions
+        select += [STATE_SQL[function].format(col=quote_identifier(column) if column else "*") for function, column in states]
+        merges = []
+        for function, column in states:
+            quoted = quote_identifier(state_column(function, column))
+            merge = MERGE_SQL[function].format(old=quoted, new=f"excluded.{quoted}")
+            merges.append(f"{quoted} = {merge}")
+
+        sql = (
+            f"INSERT INTO {quote_identifier(self.table)} ({', '.join(quote_identifier(n) for n in names)}) "
+            f"SELECT {', '.join(select)} FROM {quote_identifier(self.source)} WHERE rowid > ? AND rowid <= ?"
+        )
+        if keys:
+            sql += f" GROUP BY {', '.join(expressions)}"
+        sql += f" ON CONFLICT({KEY_COLUMN}) DO UPDATE SET {', '.join(merges)}"
+        touched = conn.execute(sql, (self.last_rowid, high)).rowcount
+        conn.execute(f"UPDATE {SUMMARIES_TABLE} SET last_rowid = ? WHERE name = ?", (high, self.name))
+        self.last_rowid = high
+        return touched
+
+    def answers(self, group_by, bucket, aggregates):
+        """
+        Whether this summary can answer an aggregate query.
+
+        The requested groups must be a subset of the summary's (coarser
+        groups are rolled up), the bucket must match or be dropped, and every
+        aggregate must be derivable from the stored states.
+        """
+        if not set(group_by) <= set(self.group_by):
+            return False
+        if bucket and bucket.replace(" ", "").lower() != (self.bucket or "").replace(" ", "").lower():
+            return False
+        stored = set(self.states)
+        for spec in aggregates:
+            name, column = split_aggregate(spec)
+            if name not in STATES or any((function, column) not in stored for function in STATES[name]):
+                return False
+        return True
+
+    def query(self, group_by, bucket, aggregates, info):
+        """The aggregate query over the summary table, with the same output as the live query."""
+        groups = [quote_identifier(column) for column in group_by]
+        if bucket:
+            groups.append(quote_identifier(self.keys[-1][0]))
+        select = list(groups)
+        for spec in aggregates:
+            name, column = split_aggregate(spec)
+            alias, _ = parse_aggregate(spec, info.columns)
+            states = {function: quote_identifier(state_column(function, column)) for function in STATES[name]}
+            select.append(f"{ROLLUP_SQL[name].format(**states)} AS {quote_identifier(alias)}")
+        sql = f"SELECT {', '.join(select)} FROM {quote_identifier(self.table)}"
+        if groups:
+            sql += f" GROUP BY {', '.join(groups)} ORDER BY {', '.join(groups)}"
+        return sql
+
+
+def _ensure_registry(conn):
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {SUMMARIES_TABLE} (
+        name TEXT PRIMARY KEY,
+        source TEXT NOT NULL,
+        definition TEXT NOT NULL,
+        last_rowid INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+
+
+def load_summaries(conn, source=None):
+    """Return the declared summaries, optionally only those over ``source``."""
+    sql = f"SELECT name, source, definition, last_rowid FROM {SUMMARIES_TABLE}"
+    params = ()
+    if source is not None:
+        sql += " WHERE source = ?"
+        params = (source,)
+    try:
+        rows = conn.execute(sql + " ORDER BY name", params).fetchall()
+    except sqlite3.OperationalError:
+        return []
+    summaries = []
+    for name, table, definition, last_rowid in rows:
+        definition = json.loads(definition)
+        summaries.append(Summary(
+            name, table, definition["group_by"], definition["bucket"], definition["aggregates"], last_rowid,
+        ))
+    return summaries
+
+
+def create_summary(conn, summary, info):
+    """Declare a summary and build it from the rows already in the table, in one transaction."""
+    summary.validate(info)
+    if any(existing.name == summary.name for existing in load_summaries(conn)):
+        raise HTTPException(status_code=409, detail=f"Summary '{summary.name}' already exists")
+
+    start = time.perf_counter()
+    conn.execute("BEGIN")
+    try:
+        _ensure_registry(conn)
+        conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(summary.table)}")
+        summary.create(conn)
+        conn.execute(
+            f"INSERT INTO {SUMMARIES_TABLE} (name, source, definition, last_rowid) VALUES (?, ?, ?, 0)",
+            (summary.name, summary.source, json.dumps(summary.definition())),
+        )
+        summary.refresh(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    logger.info(f"Created summary '{summary.name}' over '{summary.source}' in {time.perf_counter() - start:.3f}s")
+    return summary.to_dict()
+
+
+def drop_summary(conn, name):
+    summaries = [summary for summary in load_summaries(conn) if summary.name == name]
+    if not summaries:
+        raise HTTPException(status_code=404, detail=f"Summary '{name}' not found")
+    conn.execute("BEGIN")
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(summaries[0].table)}")
+        conn.execute(f"DELETE FROM {SUMMARIES_TABLE} WHERE name = ?", (name,))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return {"name": name}
+
+
+def refresh_summaries(conn, table, rebuild=False):
+    """
+    Fold newly appended rows of ``table`` into its summaries.
+
+    Call inside the transaction that appended them, so the summaries and
+    the rows commit (or roll back) together. ``rebuild`` recomputes them
+    from scratch, for writes that changed existing rows.
+    """
+    summaries = load_summaries(conn, table)
+    if rebuild:
+        for summary in summaries:
+            conn.execute(f"DELETE FROM {quote_identifier(summary.table)}")
+            summary.last_rowid = 0
+    return sum(summary.refresh(conn) for summary in summaries)
+
+
+def find_summary(conn, table, group_by, bucket, aggregates):
+    """
+    Return a summary that can answer the query and is up to date, or None.
+
+    A summary whose watermark is behind the table (rows written outside the
+    API) is skipped, so results never depend on whether it was refreshed.
+    """
+    candidates = [s for s in load_summaries(conn, table) if s.answers(group_by, bucket, aggregates)]
+    if not candidates:
+        return None
+    high = conn.execute(f"SELECT MAX(rowid) FROM {quote_identifier(table)}").fetchone()[0] or 0
+    current = [summary for summary in candidates if summary.last_rowid == high]
+    if not current:
+        logger.info(f"Summaries for '{table}' are behind rowid {high}; aggregating live")
+        return None
+    # The fewest groups is the cheapest to roll up
+    return min(current, key=lambda summary: len(summary.group_by) + (summary.bucket is not None))
@@ -0,0 +1,235 @@
+import logging
+import math
+import sqlite3
+import threading
+import time
+
+from query_builder import quote_identifier
+from table_versions import table_version
+
+logger = logging.getLogger(__name__)
+
+SKETCH_FUNCTION = "kpi_distinct_sketch"
+# 2**12 registers: about 1.6% standard error for 4 KB per column
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+_SHIFT = 64 - PRECISION
+_LOW_BITS = (1 << _SHIFT) - 1
+_MASK = (1 << 64) - 1
+
+
+def _hash64(value):
+    # hash() is fast but leaves small ints unchanged; splitmix64 spreads them
+    z = (hash(value) + 0x9E3779B97F4A7C15) & _MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK
+    return z ^ (z >> 31)
+
+
+class DistinctSketch:
+    """
+    SQLite aggregate building a HyperLogLog sketch of a column's values.
+
+    ``SELECT kpi_distinct_sketch(col) FROM t`` returns the registers as a
+    blob. Sketches of disjoint row ranges merge by taking the larger
+    register, which is what lets the stats cache count distinct values of
+    appended rows without rescanning the old ones. Python's hash() is salted
+    per process, so sketches are only comparable within one process; the
+    cache is in memory for that reason.
+    """
+
+    def __init__(self):
+        self.registers = bytearray(REGISTERS)
+
+    def step(self, value):
+        if value is None:
+            return
+        h = _hash64(value)
+        index = h >> _SHIFT
+        rank = _SHIFT - (h & _LOW_BITS).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def finalize(self):
+        return bytes(self.registers)
+
+
+def register_sketch_function(conn):
+    conn.create_aggregate(SKETCH_FUNCTION, 1, DistinctSketch)
+
+
+def merge_sketches(a, b):
+    if a is None:
+        return bytes(b)
+    return bytes(max(x, y) for x, y in zip(a, b))
+
+
+def estimate_distinct(registers):
+    """HyperLogLog estimate, with linear counting for small cardinalities."""
+    if registers is None:
+        return 0
+    alpha = 0.7213 / (1 + 1.079 / REGISTERS)
+    estimate = alpha * REGISTERS * REGISTERS / sum(2.0 ** -register for register in registers)
+    zeros = registers.count(0)
+    if estimate <= 2.5 * REGISTERS and zeros:
+        estimate = REGISTERS * math.log(REGISTERS / zeros)
+    return round(estimate)
+
+
+class TableStats:
+    """Cached statistics of one table, valid for one change version and schema."""
+
+    def __init__(self, table, columns):
+        self.table = table
+        self.columns = dict(columns)
+        self.version = None
+        self.schema_version = None
+        self.last_rowid = 0
+        self.rows = 0
+        self.nulls = {column: 0 for column in columns}
+        self.sketches = {column: None for column in columns}
+        self.bytes = None
+        self.index_bytes = None
+        self.refreshed_at = None
+
+    def copy(self):
+        stats = TableStats(self.table, self.columns)
+        stats.__dict__.update(self.__dict__)
+        stats.nulls = dict(self.nulls)
+        stats.sketches = dict(self.sketches)
+        return stats
+
+    def to_dict(self):
+        return {
+            "name": self.table,
+            "rows": self.rows,
+            "columns": len(self.columns),
+            "bytes": self.bytes,
+            "index_bytes": self.index_bytes,
+            "version": self.version,
+            "column_stats": {
+                column: {
+                    "type": declared,
+                    "nulls": self.nulls[column],
+                    "distinct": min(estimate_distinct(self.sketches[column]), self.rows - self.nulls[column]),
+                }
+                for column, declared in self.columns.items()
+            },
+        }
+
+
+def table_sizes(conn, table):
+    """On-disk bytes of the table and of its indexes from dbstat, or (None, None) without it."""
+    objects = conn.execute(
+        "SELECT type, name FROM sqlite_master WHERE tbl_name = ? AND type IN ('table', 'index')", (table,)
+    ).fetchall()
+    sizes = {"table": 0, "index": 0}
+    try:
+        for kind, name in objects:
+            # aggregate=TRUE sums a b-tree's pages without a row per page
+            row = conn.execute("SELECT pgsize FROM dbstat WHERE name = ? AND aggregate = TRUE", (name,)).fetchone()
+            sizes[kind] += row[0] if row and row[0] else 0
+    except sqlite3.OperationalError:
+        # SQLite built without SQLITE_ENABLE_DBSTAT_VTAB
+        return None, None
+    return sizes["table"], sizes["index"]
+
+
+class TableStatsCache:
+    """
+    Row counts, sizes and per-column null/distinct estimates, kept in memory.
+
+    Imports only call note_import() after they commit, which runs no query:
+    it records whether the table has been appended to and nothing else
+    since the cached stats were taken. Scanning happens in get(), on the
+    ``/api/tables?stats=1`` read path. If the change version moved through
+    appends alone, only rows above the cached rowid watermark are scanned
+    and the distinct sketches merged; any other change (updated rows, new
+    columns, nothing cached yet) rescans the table once. A table whose
+    version has not moved is checked against its MAX(rowid), which catches
+    rows appended or deleted at the end by writers outside the API; rows
+    such writers change in place go unnoticed, as they do for the ETags.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._appended = {}     # table -> version reached by appends alone since the cached stats
+        self.scans = 0
+        self.rows_scanned = 0
+
+    def forget(self, table):
+        with self._lock:
+            self._stats.pop(table, None)
+            self._appended.pop(table, None)
+
+    def note_import(self, table, base_version, version, appended_only):
+        """Record that an import moved ``table`` from ``base_version`` to ``version``."""
+        with self._lock:
+            cached = self._stats.get(table)
+            reached = self._appended.get(table, cached.version if cached is not None else None)
+            if appended_only and cached is not None and reached == base_version:
+                self._appended[table] = version
+            else:
+                self._appended.pop(table, None)
+
+    def refresh(self, conn, info, schema_version, base=None):
+        """
+        Recompute ``info``'s table stats and cache them.
+
+        ``base`` is cached stats the table has only been appended to since;
+        it is extended with the rows above its watermark instead of
+        rescanning the table.
+        """
+        version = table_version(conn, info.name)
+        stats = base.copy() if base is not None else TableStats(info.name, info.columns)
+
+        start = time.perf_counter()
+        columns = list(stats.columns)
+        select = ["COUNT(*)", "MAX(rowid)"]
+        for column in columns:
+            quoted = quote_identifier(column)
+            select += [f"SUM({quoted} IS NULL)", f"{SKETCH_FUNCTION}({quoted})"]
+        row = conn.execute(
+            f"SELECT {', '.join(select)} FROM {quote_identifier(info.name)} WHERE rowid > ?", (stats.last_rowid,)
+        ).fetchone()
+        if row[0]:
+            stats.rows += row[0]
+            stats.last_rowid = row[1]
+            for i, column in enumerate(columns):
+                stats.nulls[column] += row[2 + 2 * i] or 0
+                stats.sketches[column] = merge_sketches(stats.sketches[column], row[3 + 2 * i])
+        stats.bytes, stats.index_bytes = table_sizes(conn, info.name)
+        stats.version = version
+        stats.schema_version = schema_version
+        stats.refreshed_at = time.time()
+
+        with self._lock:
+            self.scans += 1
+            self.rows_scanned += row[0]
+            current = self._stats.get(info.name)
+            # A slower concurrent refresh must not replace a newer one
+            if current is None or (current.version or 0) <= version:
+                self._stats[info.name] = stats
+                if self._appended.get(info.name) == version:
+                    del self._appended[info.name]
+        logger.info(f"Refreshed stats of '{info.name}' ({row[0]} rows scanned in {time.perf_counter() - start:.3f}s)")
+        return stats
+
+    def get(self, conn, info, schema_version):
+        """Return current stats for ``info``'s table, scanning only what changed since they were cached."""
+        version = table_version(conn, info.name)
+        with self._lock:
+            cached = self._stats.get(info.name)
+            appended = self._appended.get(info.name)
+        if cached is not None and cached.columns == info.columns:
+            if cached.version == version:
+                high = conn.execute(f"SELECT MAX(rowid) FROM {quote_identifier(info.name)}").fetchone()[0] or 0
+                if high == cached.last_rowid:
+                    if cached.schema_version == schema_version:
+                        return cached
+                    # Schema changed elsewhere (e.g. an index) but no rows did: only sizes are stale
+                    return self.refresh(conn, info, schema_version, base=cached)
+            elif appended == version:
+                return self.refresh(conn, info, schema_version, base=cached)
+        return self.refresh(conn, info, schema_version)
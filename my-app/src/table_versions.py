@@ -0,0 +1,61 @@
+import hashlib
+import sqlite3
+
+VERSIONS_TABLE = "_kpi_table_versions"
+INTERNAL_PREFIX = "_kpi_"
+
+
+def is_internal_table(name):
+    """Tables the backend keeps for itself and never lists to clients."""
+    return name.startswith(INTERNAL_PREFIX)
+
+
+def bump_version(conn, table):
+    """
+    Increment ``table``'s change version.
+
+    Call inside the transaction that modifies the table, so the new version
+    becomes visible together with the data it describes.
+    """
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {VERSIONS_TABLE} (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    )
+    """)
+    conn.execute(
+        f"INSERT INTO {VERSIONS_TABLE} (name, version) VALUES (?, 1) "
+        f"ON CONFLICT(name) DO UPDATE SET version = version + 1",
+        (table,),
+    )
+
+
+def table_version(conn, table):
+    """Return ``table``'s change version; 0 if it was never written through the API."""
+    try:
+        row = conn.execute(f"SELECT version FROM {VERSIONS_TABLE} WHERE name = ?", (table,)).fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] if row else 0
+
+
+def all_versions(conn):
+    try:
+        return dict(conn.execute(f"SELECT name, version FROM {VERSIONS_TABLE}").fetchall())
+    except sqlite3.OperationalError:
+        return {}
+
+
+def make_etag(*parts):
+    """Build a strong ETag from anything that determines a response's content."""
+    return '"' + hashlib.sha1(repr(parts).encode()).hexdigest()[:24] + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """Evaluate an If-None-Match header against ``etag`` (weak comparison, per RFC 9110)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
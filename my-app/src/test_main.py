@@ -0,0 +1,1090 @@
+import asyncio
+import csv
+import io
+import json
+import sqlite3
+import threading
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import csv_import
+import importer
+import main
+from db_executor import DatabaseExecutor
+from db_pool import ConnectionPool, PoolTimeoutError
+
+
+SAMPLE_ROWS = [
+    {"Timestamp": "9/25/2024 10:00", "User_ID": "1001", "Application_Type": "Streaming", "Latency": "30"},
+    {"Timestamp": "9/25/2024 10:05", "User_ID": "1002", "Application_Type": "Gaming", "Latency": "25"},
+    {"Timestamp": "9/25/2024 10:10", "User_ID": "1003", "Application_Type": "Browsing", "Latency": "20"},
+]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "test.db")
+
+
+@pytest.fixture
+def client(db_path, monkeypatch):
+    monkeypatch.setattr(main, "DB_PATH", db_path)
+    with TestClient(main.app) as c:
+        yield c
+
+
+def test_pool_reuses_connections(db_path):
+    pool = ConnectionPool(db_path, size=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        assert second is first
+    stats = pool.stats()
+    assert stats["created"] == 1
+    assert stats["reused"] == 1
+    pool.close()
+    assert pool.stats()["open"] == 0
+
+
+def test_pool_nested_acquire_shares_thread_connection(db_path):
+    pool = ConnectionPool(db_path, size=1, timeout=0.1)
+    with pool.connection() as outer:
+        with pool.connection() as inner:
+            assert inner is outer
+    pool.close()
+
+
+def test_pool_times_out_when_exhausted(db_path):
+    pool = ConnectionPool(db_path, size=1, timeout=0.1)
+    held = threading.Event()
+    done = threading.Event()
+
+    def hold():
+        with pool.connection():
+            held.set()
+            done.wait()
+
+    t = threading.Thread(target=hold)
+    t.start()
+    held.wait()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    done.set()
+    t.join()
+    assert pool.stats()["timeouts"] == 1
+    pool.close()
+
+
+def test_pool_rolls_back_uncommitted_work(db_path):
+    pool = ConnectionPool(db_path, size=1)
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.commit()
+        conn.execute("INSERT INTO t VALUES (1)")
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    pool.close()
+
+
+def test_import_and_read_round_trip(client):
+    response = client.post("/api/import_kpis", json={"data": SAMPLE_ROWS, "table_name": "kpis_test"})
+    assert response.status_code == 200
+
+    assert "kpis_test" in client.get("/api/tables").json()
+    rows = client.get("/api/kpis", params={"table": "kpis_test"}).json()
+    assert [r["User_ID"] for r in rows] == [1001, 1002, 1003]
+
+    stats = client.get("/api/pool").json()
+    assert stats["created"] >= 1
+    assert stats["reused"] >= 1
+
+
+def test_read_unknown_table_returns_404(client):
+    assert client.get("/api/kpis", params={"table": "missing"}).status_code == 404
+    assert client.get("/api/kpis", params={"table": "bad name"}).status_code == 400
+
+
+def test_reads_proceed_while_write_is_running(db_path, monkeypatch):
+    monkeypatch.setattr(main, "DB_PATH", db_path)
+
+    def slow_write(conn):
+        conn.execute("CREATE TABLE IF NOT EXISTS slow (x INTEGER)")
+        conn.execute("INSERT INTO slow VALUES (1)")
+        time.sleep(0.5)
+        conn.commit()
+
+    async def scenario():
+        async with main.lifespan(main.app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+                await client.post("/api/import_kpis", json={"data": SAMPLE_ROWS, "table_name": "kpis_test"})
+                write = asyncio.ensure_future(main.db_executor.write(slow_write))
+                await asyncio.sleep(0.05)
+
+                start = time.perf_counter()
+                responses = await asyncio.gather(
+                    *[client.get("/api/kpis", params={"table": "kpis_test"}) for _ in range(8)]
+                )
+                elapsed = time.perf_counter() - start
+                write_done = write.done()
+                await write
+        return responses, elapsed, write_done
+
+    responses, elapsed, write_done = asyncio.run(scenario())
+    assert all(r.status_code == 200 and len(r.json()) == 3 for r in responses)
+    assert not write_done
+    assert elapsed < 0.4
+
+
+def test_executor_runs_reads_concurrently(db_path):
+    pool = ConnectionPool(db_path, size=5)
+    executor = DatabaseExecutor(pool, read_workers=4, max_streams=0)
+
+    def slow_read(conn):
+        conn.execute("SELECT 1").fetchone()
+        time.sleep(0.1)
+
+    async def run(n):
+        start = time.perf_counter()
+        await asyncio.gather(*[executor.read(slow_read) for _ in range(n)])
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(run(8))
+    executor.shutdown()
+    pool.close()
+    # Eight 100ms reads over four workers take ~0.2s, versus 0.8s serially
+    assert elapsed < 0.5
+
+
+def test_pool_too_small_for_streams(db_path, monkeypatch):
+    monkeypatch.setattr(main, "DB_PATH", db_path)
+    monkeypatch.setattr(main, "DB_POOL_SIZE", 5)
+
+    async def start():
+        async with main.lifespan(main.app):
+            pass
+
+    with pytest.raises(ValueError, match="KPI_DB_POOL_SIZE=5 .* KPI_DB_READ_WORKERS=4"):
+        asyncio.run(start())
+
+
+def _page_through(client, **params):
+    rows, cursor = [], None
+    while True:
+        query = dict(params, table="kpis_test")
+        if cursor:
+            query["cursor"] = cursor
+        body = client.get("/api/kpis", params=query).json()
+        rows.extend(body["rows"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return rows
+
+
+def test_keyset_pagination(client, db_path):
+    data = [{"User_ID": str(i), "Latency": str(i % 3) if i % 4 else None} for i in range(1, 11)]
+    client.post("/api/import_kpis", json={"data": data, "table_name": "kpis_test"})
+
+    rows = _page_through(client, limit=3)
+    assert [r["id"] for r in rows] == list(range(1, 11))
+
+    assert client.get("/api/kpis", params={"table": "kpis_test", "limit": 2, "order_by": "Latency"}).status_code == 400
+
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE INDEX idx_latency ON kpis_test ("Latency")')
+    conn.commit()
+    conn.close()
+
+    for order_by in ("Latency", "-Latency"):
+        rows = _page_through(client, limit=3, order_by=order_by)
+        expected = sorted(data, key=lambda r: (r["Latency"] is not None, r["Latency"] or "", int(r["User_ID"])))
+        if order_by.startswith("-"):
+            expected.reverse()
+        assert [r["User_ID"] for r in rows] == [int(r["User_ID"]) for r in expected]
+
+
+def test_pagination_rejects_bad_cursor(client):
+    client.post("/api/import_kpis", json={"data": SAMPLE_ROWS, "table_name": "kpis_test"})
+    params = {"table": "kpis_test", "limit": 1}
+    assert client.get("/api/kpis", params=dict(params, cursor="not-a-cursor")).status_code == 400
+
+    cursor = client.get("/api/kpis", params=params).json()["next_cursor"]
+    assert client.get("/api/kpis", params=dict(params, cursor=cursor, order_by="-rowid")).status_code == 400
+
+
+def test_stream_ndjson_and_csv(client, monkeypatch):
+    monkeypatch.setattr(main, "STREAM_BATCH_SIZE", 2)
+    client.post("/api/import_kpis", json={"data": SAMPLE_ROWS, "table_name": "kpis_test"})
+
+    response = client.get("/api/kpis", params={"table": "kpis_test", "format": "ndjson"})
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == client.get("/api/kpis", params={"table": "kpis_test"}).json()
+
+    response = client.get("/api/kpis", params={"table": "kpis_test", "format": "csv"})
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == ["id", "Timestamp", "User_ID", "Application_Type", "Latency"]
+    assert [r[2] for r in rows[1:]] == ["1001", "1002", "1003"]
+
+    assert client.get("/api/kpis", params={"table": "missing", "format": "csv"}).status_code == 404
+    # The streaming connection went back to the pool
+    assert client.get("/api/pool").json()["in_use"] == 0
+
+
+def test_projection_and_filter_pushdown(client):
+    data = SAMPLE_ROWS + [
+        {"Timestamp": "9/25/2024 10:15", "User_ID": "1004", "Application_Type": "Gaming", "Latency": "40"},
+        {"Timestamp": "9/25/2024 10:20", "User_ID": "1005", "Application_Type": "Gaming", "Latency": "5"},
+    ]
+    client.post("/api/import_kpis", json={"data": data, "table_name": "kpis_test"})
+
+    def ids(**params):
+        response = client.get("/api/kpis", params=dict(params, table="kpis_test"))
+        assert response.status_code == 200, response.text
+        body = response.json()
+        return [r["User_ID"] for r in (body["rows"] if "rows" in body else body)]
+
+    # Latency is inferred as INTEGER, so "5" compares numerically
+    assert ids(filter="Latency>24") == [1001, 1002, 1004]
+    assert ids(filter=["Application_Type=Gaming", "Latency<=25"]) == [1002, 1005]
+    assert ids(filter="Latency=20..30") == [1001, 1002, 1003]
+    assert ids(filter="Timestamp>=9/25/2024 10:10") == [1003, 1004, 1005]
+    assert ids(filter="Application_Type!=Gaming", limit=1) == [1001]
+    # "nan" and "inf" stay text instead of binding a NaN (NULL to SQLite) that matches nothing
+    assert ids(filter="Application_Type!=nan") == [1001, 1002, 1003, 1004, 1005]
+    assert ids(filter="Latency=inf") == []
+
+    rows = client.get("/api/kpis", params={"table": "kpis_test", "columns": "User_ID,Latency"}).json()
+    assert rows[0] == {"User_ID": 1001, "Latency": 30}
+    page = client.get("/api/kpis", params={"table": "kpis_test", "columns": "Latency", "limit": 2}).json()
+    assert page["rows"] == [{"Latency": 30}, {"Latency": 25}]
+
+    response = client.get("/api/kpis", params={"table": "kpis_test", "columns": "User_ID", "filter": "Latency>30", "format": "csv"})
+    assert response.text.split() == ["User_ID", "1004"]
+
+    for bad in ({"columns": "nope"}, {"filter": "nope=1"}, {"filter": "Latency"}, {"filter": "1=1; DROP TABLE kpis_test"}):
+        assert client.get("/api/kpis", params=dict(bad, table="kpis_test")).status_code == 400
+
+
+def test_bulk_import_reports_throughput(client):
+    data = [{"User_ID": str(i), "Latency": str(i % 50)} for i in range(2500)]
+    response = client.post("/api/import_kpis", json={"data": data, "table_name": "kpis_test", "chunk_size": 1000})
+    body = response.json()
+    assert body["rows"] == 2500
+    assert body["rows_per_sec"] > 0
+    assert len(client.get("/api/kpis", params={"table": "kpis_test"}).json()) == 2500
+
+
+def test_failed_import_rolls_back_everything(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = [("1",), ("2",), (object(),)]
+    with pytest.raises(sqlite3.Error):
+        importer.bulk_insert(conn, "kpis_test", ["User_ID"], rows, chunk_size=1)
+    # Neither the rows nor the table itself survive
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name='kpis_test'").fetchone() is None
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 2
+    conn.close()
+
+
+def test_csv_stream_parser_handles_split_records():
+    parser = csv_import.CsvStreamParser()
+    body = 'a,b\n1,"two\nlines"\n3,"say ""hi"""\n4,5'.encode()
+    records = []
+    for i in range(0, len(body), 3):
+        records.extend(parser.feed(body[i:i + 3]))
+    records.extend(parser.close())
+    assert records == [["a", "b"], ["1", "two\nlines"], ["3", 'say "hi"'], ["4", "5"]]
+
+
+def test_import_csv_raw_and_multipart(client):
+    body = "User_ID,Latency\n" + "".join(f"{i},{i % 7}\n" for i in range(3000))
+
+    def chunks():
+        data = body.encode()
+        for i in range(0, len(data), 4096):
+            yield data[i:i + 4096]
+
+    response = client.post("/api/import_csv", params={"table": "csv_test", "chunk_size": 500, "import_id": "raw"},
+                           content=chunks(), headers={"content-type": "text/csv"})
+    assert response.status_code == 200, response.text
+    assert response.json()["rows"] == 3000
+    progress = client.get("/api/import_csv/raw").json()
+    assert progress["status"] == "completed"
+    assert progress["rows_inserted"] == 3000
+    assert progress["bytes_received"] == len(body)
+
+    response = client.post("/api/import_csv", params={"table": "csv_test"},
+                           files={"file": ("kpis.csv", "User_ID,Latency,Extra\n9,9,x\n", "text/csv")})
+    assert response.json()["rows"] == 1
+    rows = client.get("/api/kpis", params={"table": "csv_test", "filter": "User_ID=9"}).json()
+    assert rows[-1]["Extra"] == "x"
+
+
+def test_import_csv_bad_upload_rolls_back(client):
+    response = client.post("/api/import_csv", params={"table": "csv_test", "import_id": "bad"},
+                           content=b"a,a\n1,2\n", headers={"content-type": "text/csv"})
+    assert response.status_code == 400
+    assert client.get("/api/import_csv/bad").json()["status"] == "failed"
+    assert "csv_test" not in client.get("/api/tables").json()
+
+
+def test_import_rejects_clashing_column_names(client):
+    client.post("/api/import_kpis", json={"data": SAMPLE_ROWS, "table_name": "kpis_test"})
+    # The csv export carries the id column every imported table gets
+    exported = client.get("/api/kpis", params={"table": "kpis_test", "format": "csv"}).text
+    assert exported.startswith("id,")
+    response = client.post("/api/import_csv", params={"table": "copy"},
+                           content=exported.encode(), headers={"content-type": "text/csv"})
+    assert response.status_code == 400
+    assert "reserved" in response.json()["detail"]
+
+    response = client.post("/api/import_kpis", json={"table_name": "copy", "data": [{"ID": 1, "Latency": 2}]})
+    assert response.status_code == 400
+    response = client.post("/api/import_csv", params={"table": "copy"},
+                           content=b"A,a\n1,2\n", headers={"content-type": "text/csv"})
+    assert response.status_code == 400
+    response = client.post("/api/import_kpis", json={"table_name": "kpis_test", "data": [{"latency": 1}]})
+    assert response.status_code == 400
+    assert "copy" not in client.get("/api/tables").json()
+
+    # An existing table's id can be imported into
+    response = client.post("/api/import_kpis", json={"table_name": "kpis_test", "data": [{"id": 500, "Latency": 1}]})
+    assert response.status_code == 200, response.text
+    assert client.get("/api/kpis", params={"table": "kpis_test", "filter": "id=500"}).json()[0]["Latency"] == 1
+
+
+def test_import_infers_and_widens_column_types(client, db_path):
+    data = [
+        {"Timestamp": "9/25/2024 10:00", "User_ID": "1001", "Zip": "07001", "Latency": "30", "Signal": "-85.5"},
+        {"Timestamp": "9/25/2024 10:05", "User_ID": "1002", "Zip": "07002", "Latency": "", "Signal": "-80"},
+    ]
+    client.post("/api/import_kpis", json={"data": data, "table_name": "kpis_test"})
+
+    def declared_types():
+        conn = sqlite3.connect(db_path)
+        types = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(kpis_test)")}
+        conn.close()
+        return types
+
+    assert declared_types() == {
+        "id": "INTEGER", "Timestamp": "TIMESTAMP", "User_ID": "INTEGER",
+        "Zip": "TEXT", "Latency": "INTEGER", "Signal": "REAL",
+    }
+    rows = client.get("/api/kpis", params={"table": "kpis_test"}).json()
+    assert rows[0]["Timestamp"] == "2024-09-25 10:00:00"
+    assert rows[1]["Latency"] is None
+
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE INDEX idx_user ON kpis_test ("User_ID")')
+    conn.commit()
+    conn.close()
+
+    # A later import that no longer fits widens the columns in place
+    client.post("/api/import_kpis", json={"data": [{"User_ID": "1003", "Latency": "n/a", "Signal": "1"}], "table_name": "kpis_test"})
+    types = declared_types()
+    assert (types["Latency"], types["Signal"], types["User_ID"]) == ("TEXT", "REAL", "INTEGER")
+    rows = client.get("/api/kpis", params={"table": "kpis_test", "limit": 10, "order_by": "User_ID"}).json()["rows"]
+    assert [r["id"] for r in rows] == [1, 2, 3]
+    assert [r["Latency"] for r in rows] == ["30", None, "n/a"]
+
+    # TEXT columns still compare numerically through CAST
+    assert [r["id"] for r in client.get("/api/kpis", params={"table": "kpis_test", "filter": "Latency>24"}).json()] == [1]
+
+
+def test_schema_catalog_is_cached_and_invalidated(client, db_path):
+    client.post("/api/import_kpis", json={"data": SAMPLE_ROWS, "table_name": "kpis_test"})
+    client.get("/api/tables")
+    loads = main.schema_catalog.loads
+    for _ in range(3):
+        client.get("/api/kpis", params={"table": "kpis_test", "columns": "Latency"})
+        client.get("/api/tables")
+    assert main.schema_catalog.loads == loads
+
+    # Schema changes made outside the API are noticed through schema_version
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE external (x INTEGER)")
+    conn.commit()
+    conn.close()
+    assert "external" in client.get("/api/tables").json()
+    assert main.schema_catalog.loads == loads + 1
+
+    client.post("/api/import_kpis", json={"data": [{"User_ID": 5, "New_Column": "x"}], "table_name": "kpis_test"})
+    assert client.get("/api/kpis", params={"table": "kpis_test", "columns": "New_Column"}).status_code == 200
+
+
+def test_aggregate_endpoint(client):
+    data = [
+        {"Application_Type": app_type, "User_ID": str(user), "Latency": str(latency)}
+        for app_type, user, latency in [
+            ("Gaming", 1, 10), ("Gaming", 2, 20), ("Gaming", 2, 30), ("Gaming", 3, 40),
+            ("Streaming", 4, 5), ("Streaming", 5, 15),
+        ]
+    ]
+    client.post("/api/import_kpis", json={"data": data, "table_name": "kpis_test"})
+
+    response = client.get("/api/kpis/aggregate", params={
+        "table": "kpis_test",
+        "group_by": "Application_Type",
+        "agg": ["sum:Latency", "mean:Latency", "min:Latency", "max:Latency", "count",
+                "count_distinct:User_ID", "median:Latency", "p90:Latency"],
+    })
+    assert response.status_code == 200, response.text
+    gaming, streaming = response.json()["rows"]
+    assert gaming == {
+        "Application_Type": "Gaming", "sum_Latency": 100, "mean_Latency": 25.0, "min_Latency": 10,
+        "max_Latency": 40, "count": 4, "count_distinct_User_ID": 3, "median_Latency": 25.0,
+        "p90_Latency": pytest.approx(37.0),
+    }
+    assert streaming["median_Latency"] == 10.0
+
+    total = client.get("/api/kpis/aggregate", params={"table": "kpis_test", "agg": "count", "filter": "Latency>=20"}).json()
+    assert total == {"group_by": [], "rows": [{"count": 3}]}
+
+    for bad in ({"agg": "sum:nope"}, {"agg": "stddev:Latency"}, {"agg": "count", "group_by": "nope"}):
+        assert client.get("/api/kpis/aggregate", params=dict(bad, table="kpis_test")).status_code == 400
+
+
+def test_etag_revalidation(client):
+    client.post("/api/import_kpis", json={"data": SAMPLE_ROWS, "table_name": "kpis_test"})
+
+    first = client.get("/api/kpis", params={"table": "kpis_test"})
+    etag = first.headers["etag"]
+    cached = client.get("/api/kpis", params={"table": "kpis_test"}, headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.content == b""
+    assert cached.headers["etag"] == etag
+    # Different parameters are a different representation
+    other = client.get("/api/kpis", params={"table": "kpis_test", "limit": 1}, headers={"If-None-Match": etag})
+    assert other.status_code == 200
+
+    client.post("/api/import_kpis", json={"data": SAMPLE_ROWS, "table_name": "kpis_test"})
+    fresh = client.get("/api/kpis", params={"table": "kpis_test"}, headers={"If-None-Match": etag})
+    assert fresh.status_code == 200 and fresh.headers["etag"] != etag
+    assert len(fresh.json()) == 2 * len(SAMPLE_ROWS)
+
+    tables = client.get("/api/tables")
+    assert "kpis_test" in tables.json() and "_kpi_table_versions" not in tables.json()
+    assert client.get("/api/tables", headers={"If-None-Match": tables.headers["etag"]}).status_code == 304
+
+    # Invalid parameters are rejected before an ETag or cache entry is made
+    entries = main.result_cache.stats()["entries"]
+    for params in ({"columns": "nope"}, {"filter": "nope=1"}, {"limit": 5, "order_by": "Latency"}):
+        response = client.get("/api/kpis", params=dict(params, table="kpis_test"))
+        assert response.status_code == 400 and "etag" not in response.headers, params
+    assert main.result_cache.stats()["entries"] == entries
+    assert main.index_advisor.usage("kpis_test") == {}
+    assert client.get("/api/kpis", params={"table": "_kpi_table_versions"}).status_code == 404
+
+
+def test_columnar_shape(client):
+    client.post("/api/import_kpis", json={"data": SAMPLE_ROWS, "table_name": "kpis_test"})
+
+    full = client.get("/api/kpis", params={"table": "kpis_test", "shape": "columnar", "columns": "User_ID,Latency"}).json()
+    assert full == {"headers": ["User_ID", "Latency"], "columns": [[1001, 1002, 1003], [30, 25, 20]]}
+
+    page = client.get("/api/kpis", params={"table": "kpis_test", "shape": "columnar", "limit": 2}).json()
+    assert page["headers"] == ["id", *SAMPLE_ROWS[0]]
+    assert page["columns"][2] == [1001, 1002] and page["next_cursor"]
+    empty = client.get("/api/kpis", params={"table": "kpis_test", "shape": "columnar", "filter": "Latency>100"}).json()
+    assert empty == {"headers": ["id", *SAMPLE_ROWS[0]], "columns": [[], [], [], [], []]}
+
+    assert client.get("/api/kpis", params={"table": "kpis_test", "shape": "columnar", "format": "csv"}).status_code == 400
+
+
+def test_json_encoder_fallback(monkeypatch):
+    import serializers
+
+    content = {"rows": [{"a": 1, "b": "é", "c": None, "d": 0.1, "e": -2.5, "f": True, "g": [1, {"h": "\\\""}]}]}
+    monkeypatch.setattr(serializers, "FAST_JSON", False)
+    standard = serializers.json_dumps(content)
+    assert standard == json.dumps(content, separators=(",", ":"), ensure_ascii=False).encode()
+    assert json.loads(standard) == content
+
+    # orjson is only used when enabled, and then gives the same bytes
+    monkeypatch.setattr(serializers, "orjson", pytest.importorskip("orjson"))
+    assert serializers.json_dumps(content) == standard
+    monkeypatch.setattr(serializers, "FAST_JSON", True)
+    assert serializers.json_dumps(content) == standard
+
+
+def test_response_compression(client):
+    from compression import negotiate_encoding
+
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("gzip;q=0, identity") is None
+    assert negotiate_encoding("*") in ("br", "gzip")
+
+    rows = [dict(row, User_ID=i) for i in range(200) for row in SAMPLE_ROWS[:1]]
+    client.post("/api/import_kpis", json={"data": rows, "table_name": "kpis_test"})
+
+    plain = client.get("/api/kpis", params={"table": "kpis_test"}, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    compressed = client.get("/api/kpis", params={"table": "kpis_test"}, headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert int(compressed.headers["content-length"]) < len(plain.content)
+    assert compressed.json() == plain.json()
+    # The compressed representation carries a weak validator that still revalidates
+    assert compressed.headers["etag"] == "W/" + plain.headers["etag"]
+    revalidated = client.get("/api/kpis", params={"table": "kpis_test"},
+                             headers={"Accept-Encoding": "gzip", "If-None-Match": compressed.headers["etag"]})
+    assert revalidated.status_code == 304
+
+    streamed = client.get("/api/kpis", params={"table": "kpis_test", "format": "ndjson"}, headers={"Accept-Encoding": "gzip"})
+    assert streamed.headers["content-encoding"] == "gzip"
+    assert len(streamed.text.splitlines()) == len(rows)
+
+    small = client.get("/api/tables", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+
+
+def test_arrow_and_parquet_formats(client, monkeypatch):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    monkeypatch.setattr(main, "COLUMNAR_BATCH_SIZE", 2)
+    client.post("/api/import_kpis", json={"data": SAMPLE_ROWS, "table_name": "kpis_test"})
+    params = {"table": "kpis_test", "columns": "Timestamp,User_ID,Latency", "filter": "Latency>=25"}
+
+    arrow = client.get("/api/kpis", params=dict(params, format="arrow"))
+    assert arrow.status_code == 200 and arrow.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    table = pa.ipc.open_stream(arrow.content).read_all()
+    assert table.schema.types == [pa.string(), pa.int64(), pa.int64()]
+    assert table.to_pydict() == {
+        "Timestamp": ["2024-09-25 10:00:00", "2024-09-25 10:05:00"], "User_ID": [1001, 1002], "Latency": [30, 25],
+    }
+
+    parquet = client.get("/api/kpis", params=dict(params, format="parquet"))
+    assert pq.read_table(io.BytesIO(parquet.content)).to_pydict() == table.to_pydict()
+
+    assert client.get("/api/kpis", params={"table": "kpis_test", "format": "arrow", "limit": 10}).status_code == 400
+
+
+def wait_for_job(client, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/jobs/{job_id}").json()
+        if job["status"] in ("completed", "failed", "cancelled"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_background_import_job(client):
+    rows = [dict(row, User_ID=str(i)) for i in range(50) for row in SAMPLE_ROWS[:1]]
+    response = client.post("/api/import_kpis", json={
+        "data": rows, "table_name": "kpis_test", "chunk_size": 10, "background": True,
+    })
+    assert response.status_code == 202
+    queued = response.json()
+    assert queued["status"] in ("queued", "running") and queued["rows_total"] == 50
+
+    job = wait_for_job(client, queued["job_id"])
+    assert job["status"] == "completed", job
+    assert job["rows_processed"] == 50 and job["result"]["rows"] == 50
+    assert job["job_id"] in [listed["job_id"] for listed in client.get("/api/jobs").json()]
+    assert len(client.get("/api/kpis", params={"table": "kpis_test"}).json()) == 50
+
+    assert client.delete(f"/api/jobs/{job['job_id']}").status_code == 409
+    assert client.get("/api/jobs/nope").status_code == 404
+
+
+def test_cancelled_import_job_rolls_back(client):
+    # Hold the writer thread so the job is mid-flight when it is cancelled
+    release = threading.Event()
+    blocker = client.portal.start_task_soon(main.db_executor.write, lambda conn: release.wait(10))
+
+    response = client.post("/api/import_kpis", json={
+        "data": SAMPLE_ROWS * 10, "table_name": "kpis_test", "chunk_size": 5, "background": True,
+    })
+    job_id = response.json()["job_id"]
+    assert client.delete(f"/api/jobs/{job_id}").status_code == 200
+    release.set()
+    blocker.result()
+
+    job = wait_for_job(client, job_id)
+    assert job["status"] == "cancelled"
+    # The first chunk was written before the cancellation was noticed, then rolled back
+    assert job["rows_processed"] == 5
+    assert client.get("/api/kpis", params={"table": "kpis_test"}).status_code == 404
+
+
+def test_index_advisor_and_management(client):
+    rows = [dict(row, User_ID=str(i)) for i in range(200) for row in SAMPLE_ROWS]
+    client.post("/api/import_kpis", json={"data": rows, "table_name": "kpis_test"})
+    main.index_advisor.threshold = 2
+
+    for _ in range(2):
+        params = {"table": "kpis_test", "filter": ["Application_Type=Gaming", "Latency>20"]}
+        assert client.get("/api/kpis", params=params).status_code == 200
+    client.get("/api/kpis/aggregate", params={"table": "kpis_test", "agg": "count", "group_by": "Application_Type"})
+
+    listing = client.get("/api/tables/kpis_test/indexes").json()
+    assert listing["indexes"] == []
+    assert listing["suggestions"] == [{
+        "columns": ["Application_Type", "Latency"], "uses": 2, "name": "idx_kpis_test_Application_Type_Latency",
+    }]
+    assert listing["usage"] == {"Application_Type": 3, "Latency": 2}
+
+    # Rejected sort columns are never counted
+    for _ in range(3):
+        assert client.get("/api/kpis", params={"table": "kpis_test", "limit": 5, "order_by": "bogus"}).status_code == 400
+    assert client.get("/api/tables/kpis_test/indexes").json()["usage"] == {"Application_Type": 3, "Latency": 2}
+
+    created = client.post("/api/tables/kpis_test/indexes", json={"columns": ["Application_Type", "Latency"]})
+    assert created.status_code == 200, created.text
+    result = created.json()
+    assert result["seconds"] >= 0
+    assert any("idx_kpis_test_Application_Type_Latency" in step for step in result["probe"]["plan"])
+
+    listing = client.get("/api/tables/kpis_test/indexes").json()
+    assert listing["indexes"] == [{"name": result["name"], "columns": ["Application_Type", "Latency"]}]
+    assert listing["suggestions"] == []
+    # The new leading column can now drive keyset pagination
+    assert client.get("/api/kpis", params={"table": "kpis_test", "limit": 5, "order_by": "Application_Type"}).status_code == 200
+
+    assert client.post("/api/tables/kpis_test/indexes", json={"columns": ["Application_Type", "Latency"]}).status_code == 409
+    assert client.post("/api/tables/kpis_test/indexes", json={"columns": ["nope"]}).status_code == 400
+    duplicate = client.post("/api/tables/kpis_test/indexes", json={"columns": ["Application_Type"], "unique": True})
+    assert duplicate.status_code == 409 and "Application_Type" in duplicate.json()["detail"]
+    dropped = client.delete(f"/api/tables/kpis_test/indexes/{result['name']}")
+    assert dropped.status_code == 200
+    assert not any(result["name"] in step for step in dropped.json()["probe"]["plan"])
+    assert client.delete(f"/api/tables/kpis_test/indexes/{result['name']}").status_code == 404
+
+
+def test_index_advisor_auto_creates_indexes(client):
+    client.post("/api/import_kpis", json={"data": SAMPLE_ROWS, "table_name": "kpis_test"})
+    main.index_advisor.threshold = 3
+    main.index_advisor.auto_create = True
+
+    for _ in range(3):
+        client.get("/api/kpis", params={"table": "kpis_test", "filter": "User_ID=1001"})
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        indexes = client.get("/api/tables/kpis_test/indexes").json()["indexes"]
+        if indexes and not main.index_tasks:
+            break
+        time.sleep(0.01)
+    assert indexes == [{"name": "idx_kpis_test_User_ID", "columns": ["User_ID"]}]
+    # Finished builds drop out of the running set
+    assert not main.index_tasks
+
+
+def test_metrics_endpoint(client):
+    client.post("/api/import_kpis", json={"data": SAMPLE_ROWS, "table_name": "kpis_test"})
+    client.get("/api/kpis", params={"table": "kpis_test"})
+    client.get("/api/kpis", params={"table": "kpis_test", "format": "csv"})
+    client.get("/api/jobs/missing")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert '# TYPE kpi_http_request_duration_seconds histogram' in text
+    assert 'kpi_http_request_duration_seconds_count{method="GET",route="/api/kpis"}' in text
+    assert 'kpi_http_requests_total{method="GET",route="/api/jobs/{job_id}",status="404"}' in text
+    assert 'kpi_http_request_duration_seconds_bucket{method="GET",route="/api/kpis",le="+Inf"}' in text
+    assert 'kpi_db_operation_seconds_count{kind="read",operation="fetch_kpis"}' in text
+    assert 'kpi_db_operation_seconds_count{kind="write",operation="insert_records"}' in text
+    assert 'kpi_serialization_seconds_count{format="json"}' in text
+    assert 'kpi_serialization_seconds_count{format="csv"}' in text
+    assert 'kpi_rows_returned_count{query="stream"}' in text
+    assert 'kpi_db_pool_connections{state="in_use"}' in text
+
+    def value(line_prefix):
+        return float(next(line for line in text.splitlines() if line.startswith(line_prefix)).split()[-1])
+
+    assert value("kpi_import_rows_total") >= len(SAMPLE_ROWS)
+    assert value('kpi_http_response_size_bytes_sum{route="/api/kpis"}') > 0
+
+
+def test_benchmark_harness(db_path, tmp_path, monkeypatch):
+    import benchmark
+
+    monkeypatch.setattr(main, "DB_PATH", str(db_path))
+    report_path = tmp_path / "report.json"
+    assert benchmark.main_cli([
+        "--db", str(db_path), "--rows", "500", "--requests", "40", "--concurrency", "4",
+        "--import-rows", "10", "--save", str(report_path), "--verbose",
+    ]) == 0
+    report = json.loads(report_path.read_text())
+    assert report["overall"]["requests"] == 40 and report["overall"]["errors"] == 0
+    assert set(report["workloads"]) == {"read_kpis", "list_tables", "import_kpis"}
+    assert report["workloads"]["read_kpis"]["p50_ms"] <= report["workloads"]["read_kpis"]["p99_ms"]
+
+    slower = json.loads(report_path.read_text())
+    slower["workloads"]["read_kpis"]["p95_ms"] /= 2
+    regressions = benchmark.compare(report, slower)
+    assert [(name, metric) for name, metric, *_ in regressions] == [("read_kpis", "p95_ms")]
+    assert benchmark.compare(report, report) == []
+
+
+def test_join_endpoint(client, db_path):
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE users (User_ID INTEGER, Name TEXT);
+        INSERT INTO users VALUES (1, 'a'), (2, 'b'), (2, 'b2'), (3, 'c'), (NULL, 'nobody');
+        CREATE TABLE usage (id INTEGER PRIMARY KEY, uid INTEGER, Name TEXT, Latency REAL);
+        INSERT INTO usage (uid, Name, Latency) VALUES (2, 'x', 1.5), (2, 'y', 2.5), (4, 'z', 3.5), (1, 'w', 4.5), (NULL, 'n', 5.5);
+    """)
+    conn.commit()
+
+    def native(join_type):
+        # SQLite 3.39+ joins natively; the endpoint must agree with it
+        rows = conn.execute(f"""
+            SELECT COALESCE(u.User_ID, g.uid), u.Name, g.id, g.Name, g.Latency
+            FROM users AS u {join_type.upper()} JOIN usage AS g ON u.User_ID = g.uid
+        """).fetchall()
+        return sorted(rows, key=repr)
+
+    config = {"leftTable": "users", "rightTable": "usage", "leftColumn": "User_ID", "rightColumn": "uid"}
+    for join_type in ("inner", "left", "right", "full"):
+        pages, cursor = [], None
+        while True:
+            body = dict(config, type=join_type, limit=2, cursor=cursor)
+            response = client.post("/api/join", json=body)
+            assert response.status_code == 200, response.text
+            page = response.json()
+            pages.extend(page["rows"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        assert list(pages[0]) == ["User_ID", "Name", "id", "usage_Name", "Latency"]
+        got = sorted((tuple(row.values()) for row in pages), key=repr)
+        if sqlite3.sqlite_version_info >= (3, 39, 0):
+            assert got == native(join_type), join_type
+        assert len(got) == {"inner": 5, "left": 7, "right": 7, "full": 9}[join_type]
+
+    # A read-only join never runs DDL; it reports the probe columns worth indexing
+    assert client.get("/api/tables/usage/indexes").json()["indexes"] == []
+    assert page["suggested_indexes"] == [{"table": "usage", "columns": ["uid"]}, {"table": "users", "columns": ["User_ID"]}]
+
+    columnar = client.post("/api/join", json=dict(config, type="inner", shape="columnar")).json()
+    assert columnar["headers"] == ["User_ID", "Name", "id", "usage_Name", "Latency"]
+    assert len(columnar["columns"][0]) == 5
+
+    csv_text = client.post("/api/join", json=dict(config, type="full", format="csv")).text
+    assert len(csv_text.strip().splitlines()) == 1 + 9
+
+    created = client.post("/api/join", json=dict(config, type="full", into="users_usage"))
+    assert created.status_code == 200 and created.json()["rows"] == 9
+    assert len(client.get("/api/kpis", params={"table": "users_usage"}).json()) == 9
+    assert client.post("/api/join", json=dict(config, type="full", into="users_usage")).status_code == 409
+
+    assert client.post("/api/join", json=dict(config, rightColumn="nope")).status_code == 400
+    assert client.post("/api/join", json=dict(config, type="cross")).status_code == 422
+    assert client.post("/api/join", json=dict(config, rightTable="missing")).status_code == 404
+    conn.close()
+
+
+def test_expression_endpoint(client, db_path):
+    client.post("/api/import_kpis", json={"data": SAMPLE_ROWS, "table_name": "kpis_test"})
+    base = {"name": "total", "sourceTable": "kpis_test", "sourceColumn": "User_ID",
+            "targetTable": "kpis_test", "targetColumn": "Latency"}
+
+    added = client.post("/api/expression", json=dict(base, operation="add")).json()
+    assert [row["total"] for row in added["rows"]] == [1031, 1027, 1023]
+    assert list(added["rows"][0])[-1] == "total" and added["next_cursor"] is None
+
+    values, cursor = [], None
+    while True:
+        page = client.post("/api/expression", json=dict(base, operation="divide", limit=2, cursor=cursor)).json()
+        values.extend(row["total"] for row in page["rows"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert values == pytest.approx([1001 / 30, 1002 / 25, 1003 / 20])
+
+    concat = client.post("/api/expression", json=dict(base, operation="concat", shape="columnar")).json()
+    assert concat["columns"][-1] == ["100130", "100225", "100320"]
+
+    custom = dict(base, operation="custom", expression="np.sqrt(y) * 2 if [kpis_test].[User_ID] > 1001 else -1")
+    result = client.post("/api/expression", json=custom).json()
+    assert [row["total"] for row in result["rows"]] == pytest.approx([-1, 10, 20 ** 0.5 * 2])
+
+    # Rows of different tables pair up by position; missing partners give NULL
+    conn = sqlite3.connect(db_path)
+    conn.executescript("CREATE TABLE factors (f REAL); INSERT INTO factors VALUES (2), (0);")
+    conn.close()
+    crossed = client.post("/api/expression", json=dict(
+        base, operation="multiply", targetTable="factors", targetColumn="f")).json()
+    assert [row["total"] for row in crossed["rows"]] == [2002, 0, None]
+
+    for cursor in ("not-a-cursor", "eyJzIjoxfQ"):  # garbage, and valid base64 JSON missing "t"
+        assert client.post("/api/expression", json=dict(base, operation="add", cursor=cursor)).status_code == 400
+        assert client.post("/api/join", json={"leftTable": "kpis_test", "rightTable": "factors", "leftColumn": "id",
+                                              "rightColumn": "f", "cursor": cursor}).status_code == 400
+
+    # The last two parse but fail to evaluate: a result of the wrong shape, a missing argument
+    for bad in ("__import__('os')", "x.__class__", "open('x')", "x +", "[Missing] * 2", "",
+                "np.where(x)", "np.minimum(x)"):
+        response = client.post("/api/expression", json=dict(custom, expression=bad))
+        assert response.status_code == 400, bad
+
+    persisted = client.post("/api/expression", json=dict(custom, persist=True))
+    assert persisted.status_code == 200, persisted.text
+    assert persisted.json()["rows"] == 3 and persisted.json()["engine"] == "numpy"
+    rows = client.get("/api/kpis", params={"table": "kpis_test"}).json()
+    assert [row["total"] for row in rows] == pytest.approx([-1, 10, 20 ** 0.5 * 2])
+    assert client.post("/api/expression", json=dict(custom, persist=True)).status_code == 409
+    assert client.post("/api/expression", json=dict(custom, name="TOTAL", persist=True)).status_code == 409
+
+    sql = client.post("/api/expression", json=dict(base, name="sum2", operation="add", persist=True)).json()
+    assert sql["engine"] == "sql" and sql["rows"] == 3
+
+
+def test_summaries(client):
+    def rows(hour, values):
+        return [
+            {"Timestamp": f"2024-09-25 {hour:02d}:{minute:02d}:00", "Application_Type": app_type,
+             "Latency": str(latency), "Allocated_Bandwidth": str(bandwidth)}
+            for minute, (app_type, latency, bandwidth) in enumerate(values)
+        ]
+
+    client.post("/api/import_kpis", json={"data": rows(10, [("Gaming", 10, 1), ("Gaming", 20, 2), ("Video", 5, 4)]),
+                                          "table_name": "kpis_test"})
+    declared = client.post("/api/summaries", json={
+        "name": "hourly", "table": "kpis_test", "group_by": ["Application_Type"], "bucket": "Timestamp:hour",
+        "aggregates": ["mean:Latency", "sum:Allocated_Bandwidth", "max:Latency", "count"],
+    })
+    assert declared.status_code == 200, declared.text
+    assert declared.json()["last_rowid"] == 3
+    assert client.post("/api/summaries", json=dict(declared.json(), aggregates=["sum:Latency"])).status_code == 409
+    bad = {"name": "bad", "table": "kpis_test", "aggregates": ["median:Latency"]}
+    assert client.post("/api/summaries", json=bad).status_code == 400
+
+    # Appending rows folds them into the summary without rebuilding it
+    client.post("/api/import_kpis", json={"data": rows(10, [("Gaming", 30, 3)]) + rows(11, [("Video", 15, 6)]),
+                                          "table_name": "kpis_test"})
+    assert client.get("/api/summaries").json()["summaries"][0]["last_rowid"] == 5
+
+    def aggregate(**params):
+        params = dict(params, table="kpis_test")
+        response = client.get("/api/kpis/aggregate", params=params)
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    query = {"group_by": "Application_Type", "bucket": "Timestamp:hour",
+             "agg": ["mean:Latency", "sum:Allocated_Bandwidth", "max:Latency", "count"]}
+    summarized = aggregate(**query)
+    assert summarized["summary"] == "hourly"
+    assert summarized["group_by"] == ["Application_Type", "Timestamp_hour"]
+    assert summarized["rows"][0] == {"Application_Type": "Gaming", "Timestamp_hour": "2024-09-25 10:00:00",
+                                     "mean_Latency": 20.0, "sum_Allocated_Bandwidth": 6, "max_Latency": 30, "count": 3}
+    # The live query over the base table agrees, group for group
+    live = aggregate(**query, filter="Latency>=0")
+    assert "summary" not in live and live["rows"] == summarized["rows"]
+
+    rolled = aggregate(agg=["sum:Allocated_Bandwidth", "count"])
+    assert rolled == {"group_by": [], "rows": [{"sum_Allocated_Bandwidth": 16, "count": 5}], "summary": "hourly"}
+    assert "summary" not in aggregate(group_by="Application_Type", agg="p90:Latency")
+
+    assert client.delete("/api/summaries/hourly").status_code == 200
+    assert client.delete("/api/summaries/hourly").status_code == 404
+    assert "summary" not in aggregate(**query)
+    assert "_kpi_summary_hourly" not in client.get("/api/tables").json()
+
+
+def test_upsert_import(client):
+    body = {"data": SAMPLE_ROWS, "table_name": "kpis_test", "keys": ["Timestamp", "User_ID"]}
+    first = client.post("/api/import_kpis", json=body).json()
+    assert (first["inserted"], first["updated"]) == (3, 0)
+    client.post("/api/summaries", json={"name": "totals", "table": "kpis_test", "aggregates": ["sum:Latency"]})
+
+    # The same file again changes nothing; a corrected row updates in place
+    again = client.post("/api/import_kpis", json=body).json()
+    assert (again["inserted"], again["updated"]) == (0, 3)
+    corrected = [dict(SAMPLE_ROWS[0], Latency="99"), dict(SAMPLE_ROWS[0], User_ID="1004")]
+    stats = client.post("/api/import_kpis", json=dict(body, data=corrected)).json()
+    assert (stats["inserted"], stats["updated"]) == (1, 1)
+
+    rows = client.get("/api/kpis", params={"table": "kpis_test"}).json()
+    assert [(row["User_ID"], row["Latency"]) for row in rows] == [(1001, 99), (1002, 25), (1003, 20), (1004, 30)]
+    assert [row["id"] for row in rows[:3]] == [1, 2, 3]
+    indexes = client.get("/api/tables/kpis_test/indexes").json()["indexes"]
+    assert {"name": "uq_kpis_test_Timestamp_User_ID", "columns": ["Timestamp", "User_ID"]} in indexes
+
+    # The summary was rebuilt rather than double counting updated rows
+    total = client.get("/api/kpis/aggregate", params={"table": "kpis_test", "agg": "sum:Latency"}).json()
+    assert total["summary"] == "totals" and total["rows"] == [{"sum_Latency": 99 + 25 + 20 + 30}]
+
+    csv_body = "Timestamp,User_ID,Latency\n9/25/2024 10:05,1002,26\n"
+    response = client.post("/api/import_csv", params={"table": "kpis_test", "keys": "Timestamp,User_ID"}, content=csv_body)
+    assert response.status_code == 200, response.text
+    assert (response.json()["inserted"], response.json()["updated"]) == (0, 1)
+
+    assert client.post("/api/import_kpis", json=dict(body, keys=["nope"])).status_code == 400
+    client.post("/api/import_kpis", json={"data": SAMPLE_ROWS, "table_name": "dupes"})
+    client.post("/api/import_kpis", json={"data": SAMPLE_ROWS, "table_name": "dupes"})
+    assert client.post("/api/import_kpis", json=dict(body, table_name="dupes")).status_code == 409
+
+
+def test_downsample_endpoint(client):
+    import math
+    from datetime import datetime, timedelta
+
+    start = datetime(2024, 9, 25)
+    data = [
+        {"Timestamp": (start + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S"),
+         "Latency": str(500 if i == 777 else -400 if i == 1500 else round(50 + 20 * math.sin(i / 50), 2))}
+        for i in range(2000)
+    ]
+    client.post("/api/import_kpis", json={"data": data, "table_name": "kpis_test"})
+
+    def series(**params):
+        response = client.get("/api/kpis/downsample", params=dict(params, table="kpis_test", x="Timestamp", y="Latency"))
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    lttb = series(points=100)
+    xs, ys = lttb["columns"]
+    assert lttb["headers"] == ["Timestamp", "Latency"] and lttb["rows_scanned"] == 2000
+    assert len(xs) <= 100 and xs == sorted(xs)
+    assert (xs[0], xs[-1]) == (data[0]["Timestamp"], data[-1]["Timestamp"])
+    assert 500 in ys and -400 in ys
+
+    minmax = series(points=100, method="minmax")
+    assert len(minmax["columns"][0]) <= 100 and {500, -400} <= set(minmax["columns"][1])
+
+    everything = series(points=5000)
+    assert len(everything["columns"][0]) == 2000
+
+    ranged = series(points=10, start="2024-09-25 10:00:00", end="2024-09-25 10:59:00")
+    assert ranged["rows_scanned"] == 60
+    assert ranged["columns"][0][0] == "2024-09-25 10:00:00" and ranged["columns"][0][-1] == "2024-09-25 10:59:00"
+
+    by_rowid = client.get("/api/kpis/downsample", params={"table": "kpis_test", "x": "rowid", "y": "Latency", "points": 50})
+    assert by_rowid.status_code == 200 and len(by_rowid.json()["columns"][0]) <= 50
+
+    for bad in ({"y": "nope"}, {"points": 2}, {"method": "average"}, {"start": "not a date"}):
+        params = dict({"table": "kpis_test", "x": "Timestamp", "y": "Latency"}, **bad)
+        assert client.get("/api/kpis/downsample", params=params).status_code in (400, 422), bad
+
+    # Text that is not a number is skipped, not plotted as 0; text x cannot be ordered numerically
+    mixed = [{"Step": str(i), "Label": f"step {i}", "Value": value} for i, value in enumerate(["4", "n/a", "9", "", "5"])]
+    client.post("/api/import_kpis", json={"data": mixed, "table_name": "mixed"})
+    response = client.get("/api/kpis/downsample", params={"table": "mixed", "x": "Step", "y": "Value", "points": 10})
+    assert response.status_code == 200, response.text
+    assert response.json()["columns"] == [[0, 2, 4], [4.0, 9.0, 5.0]]
+    response = client.get("/api/kpis/downsample", params={"table": "mixed", "x": "Label", "y": "Step"})
+    assert response.status_code == 400
+
+
+def test_live_feed(db_path, monkeypatch):
+    monkeypatch.setattr(main, "DB_PATH", db_path)
+    monkeypatch.setattr(main, "STREAM_BATCH_SIZE", 2)
+
+    async def next_event(stream):
+        chunk = await asyncio.wait_for(stream.__anext__(), 5)
+        lines = dict(line.split(": ", 1) for line in chunk.decode().strip().splitlines())
+        return lines.get("event"), json.loads(lines["data"])
+
+    async def scenario():
+        async with main.lifespan(main.app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+                await client.post("/api/import_kpis", json={"data": SAMPLE_ROWS, "table_name": "kpis_test"})
+                fresh = main.live_feed.subscribe("kpis_test")
+                replay = main.live_feed.subscribe("kpis_test", after=1)
+                assert await next_event(fresh) == ("ready", {"table": "kpis_test", "last_rowid": 3})
+                await next_event(replay)
+                # A subscriber behind the shared buffer pages through the table itself
+                _, page = await next_event(replay)
+                assert [row["User_ID"] for row in page["rows"]] == [1002, 1003] and page["last_rowid"] == 3
+
+                more = [dict(row, User_ID=str(2000 + i)) for i, row in enumerate(SAMPLE_ROWS)]
+                await client.post("/api/import_kpis", json={"data": more, "table_name": "kpis_test"})
+                received = {}
+                for stream in (fresh, replay):
+                    events = [await next_event(stream), await next_event(stream)]
+                    received[stream] = [row["User_ID"] for _, data in events for row in data["rows"]]
+                assert received[fresh] == received[replay] == [2000, 2001, 2002]
+                assert main.live_feed.stats()["kpis_test"]["subscribers"] == 2
+
+                await fresh.aclose()
+                await replay.aclose()
+                assert main.live_feed.stats() == {}
+
+                response = await client.get("/api/kpis/live", params={"table": "missing"})
+                assert response.status_code == 404
+
+    asyncio.run(scenario())
+
+
+def test_table_stats(client, db_path):
+    data = [
+        {"User_ID": str(1000 + i % 50), "Latency": str(i) if i % 10 else None, "Application_Type": "Gaming"}
+        for i in range(200)
+    ]
+    client.post("/api/import_kpis", json={"data": data, "table_name": "kpis_test"})
+    stats_of = lambda response: next(table for table in response.json() if table["name"] == "kpis_test")
+
+    response = client.get("/api/tables", params={"stats": 1})
+    assert response.status_code == 200
+    table = stats_of(response)
+    assert (table["rows"], table["columns"]) == (200, 4)
+    assert table["bytes"] > 0 and table["version"] == 1
+    columns = table["column_stats"]
+    assert columns["Latency"]["nulls"] == 20 and columns["User_ID"]["nulls"] == 0
+    assert columns["User_ID"]["distinct"] == 50 and columns["Application_Type"]["distinct"] == 1
+    assert abs(columns["Latency"]["distinct"] - 180) <= 5
+    assert client.get("/api/tables", params={"stats": 1}, headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+
+    # Imports scan nothing; the next listing scans only the appended rows
+    scans, scanned = main.table_stats.scans, main.table_stats.rows_scanned
+    more = [{"User_ID": "5000", "Latency": None, "Application_Type": "Video"}]
+    client.post("/api/import_kpis", json={"data": more, "table_name": "kpis_test"})
+    client.post("/api/import_kpis", json={"data": more, "table_name": "kpis_test"})
+    assert main.table_stats.scans == scans
+    table = stats_of(client.get("/api/tables", params={"stats": 1}))
+    assert (main.table_stats.scans, main.table_stats.rows_scanned) == (scans + 1, scanned + 2)
+    assert table["rows"] == 202 and table["version"] == 3
+    assert table["column_stats"]["Latency"]["nulls"] == 22
+    assert table["column_stats"]["User_ID"]["distinct"] == 51
+    stats_of(client.get("/api/tables", params={"stats": 1}))
+    assert main.table_stats.scans == scans + 1
+
+    # Rows removed from the end outside the API move MAX(rowid), which forces a rescan
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("DELETE FROM kpis_test WHERE User_ID = 5000")
+    table = stats_of(client.get("/api/tables", params={"stats": 1}))
+    assert table["rows"] == 200 and table["column_stats"]["Application_Type"]["distinct"] == 1
+    assert main.table_stats.rows_scanned == scanned + 2 + 200
+
+
+def test_result_coalescing(db_path, monkeypatch):
+    monkeypatch.setattr(main, "DB_PATH", db_path)
+    calls = []
+    fetch_kpis = main.fetch_kpis
+
+    def slow_fetch(*args):
+        calls.append(args[1])
+        time.sleep(0.2)
+        return fetch_kpis(*args)
+
+    monkeypatch.setattr(main, "fetch_kpis", slow_fetch)
+
+    async def scenario():
+        async with main.lifespan(main.app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+                await client.post("/api/import_kpis", json={"data": SAMPLE_ROWS, "table_name": "kpis_test"})
+                params = {"table": "kpis_test", "filter": "Latency>20"}
+                responses = await asyncio.gather(*(client.get("/api/kpis", params=params) for _ in range(5)))
+                assert len(calls) == 1
+                assert len({response.content for response in responses}) == 1
+                assert [row["User_ID"] for row in responses[0].json()] == [1001, 1002]
+
+                # Repeats are served from the cache until an import moves the version
+                assert (await client.get("/api/kpis", params=params)).content == responses[0].content
+                assert len(calls) == 1
+                await client.post("/api/import_kpis", json={"data": SAMPLE_ROWS[:1], "table_name": "kpis_test"})
+                assert len((await client.get("/api/kpis", params=params)).json()) == 3
+                assert len(calls) == 2
+
+                # Failures reach every waiting request but are not cached
+                missing = await asyncio.gather(*(client.get("/api/kpis", params={"table": "kpis_test", "columns": "nope"}) for _ in range(2)))
+                assert [response.status_code for response in missing] == [400, 400]
+                assert main.result_cache.stats()["inflight"] == 0
+
+    asyncio.run(scenario())